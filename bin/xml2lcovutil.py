@@ -38,6 +38,15 @@ import subprocess
 import copy
 import base64
 import hashlib
+import json
+import shutil
+import tempfile
+import concurrent.futures
+import collections
+import array
+import gzip
+import ast
+import bisect
 
 def line_hash(line: str) -> str:
     """Produce a hash of a source line for use in the LCOV file."""
@@ -45,6 +54,477 @@ def line_hash(line: str) -> str:
     return base64.b64encode(hashed).decode("ascii").rstrip("=")
 
 
+class PythonScopes:
+    """Interval index of the function and class definitions in a Python
+    source file, built from its AST - so we can find the innermost
+    definition containing some line with a binary search.
+    """
+
+    def __init__(self, tree):
+        # list of {type name first body last depth}:
+        #   first: first line of the definition (first decorator, if any)
+        #   body:  first line of the body - i.e., after the signature
+        #   last:  last line of the definition
+        self._scopes = []
+        # sorted, contiguous segments:  segment i starts at _starts[i] and
+        #  belongs to innermost scope _owners[i] (None: module level)
+        self._starts = [1]
+        self._owners = [None]
+        self._visit(tree, '', '', 0)
+
+    def _visit(self, node, prefix, sep, depth):
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef,
+                                      ast.ClassDef)):
+                # definitions inside 'if', 'try', etc. are in the same scope
+                self._visit(child, prefix, sep, depth)
+                continue
+            isClass = isinstance(child, ast.ClassDef)
+            first = min([d.lineno for d in child.decorator_list] + [child.lineno])
+            scope = {'type'  : 'class' if isClass else 'def',
+                     'name'  : prefix + sep + child.name,
+                     'first' : first,
+                     'body'  : child.body[0].lineno,
+                     'last'  : child.end_lineno,
+                     'depth' : depth}
+            parent = self._owners[-1]
+            idx = len(self._scopes)
+            self._scopes.append(scope)
+            self._starts.append(first)
+            self._owners.append(idx)
+            self._visit(child, scope['name'], '::' if isClass else '.', depth + 1)
+            # rest of the enclosing scope (if any) follows this one
+            self._starts.append(scope['last'] + 1)
+            self._owners.append(parent)
+
+    def owner(self, lineNo):
+        """Return index of innermost scope containing lineNo, or None."""
+        return self._owners[bisect.bisect_right(self._starts, lineNo) - 1]
+
+    def functions(self, lineData):
+        """Return list of {name start end hit decl} for functions whose
+        declaration is an executable line in 'lineData' (line -> hit count).
+          - 'end' is the last executable line in the function
+          - 'decl' is the list of executable lines of the decorators and
+            signature - i.e., before the body
+          - 'hit' is the count of the first executable line in the function
+            body, not counting nested definitions - or None if there is none.
+        Functions are ordered by end line, innermost first.
+        """
+        lines = sorted(lineData.keys())
+        firstLine = {}
+        for lineNo in lines:
+            idx = self.owner(lineNo)
+            if (idx is not None and idx not in firstLine and
+                lineNo >= self._scopes[idx]['body']):
+                firstLine[idx] = lineNo
+        functions = []
+        for idx, scope in enumerate(self._scopes):
+            if scope['type'] != 'def':
+                continue
+            # Coverage.py reports a multi-line statement (e.g., decorated
+            #  function) at its first line
+            i = bisect.bisect_left(lines, scope['first'])
+            if i == len(lines) or lines[i] >= scope['body']:
+                continue    # not executable - e.g., excluded
+            start = lines[i]
+            end = lines[bisect.bisect_right(lines, scope['last']) - 1]
+            hit = lineData[firstLine[idx]] if idx in firstLine else None
+            functions.append({'name'  : scope['name'],
+                              'start' : start,
+                              'end'   : end,
+                              'hit'   : hit,
+                              'decl'  : lines[i:bisect.bisect_left(lines, scope['body'])],
+                              'depth' : scope['depth']})
+        functions.sort(key=lambda f: (f['end'], -f['depth']))
+        return functions
+
+
+class SourceFile:
+    """Lines of a source file - and their checksums, computed on demand."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self._hashes = [None] * len(lines)
+        self._scopes = None
+
+    def python_scopes(self):
+        """Return PythonScopes index for this file, or None if the file
+        cannot be parsed."""
+        if self._scopes is None:
+            try:
+                self._scopes = PythonScopes(ast.parse('\n'.join(self.lines)))
+            except (SyntaxError, ValueError):
+                self._scopes = False
+        return self._scopes or None
+
+    def line_hash(self, lineNo):
+        """Return checksum of 'lineNo' (1-based).  IndexError if no such line."""
+        h = self._hashes[lineNo-1]
+        if h is None:
+            h = self._hashes[lineNo-1] = line_hash(self.lines[lineNo-1])
+        return h
+
+
+class SourceCache:
+    """Bounded LRU cache of SourceFile data, keyed by pathname and checked
+    against the file's modification time and size - so each source file
+    is read and split once, no matter how many <class> nodes or input files
+    refer to it.
+    """
+
+    def __init__(self, maxFiles=200):
+        self._maxFiles = maxFiles
+        self._files = collections.OrderedDict()  # path -> (mtime, size, SourceFile)
+
+    def get(self, filename):
+        """Return SourceFile for 'filename'.  IOError/OSError if unreadable."""
+        st = os.stat(filename)
+        entry = self._files.get(filename)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            self._files.move_to_end(filename)
+            return entry[2]
+        with open(filename, 'r') as f:
+            source = SourceFile(f.read().split('\n'))
+        self._files[filename] = (st.st_mtime_ns, st.st_size, source)
+        self._files.move_to_end(filename)
+        if len(self._files) > self._maxFiles:
+            self._files.popitem(last=False)
+        return source
+
+
+# shared by all ProcessFile instances in this process - i.e., by all the
+#  inputs translated by this run (or by this parallel worker)
+_sourceCache = SourceCache()
+
+
+class VersionScript:
+    """Run the '--version-script' callback to find the version of a
+    source file.
+    If the callback command line contains '--batch', then start the callback
+    once and use it as a co-process:  write each pathname to its standard
+    input (one per line) and read back the corresponding version (one per
+    line) - rather than forking a new callback process for each file.
+    If the callback is a Perl module (e.g., gitversion.pm, batchGitVersion.pm,
+    P4version.pm), then load it into a Perl co-process the same way that lcov
+    does, and call its 'extract_version' method for each file.
+    Results are cached by pathname, modification time and size - and, if
+    'cacheFile' is specified, saved for use in subsequent runs.
+    """
+
+    # load version module and serve 'extract_version' requests
+    _perlDriver = r'''
+use strict;
+# first argument is the calling tool - so lcovutil finds its siblings
+BEGIN { $0 = shift(@ARGV); }
+use IO::Handle;
+use File::Basename qw(dirname basename);
+use lcovutil;
+
+my ($script, @args) = @ARGV;
+my $class = basename($script);
+$class =~ s/\.pm$//;
+unshift(@INC, dirname($script));
+require "$class.pm";
+# module may print diagnostics - keep them out of our result stream
+open(my $out, '>&', \*STDOUT) or die("cannot dup stdout: $!");
+open(STDOUT, '>&', \*STDERR) or die("cannot redirect stdout: $!");
+$out->autoflush(1);
+my $cb = $class->new($script, @args);
+die("$class constructor returned 'undef'") unless defined($cb);
+while (my $filename = <STDIN>) {
+    chomp($filename);
+    print $out $cb->extract_version($filename) . "\n";
+}
+'''
+
+    def __init__(self, cmd, cacheFile=None, save=True):
+        self._cmd = cmd
+        self._exec = cmd
+        self._batch = '--batch' in cmd
+        if cmd[0][-3:] == '.pm':
+            tool = os.path.realpath(sys.argv[0])
+            # development tree:  lib is sibling of bin.  Installed:  lib/lcov
+            libdir = os.path.join(os.path.dirname(tool), '..', 'lib')
+            if not os.path.exists(os.path.join(libdir, 'lcovutil.pm')):
+                libdir = os.path.join(libdir, 'lcov')
+            self._exec = ['perl', '-I', libdir, '-e', self._perlDriver,
+                          tool] + cmd
+            self._batch = True
+        self._proc = None
+        self._cacheFile = cacheFile
+        self._save = save
+        self._cache = {}    # pathname -> [mtime_ns, size, version]
+        self._updates = {}  # entries added during this run
+        if cacheFile and os.path.exists(cacheFile):
+            try:
+                with open(cacheFile, 'r') as f:
+                    data = json.load(f)
+                # cached versions are only meaningful for the same callback
+                if data.get('cmd') == cmd:
+                    self._cache = data['versions']
+            except (IOError, OSError, ValueError, KeyError) as err:
+                print("Warning: ignoring invalid version cache '%s': %s" % (
+                    cacheFile, str(err)))
+
+    def version(self, pathname):
+        try:
+            st = os.stat(pathname)
+            key = [st.st_mtime_ns, st.st_size]
+        except OSError:
+            key = None    # don't cache missing files
+        if key:
+            cached = self._cache.get(pathname)
+            if cached and cached[:2] == key:
+                return cached[2]
+
+        if self._batch:
+            version = self._query(pathname)
+        else:
+            cmd = copy.deepcopy(self._cmd)
+            cmd.append(pathname)
+            version = subprocess.check_output(cmd).strip().decode('UTF-8')
+        if key:
+            self._cache[pathname] = self._updates[pathname] = key + [version]
+        return version
+
+    def _query(self, pathname):
+        if self._proc is None:
+            self._proc = subprocess.Popen(self._exec, stdin=subprocess.PIPE,
+                                          stdout=subprocess.PIPE,
+                                          universal_newlines=True)
+        self._proc.stdin.write(pathname + "\n")
+        self._proc.stdin.flush()
+        line = self._proc.stdout.readline()
+        if not line:
+            # callback died - restart it if we are called again
+            status = self._proc.wait()
+            self._proc = None
+            raise subprocess.CalledProcessError(status, self._cmd)
+        return line.strip()
+
+    def updates(self):
+        """Return - and forget - entries added since the last call."""
+        updates = self._updates
+        self._updates = {}
+        return updates
+
+    def merge(self, updates):
+        self._cache.update(updates)
+        self._updates.update(updates)
+
+    def close(self):
+        if self._proc is not None:
+            self._proc.stdin.close()
+            self._proc.wait()
+            self._proc = None
+        if self._cacheFile and self._save and self._updates:
+            try:
+                with open(self._cacheFile, 'w') as f:
+                    json.dump({'cmd' : self._cmd,
+                               'versions' : self._cache}, f)
+            except (IOError, OSError) as err:
+                print("Warning: unable to write version cache '%s': %s" % (
+                    self._cacheFile, str(err)))
+
+
+class MergedRecord:
+    """Coverage data for one source file, summed over all of the translated
+    records which refer to it - see '--aggregate'.
+    Hit counts are kept in arrays indexed by line number (-1: no data for
+    that line), and branch hit counts in one array per line, indexed by
+    condition.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.version = None
+        self.lines = array.array('q')
+        self.checksums = {}
+        self.branches = {}                          # line -> array of counts
+        self.functions = collections.OrderedDict()  # name -> [start end hit]
+
+    def merge(self, record, keepGoing):
+        """Merge the text lines of one SF...end_of_record 'record' (as
+        generated by ProcessFile) into this one.
+        """
+        for entry in record:
+            for l in entry.splitlines():
+                key, _, data = l.partition(':')
+                if key == 'DA':
+                    f = data.split(',')
+                    lineNo = int(f[0])
+                    if lineNo >= len(self.lines):
+                        self.lines.extend([-1] * (lineNo + 1 - len(self.lines)))
+                    if self.lines[lineNo] < 0:
+                        self.lines[lineNo] = 0
+                    self.lines[lineNo] += int(f[1])
+                    if len(f) > 2:
+                        self.checksums.setdefault(lineNo, f[2])
+                elif key == 'BRDA':
+                    f = data.split(',')
+                    lineNo, cond, hit = int(f[0]), int(f[2]), int(f[3])
+                    counts = self.branches.setdefault(lineNo, array.array('q'))
+                    if cond >= len(counts):
+                        counts.extend([0] * (cond + 1 - len(counts)))
+                    counts[cond] += hit
+                elif key == 'FNL':
+                    idx, start, end = data.split(',')
+                elif key == 'FNA':
+                    idx, hit, name = data.split(',', 2)
+                    if name in self.functions:
+                        self.functions[name][2] += int(hit)
+                    else:
+                        self.functions[name] = [int(start), int(end), int(hit)]
+                elif key == 'VER':
+                    if self.version is None:
+                        self.version = data
+                    elif self.version != data:
+                        print("Error: %s: version mismatch '%s' vs '%s'" % (
+                            self.name, self.version, data))
+                        if not keepGoing:
+                            sys.exit(1)
+
+    def write(self, outf):
+        out = ["SF:%s\n" % self.name]
+        if self.version is not None:
+            out.append("VER:%s\n" % self.version)
+        brHit = 0
+        brFound = 0
+        for lineNo in sorted(self.branches.keys()):
+            counts = self.branches[lineNo]
+            out.extend(["BRDA:%d,0,%d,%d\n" % (lineNo, cond, hit)
+                        for cond, hit in enumerate(counts)])
+            brFound += len(counts)
+            brHit += sum(1 for hit in counts if hit)
+        idx = 0
+        fnHit = 0
+        for name, (start, end, hit) in self.functions.items():
+            out.append("FNL:%d,%d,%d\nFNA:%d,%d,%s\n" % (idx, start, end,
+                                                          idx, hit, name))
+            idx += 1
+            if hit:
+                fnHit += 1
+        lnHit = 0
+        lnFound = 0
+        for lineNo, hit in enumerate(self.lines):
+            if hit < 0:
+                continue
+            checksum = ',' + self.checksums[lineNo] if lineNo in self.checksums else ''
+            out.append("DA:%d,%d%s\n" % (lineNo, hit, checksum))
+            lnFound += 1
+            if hit:
+                lnHit += 1
+        for found, hit, tags in ((lnFound, lnHit, ('LF', 'LH')),
+                                 (brFound, brHit, ('BRF', 'BRH')),
+                                 (idx, fnHit, ('FNF', 'FNH'))):
+            if found:
+                out.append("%s:%d\n%s:%d\n" % (tags[0], found, tags[1], hit))
+        out.append("end_of_record\n")
+        outf.write(''.join(out))
+
+
+class FragmentCache:
+    """Translated data from previous runs - see '--cache-dir'.
+    Each input is identified by a hash of its content, of the current
+    directory, and of the options which affect the translation.  The
+    manifest records the state (mtime, size) of the source files referred
+    to by each cached fragment:  the fragment is reused only if none of
+    them have changed, as function data, checksums and versions depend on
+    the source.
+    Entries which are not used by the current run are removed when the
+    manifest is saved.
+    """
+
+    # options which do not affect the translated data for each input
+    _ignoredOptions = ('input', 'inputs', 'output', 'testName', 'parallel',
+                       'verbose', 'versionCache', 'aggregate', 'cacheDir')
+
+    def __init__(self, cacheDir, scriptArgs):
+        self._dir = cacheDir
+        self._manifest = os.path.join(cacheDir, 'manifest.json')
+        self._entries = {}
+        self._used = set()
+        os.makedirs(cacheDir, exist_ok=True)
+        try:
+            with open(self._manifest, 'r') as f:
+                self._entries = json.load(f)['entries']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        options = {k: v for k, v in vars(scriptArgs).items()
+                   if k not in self._ignoredOptions}
+        self._options = json.dumps([options, os.getcwd()], sort_keys=True,
+                                   default=str).encode('utf-8')
+
+    @staticmethod
+    def _state(path):
+        try:
+            st = os.stat(path)
+            return [st.st_mtime_ns, st.st_size]
+        except OSError:
+            return None
+
+    def _fragment(self, key):
+        return os.path.join(self._dir, key + '.info')
+
+    def key(self, inputFile):
+        h = hashlib.sha256(self._options)
+        with open(inputFile, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def find(self, key):
+        """Return name of cached fragment for 'key', or None."""
+        entry = self._entries.get(key)
+        fragment = self._fragment(key)
+        if (entry is None or not os.path.exists(fragment) or
+            any(self._state(path) != state
+                for path, state in entry['sources'].items())):
+            return None
+        self._used.add(key)
+        return fragment
+
+    def insert(self, key, inputFile, fragment):
+        """Move newly translated 'fragment' into the cache and return its
+        new name."""
+        sources = {}
+        with open(fragment, 'r') as f:
+            for line in f:
+                if line.startswith('SF:'):
+                    path = line[3:-1]
+                    sources[path] = self._state(path)
+        cached = self._fragment(key)
+        shutil.move(fragment, cached)
+        self._entries[key] = {'input'   : inputFile,
+                              'sources' : sources}
+        self._used.add(key)
+        return cached
+
+    def save(self):
+        for key in list(self._entries.keys()):
+            if key not in self._used:
+                del self._entries[key]
+                try:
+                    os.unlink(self._fragment(key))
+                except OSError:
+                    pass
+        tmp = self._manifest + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'entries' : self._entries}, f)
+        os.replace(tmp, self._manifest)
+
+
+def open_output(filename):
+    """Open LCOV output file for writing - gzip-compressed if the name ends
+    with '.gz' (as lcov does).  Records are written whole, so use a large
+    buffer to avoid many small system calls.
+    """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'wt', compresslevel=6)
+    return open(filename, 'w', buffering=1024 * 1024)
+
+
 class ProcessFile:
     """Expected/support scriptArgs:
     args.input     : name of XML file
@@ -54,6 +534,8 @@ class ProcessFile:
                      comma-separated list of glob patterns
     args.verbose   : verbosity
     args.version   : version script callback
+    args.versionCache : file used to cache version script results between
+                     runs (optional)
     args.checksum  : compute base64 checksum for each line - see 'man lcov'
     args.isPython  : input XML file came from Coverage.py - so apply certain
                      Python-specific derivations.
@@ -62,7 +544,19 @@ class ProcessFile:
                      see 'py2lcov --help' and the Coverage.py documentation
     args.tabWidth  : tab width to assume when deriving information from indentation -
                      used during Python function derivation.
+    args.functionParser :
+                     'ast' (default) or 'indent' - how to find Python function
+                     extents:  from the parsed source, or from indentation.
+                     'ast' falls back to 'indent' if the source cannot be parsed.
     args.keepGoing : do not stop when error or inconsistency is detected
+    args.aggregate : write one merged record per source file (optional) -
+                     rather than one record per file per input
+    args.cacheDir  : directory used to save translated data between runs -
+                     unchanged inputs are not translated again (optional)
+    args.parallel  : number of inputs to translate concurrently (optional) -
+                     zero means 'use all cores'
+    args.cover_cmd : Coverage.py executable used to translate Python
+                     coverage data files (py2lcov only)
 
     """
 
@@ -95,145 +589,387 @@ This is a problem in at least 2 ways:
     Thus, the combined result in the above example would claim 4 of 8
     branches hit.
     This definition turns out to be a lower bound.
+    The '--aggregate' option merges the data for each file in the same way.
 """
 
-    def __init__(self, scriptArgs):
+    def __init__(self, scriptArgs, fragment=None, versionScript=None):
+        """If 'fragment' is set, write the translated data for a subset of
+        the inputs to that file (no 'TN:' header) so the caller can
+        concatenate it into the real output later.
+        If 'versionScript' is set, use that (already running) version
+        callback rather than starting a new one.
+        """
         self._args = scriptArgs
+        self._fragment = fragment
 
         self._excludePatterns = scriptArgs.excludePatterns.split(',') if scriptArgs.excludePatterns else None
-        self._versionScript = scriptArgs.version.split(',') if scriptArgs.version else None
-        self._versionModule = None
-        if self._versionScript and self._versionScript[0][-3:] == ".pm":
-            # hard to handle Perl module in python - so we hack it
-            self._versionModule = self._versionScript
-            self._versionScript = None
-
-        self._outf = open(scriptArgs.output, "w")
+        self._versionScript = versionScript
+        if scriptArgs.version and not versionScript:
+            # parallel workers read but don't write the cache - parent saves
+            #  their results when it is done
+            self._versionScript = VersionScript(
+                scriptArgs.version.split(','),
+                getattr(scriptArgs, 'versionCache', None),
+                save=not fragment)
+
+        self._outf = open_output(fragment if fragment else scriptArgs.output)
+        self._record = None
+        # parallel workers write their records as usual - parent merges them
+        self._aggregate = collections.OrderedDict() if (
+            getattr(scriptArgs, 'aggregate', False) and not fragment) else None
         self._isPython = getattr(scriptArgs, 'isPython', False)
+        self._errors = 0    # number of errors ignored due to '--keep-going'
 
-        self._outf.write("TN:%s\n" % scriptArgs.testName)
+        if not fragment:
+            self._outf.write("TN:%s\n" % scriptArgs.testName)
+
+    def _error(self, message, status=1):
+        """Report an error - and stop unless '--keep-going' is set."""
+        print(message)
+        self._errors += 1
+        if not self._args.keepGoing:
+            sys.exit(status)
 
     def close(self):
 
+        if self._aggregate is not None:
+            for record in self._aggregate.values():
+                record.write(self._outf)
         self._outf.close()
+        # a fragment writer shares its caller's callback - parallel workers
+        #  close theirs in '_process_fragment'
+        if self._versionScript and not self._fragment:
+            self._versionScript.close()
+
+    def process_inputs(self, inputs):
+        """Translate each of the 'inputs' - in parallel, if requested - and
+        reusing cached results for unchanged inputs, if '--cache-dir' is set.
+        The result is identical to serial processing:  each input is
+        translated to a fragment, and the fragments are appended in command
+        line order.
+        """
+        parallel = getattr(self._args, 'parallel', 1)
+        if parallel == 0:
+            parallel = os.cpu_count() or 1
+        cache = None
+        if getattr(self._args, 'cacheDir', None):
+            cache = FragmentCache(self._args.cacheDir, self._args)
+        elif parallel < 2 or len(inputs) < 2:
+            for f in inputs:
+                self.process_input(f)
+            return
 
-        if self._args.version and self._versionScript is None:
-            lcov = os.path.join(os.path.split(sys.argv[0])[0], 'lcov')
-            cmd = [
-                lcov,
-                "-a", self._args.output,
-                "-o", self._args.output,
-                "--version-script", self._args.version,
-                *(["--checksum"] if self._args.checksum else []),
-                "--rc", "compute_file_version=1",
-                "--branch-coverage",
-                "--ignore", "inconsistent",
-            ]
-            if not getattr(self._args, 'deriveFunctions', False):
-                cmd.append("--no-function-coverage")
+        with tempfile.TemporaryDirectory(prefix='xml2lcov') as tmpdir:
+            jobs = []  # [input, fragment, cache key, cached]
+            for idx, f in enumerate(inputs):
+                key = cache.key(f) if cache else None
+                cached = cache.find(key) if cache else None
+                if cached:
+                    if self._args.verbose:
+                        print("reusing cached translation of %s" % f)
+                    jobs.append([f, cached, key, True])
+                else:
+                    jobs.append([f, os.path.join(tmpdir, '%d.info' % idx),
+                                 key, False])
+            todo = [j for j in jobs if not j[3]]
+            executor = None
+            futures = {}
+            if parallel > 1 and len(todo) > 1:
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=min(parallel, len(todo)))
             try:
-                x = subprocess.run(cmd, shell=False, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            except subprocess.CalledProcessError as err:
-                print("Error during lcov version append operation: %s" % (
-                    str(err)))
-                if not self._args.keepGoing:
-                    sys.exit(1);
+                if executor:
+                    for j in todo:
+                        futures[j[1]] = executor.submit(
+                            _process_fragment, self._args, j[0], j[1])
+                for f, fragment, key, cached in jobs:
+                    if not cached:
+                        if executor:
+                            # re-raises worker exception (including sys.exit)
+                            versions, errors = futures[fragment].result()
+                            if self._versionScript:
+                                self._versionScript.merge(versions)
+                        else:
+                            p = ProcessFile(self._args, fragment,
+                                            self._versionScript)
+                            try:
+                                p.process_input(f)
+                            finally:
+                                p.close()
+                            errors = p._errors
+                        self._errors += errors
+                        # don't reuse a translation which reported errors:
+                        #   retry - and report them again - next time
+                        if cache and not errors:
+                            fragment = cache.insert(key, f, fragment)
+                            cached = True
+                    self._append_fragment(fragment)
+                    if not cached:
+                        os.unlink(fragment)
+            finally:
+                if executor:
+                    executor.shutdown()
+        if cache:
+            cache.save()
 
+    def _append_fragment(self, fragment):
+        with open(fragment, 'r') as f:
+            if self._aggregate is None:
+                shutil.copyfileobj(f, self._outf)
+                return
+            for line in f:
+                if self._record is None:
+                    self._record = []
+                self._record.append(line)
+                if line == "end_of_record\n":
+                    self._end_record()
 
-    def process_xml_file(self, xml_file):
+    def process_input(self, f):
+        """Translate one input file - either Cobertura-style XML or (for
+        Python) a Coverage.py data file.
+        """
+        base, ext = os.path.splitext(f)
+        if not self._isPython or ext == '.xml':
+            self.process_xml_file(f)
+            return
+
+        if (not getattr(self._args, 'useXml', False) and
+            self.process_coverage_data(f)):
+            return
 
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
+        # assume that anything not ending in .xml is a Coverage.py data file
+        if self._fragment:
+            # other workers may be writing XML next to their inputs too
+            base = self._fragment
+        xml = base + '.xml'
+        suffix = 1
+        while os.path.exists(xml):
+            xml = base + '.xml%d' % suffix
+            suffix += 1
+        env = os.environ.copy()
+        env["COVERAGE_FILE"] = f
+        cmd = [self._args.cover_cmd, "xml", "-o", xml]
+        try:
+            x = subprocess.run(cmd, shell=False, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        except subprocess.CalledProcessError as err:
+            self._error("Error:  error during XML conversion of %s: %s" % (
+                f, str(err)))
+            return
+        self.process_xml_file(xml)
+        os.unlink(xml)
+
+    def process_coverage_data(self, dataFile):
+        """Translate a Coverage.py data file in-process:  read the executed
+        lines and arcs from the SQLite DB and analyze the source with the
+        Coverage.py module - without the 'coverage xml' subprocess or the
+        intermediate XML file.
+        Unlike the XML path, this retains arc data - so we know exactly
+        which branches were taken.
+        Return False if the data cannot be read this way (e.g., Coverage.py
+        module is not available to this interpreter) - caller should then
+        use the XML path.
+        """
+        try:
+            import coverage
+            cov = coverage.Coverage(data_file=dataFile)
+            cov.load()
+            data = cov.get_data()
+            measured = data.measured_files()
+        except Exception as err:
+            if self._args.verbose:
+                print("cannot read %s directly (%s) - using '%s xml'" % (
+                    dataFile, str(err), self._args.cover_cmd))
+            return False
+
+        def value(obj, attr):
+            # some Analysis members changed from method to attribute
+            #  across Coverage.py versions
+            v = getattr(obj, attr)
+            return v() if callable(v) else v
+
+        cwd = os.path.join(os.getcwd(), '')
+        for path in sorted(measured):
+            # exclude patterns apply to the name reported in XML - which
+            #  is relative to the current directory, when possible
+            name = path[len(cwd):] if path.startswith(cwd) else path
+            if self._args.excludePatterns and any([fnmatch.fnmatchcase(name, ef) for ef in self._excludePatterns]):
+                if self._args.verbose:
+                    print("%s is excluded" % name)
+                continue
+            try:
+                analysis = cov._analyze(path)
+            except Exception as err:
+                self._error("Error: unable to analyze %s: %s" % (path, str(err)))
+                continue
+
+            # build the equivalent of the XML <class> node - so we can share
+            #  function derivation, checksum, etc.
+            fileNode = ET.Element('class', {'filename' : name})
+            lines = ET.SubElement(fileNode, 'lines')
+            # branch line -> [number of destinations, indices of taken ones]
+            #  where branch index is the position of the destination line
+            #  in sorted order - so is consistent from one testcase to the next
+            branches = {}
+            if value(analysis, 'has_arcs'):
+                executed = set(value(analysis, 'arcs_executed'))
+                dests = {}
+                for arc in value(analysis, 'arc_possibilities'):
+                    dests.setdefault(arc[0], []).append(arc)
+                for lineNo in analysis.branch_stats():
+                    arcs = sorted(dests.get(lineNo, []))
+                    branches[lineNo] = [len(arcs),
+                                        [i for i, a in enumerate(arcs) if a in executed]]
+            for lineNo in sorted(analysis.statements):
+                attrib = {'number' : str(lineNo),
+                          'hits'   : '0' if lineNo in analysis.missing else '1'}
+                if lineNo in branches and branches[lineNo][0]:
+                    total, taken = branches[lineNo]
+                    attrib['branch'] = 'true'
+                    attrib['condition-coverage'] = '%d%% (%d/%d)' % (
+                        (100 * len(taken)) // total, len(taken), total)
+                    attrib['taken-branches'] = ','.join(str(i) for i in taken)
+                ET.SubElement(lines, 'line', attrib)
+
+            if self._args.verbose > 1:
+                print("  file: %s" % (path))
+            self._record = ["SF:%s\n" % path]
+            self._write_version(path)
+            self.process_file(fileNode, path)
+            self._end_record()
+        return True
+
+    def process_xml_file(self, xml_file):
+        # Stream the XML data rather than building the whole tree:  each
+        #  <class> element is translated as soon as it is closed and then
+        #  discarded - so peak memory is bounded by the largest source file
+        #  rather than by the size of the report.
         source_paths = []
+        stack = []   # currently open elements - stack[0] is the root
+        sawSources = False
+        sawPackages = False
+        isExternal = False
 
         try:
-            if(root[0].tag == 'sources'):
-                for source in root[0]:
+            for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+                if event == 'start':
+                    stack.append(elem)
+                    depth = len(stack)
+                    if depth == 2:
+                        # direct child of root: expect 'sources' then 'packages'
+                        if not sawSources:
+                            if elem.tag != 'sources':
+                                print("Error: parse xml fail: no 'sources' in %s" %(xml_file))
+                                sys.exit(1)
+                            sawSources = True
+                        elif not sawPackages:
+                            if elem.tag != 'packages':
+                                break
+                            sawPackages = True
+                            if self._args.verbose:
+                                print("packages: " + str(elem.attrib))
+                    elif depth == 3 and elem.tag == 'package':
+                        # name="." means current directory
+                        # name=".folder1.folder2" means external module or directory
+                        # name="abc" means internal module or directory
+                        pname = elem.attrib['name']
+                        if self._args.verbose:
+                            print("package: '%s'" % (pname))
+                        isExternal = (pname.startswith('.') and pname != '.')
+                    continue
+
+                stack.pop()
+                depth = len(stack) + 1
+                if depth == 3 and elem.tag == 'source':
                     # keep track of number of times we use each source_path to find
                     #  some file.  Unused source paths are likely a problem.
                     if self._args.verbose:
-                        print("source: '%s'" %(source.text))
+                        print("source: '%s'" %(elem.text))
                     # unclear why the Coverage.py version on GitHub node
                     # generates empty sources
-                    if source.text == None:
+                    if elem.text == None:
                         print("skipping empty source (???)")
                         continue
-                    source_paths.append([source.text, 0])
-            else:
-                print("Error: parse xml fail: no 'sources' in %s" %(xml_file))
-                sys.exit(1)
-            if len(root) < 2 or root[1].tag != 'packages':
-                print("Error: parse xml fail: no 'packages' in %s" %(xml_file))
-                if not self._args.keepGoing:
-                    sys.exit(1)
-                return
-            if self._args.verbose:
-                print("packages: " + str(root[1].attrib))
-        except Exception as err:
-            print("Error: parse xml fail in %s: %s" % (xml_file, str(err)))
-            if not self._args.keepGoing:
-                sys.exit(1)
+                    source_paths.append([elem.text, 0])
+                elif depth == 5 and sawPackages:
+                    # a <class> node - i.e., one source file
+                    self._process_class(elem, source_paths, isExternal)
+                    # done with this element - release it
+                    elem.clear()
+                    stack[-1].remove(elem)
+                elif depth == 2:
+                    # 'sources' or 'packages' subtree is complete
+                    elem.clear()
+        except ET.ParseError as err:
+            self._error("Error: parse xml fail in %s: %s" % (xml_file, str(err)))
             return
 
-        for package in root[1]:
-            # name="." means current directory
-            # name=".folder1.folder2" means external module or directory
-            # name="abc" means internal module or directory
-            pname = package.attrib['name']
-            if self._args.verbose:
-                print("package: '%s'" % (pname))
-            isExternal = (pname.startswith('.') and pname != '.')
-            #pdb.set_trace()
-            for classes in package:
-                for fileNode in classes:
-                    name = fileNode.attrib['filename']
-                    if self._args.excludePatterns and any([fnmatch.fnmatchcase(name, ef) for ef in self._excludePatterns]):
-                        if self._args.verbose:
-                            print("%s is excluded" % name)
-                        continue
-                    if self._args.verbose > 1:
-                        print("  file: %s" % (name))
-                    if not isExternal:
-                        for s in source_paths:
-                            if self._args.verbose > 1:
-                                print("  check src_path (%s %d)" % (s[0], s[1]))
-                            path = os.path.join(s[0], name)
-                            if os.path.exists(path):
-                                name = path
-                                s[1] += 1 # this source path used for something
-                                break
-                        else:
-                            print("did not find %s in search path" % (name))
-
-                    self._outf.write("SF:%s\n" % name)
-                    if self._versionScript:
-                        cmd = copy.deepcopy(self._versionScript)
-                        cmd.append(name)
-                        try:
-                            version = subprocess.check_output(cmd)
-                            self._outf.write("VER:%s\n" % version.strip().decode('UTF-8'))
-                        except Exception as err:
-                            print("Error: no version for %s: %s" %(
-                                name, str(err)))
-                            if not self._args.keepGoing:
-                                sys.exit(-1)
-
-                    self.process_file(fileNode, name)
-                    self._outf.write("end_of_record\n")
+        if not sawPackages:
+            self._error("Error: parse xml fail: no 'packages' in %s" %(xml_file))
+            return
 
         for s in source_paths:
             if s[1] == 0:
                 print("Warning: XML file '%s': source_path '%s' is unused" %(xml_file, s[0]))
 
+    def _process_class(self, fileNode, source_paths, isExternal):
+        name = fileNode.attrib['filename']
+        if self._args.excludePatterns and any([fnmatch.fnmatchcase(name, ef) for ef in self._excludePatterns]):
+            if self._args.verbose:
+                print("%s is excluded" % name)
+            return
+        if self._args.verbose > 1:
+            print("  file: %s" % (name))
+        if not isExternal:
+            for s in source_paths:
+                if self._args.verbose > 1:
+                    print("  check src_path (%s %d)" % (s[0], s[1]))
+                path = os.path.join(s[0], name)
+                if os.path.exists(path):
+                    name = path
+                    s[1] += 1 # this source path used for something
+                    break
+            else:
+                print("did not find %s in search path" % (name))
+
+        self._record = ["SF:%s\n" % name]
+        self._write_version(name)
+        self.process_file(fileNode, name)
+        self._end_record()
+
+    def _end_record(self):
+        if self._aggregate is not None:
+            # first entry is "SF:name\n"
+            name = self._record[0][3:-1]
+            if name not in self._aggregate:
+                self._aggregate[name] = MergedRecord(name)
+            self._aggregate[name].merge(self._record[1:], self._args.keepGoing)
+        else:
+            self._record.append("end_of_record\n")
+            self._outf.write(''.join(self._record))
+        self._record = None
+
+    def _write_version(self, name):
+        if self._versionScript:
+            try:
+                version = self._versionScript.version(name)
+                self._record.append("VER:%s\n" % version)
+            except Exception as err:
+                self._error("Error: no version for %s: %s" %(
+                    name, str(err)), -1)
 
     def process_file(self, fileNode, filename):
 
+        # the record is accumulated in memory and written all at once
+        emit = self._record.append
+        emitAll = self._record.extend
+
+        source = None
         sourceCode = None
         if (self._args.checksum or
             (self._isPython and self._args.deriveFunctions)):
             try:
-                with open(filename, 'r') as f:
-                    sourceCode = f.read().split('\n')
+                source = _sourceCache.get(filename)
+                sourceCode = source.lines
             except (IOError, OSError) as e:
                 feature = ' compute line checksum' if self._args.checksum else ''
                 if self._isPython and self._args.deriveFunctions:
@@ -241,9 +977,7 @@ This is a problem in at least 2 ways:
                       feature += ' or'
                    feature += ' derive function data'
 
-                print("cannot open %s - unable to %s" % (filename, feature));
-                if not self._args.keepGoing:
-                    sys.exit(1)
+                self._error("cannot open %s - unable to %s" % (filename, feature))
 
         def count(indent):
             count = 0
@@ -369,6 +1103,12 @@ This is a problem in at least 2 ways:
             #     and mark the function decl line as 'not hit' if we decided that
             #     the function itself is not executed.
             lineData = {}
+            scopes = None
+            if (source and self._isPython and self._args.deriveFunctions and
+                getattr(self._args, 'functionParser', 'ast') == 'ast'):
+                scopes = source.python_scopes()
+                if scopes is None and self._args.verbose:
+                    print("unable to parse %s - using indentation to derive functions" % (filename))
             for line in node:
                 lineNo = int(line.attrib['number'])
                 hit = int(line.attrib["hits"])
@@ -380,7 +1120,8 @@ This is a problem in at least 2 ways:
                 if sourceCode and self._isPython:
                     # try to derive function names and begin/end lines in Python code
                     if lineNo <= len(sourceCode):
-                        m = parseLine.search(sourceCode[lineNo-1])
+                        # if we have the AST, then functions are found below
+                        m = None if scopes else parseLine.search(sourceCode[lineNo-1])
                         if m:
                             indent = count(m.group(1))
                             #print(sourceCode[lineNo-1])
@@ -422,10 +1163,8 @@ This is a problem in at least 2 ways:
 
                         prevLine = lineNo
                     else:
-                        print('"%s":%d: Error: out of range: file contains %d lines' % (
+                        self._error('"%s":%d: Error: out of range: file contains %d lines' % (
                             filename, lineNo, len(sourceCode)))
-                        if not self._args.keepGoing:
-                            sys.exit(1)
 
                 if "branch" in line.attrib and line.attrib["branch"] == 'true':
                     # attrib is always true from xmlreport.py - but may not
@@ -435,18 +1174,26 @@ This is a problem in at least 2 ways:
                     assert(m)
                     taken = int(m.group(1))
                     total = int(m.group(2))
+                    if 'taken-branches' in line.attrib:
+                        # from Coverage.py data file:  we know exactly which
+                        #  branches (sorted by destination) were taken
+                        takenIdx = set(int(i) for i in line.attrib['taken-branches'].split(',') if i)
+                        emitAll(["BRDA:%d,0,%d,%d\n" % (lineNo, cond, 1 if cond in takenIdx else 0)
+                                 for cond in range(0, total)])
+                        totals['branch'][0] += total
+                        totals['branch'][1] += len(takenIdx.intersection(range(0, total)))
+                        continue
                     # no information of which clause is taken or not
                     # set taken conditions start from 0 and followed by
                     #  non-taken conditions
                     # taken conditions
-                    for cond in range(0,taken):
-                        self._outf.write("BRDA:%d,0,%d,1\n" % (lineNo, cond))
-                        totals['branch'][0] += 1
-                        totals['branch'][1] += 1
+                    emitAll(["BRDA:%d,0,%d,1\n" % (lineNo, cond)
+                             for cond in range(0, taken)])
                     # non-taken conditions
-                    for cond in range(taken, total):
-                        totals['branch'][0] += 1
-                        self._outf.write("BRDA:%d,0,%d,0\n" % (lineNo, cond))
+                    emitAll(["BRDA:%d,0,%d,0\n" % (lineNo, cond)
+                             for cond in range(taken, total)])
+                    totals['branch'][0] += max(taken, total)
+                    totals['branch'][1] += taken
 
             # and build all the pending functions
             #  these were still open when we hit the end of file - e.g., because
@@ -463,6 +1210,17 @@ This is a problem in at least 2 ways:
                     currentObj = None
                     break
 
+            if scopes:
+                for f in scopes.functions(lineData):
+                    if f['hit'] is None:
+                        f['hit'] = 0
+                    elif 0 == f['hit']:
+                        # mark that function decl lines - decorators and
+                        #  signature - are not hit if the function is not hit
+                        for lineNo in f['decl']:
+                            lineData[lineNo] = 0
+                    functions.append(f)
+
             # print the LCOV function data
             idx = 0
             for f in functions:
@@ -471,24 +1229,51 @@ This is a problem in at least 2 ways:
                 idx += 1
                 if f['hit']:
                     totals['function'][1] += 1
-                self._outf.write("FNL:%(idx)d,%(start)d,%(end)d\nFNA:%(idx)d,%(hit)d,%(name)s\n" % f)
+                emit("FNL:%(idx)d,%(start)d,%(end)d\nFNA:%(idx)d,%(hit)d,%(name)s\n" % f)
             # print the LCOV line data.
             for lineNo in sorted(lineData.keys()):
                 checksum = ''
-                if self._args.checksum:
+                if self._args.checksum and source:
                     try:
-                        checksum = ',' + line_hash(sourceCode[lineNo-1])
+                        checksum = ',' + source.line_hash(lineNo)
                     except IndexError as err:
                         print('"%s":%d: unable to compute checksum for missing line' % (filename, lineNo))
+                        self._errors += 1
                         if not self._args.keepGoing:
                             raise(err)
 
-                self._outf.write("DA:%d,%d%s\n" % (lineNo, lineData[lineNo], checksum));
+                emit("DA:%d,%d%s\n" % (lineNo, lineData[lineNo], checksum));
 
             # print the LCOV totals - not used by lcov, but maybe somebody does
             for key in totals:
                 d = totals[key]
                 if d[0] == 0:
                     continue
-                self._outf.write("%s:%d\n" % (d[2], d[0]))
-                self._outf.write("%s:%d\n" % (d[3], d[1]))
+                emit("%s:%d\n" % (d[2], d[0]))
+                emit("%s:%d\n" % (d[3], d[1]))
+
+
+# version callback used by this worker process - kept across calls so
+#  callback (and version module) initialization happens only once per worker
+_workerVersionScript = None
+
+def _process_fragment(scriptArgs, inputFile, fragment):
+    """Parallel worker:  translate one input into its own fragment file."""
+    global _workerVersionScript
+    p = ProcessFile(scriptArgs, fragment, _workerVersionScript)
+    _workerVersionScript = p._versionScript
+    try:
+        p.process_input(inputFile)
+        # return new version callback results so parent can cache them - and
+        #  the number of errors, so the parent does not cache a bad
+        #  translation
+        return (_workerVersionScript.updates() if _workerVersionScript
+                else None, p._errors)
+    finally:
+        p.close()
+        # ProcessFile does not close the callback of a fragment writer - but
+        #  nobody else will close ours:  stop the co-process (if any).  The
+        #  version cache is kept, and the callback is restarted if the next
+        #  input needs it.
+        if _workerVersionScript:
+            _workerVersionScript.close()
@@ -13,6 +13,7 @@ use File::Spec;
 use Scalar::Util qw/looks_like_number/;
 use Cwd qw/abs_path getcwd/;
 use Storable qw(dclone);
+use Compress::Zlib;
 use Capture::Tiny;
 use Module::Load::Conditional qw(check_install);
 use Digest::MD5 qw(md5_base64);
@@ -120,6 +121,10 @@ our @temp_dirs;
 our $tmp_dir = '/tmp';          # where to put temporary/intermediate files
 our $preserve_intermediates;    # this is useful only for debugging
 our $sort_inputs;    # sort input file lists - to reduce unpredictability
+our $tracefile_format = 'info';    # output format: 'info' (text) or 'binary'
+our $result_transport = 'pipe';    # parallel child results:  'pipe' or 'file'
+our $count_data_format = 'hash';    # line count storage: 'hash' or 'packed'
+my %resultPipes;    # pid -> [read handle, data received so far, done]
 our $devnull      = File::Spec->devnull();    # portable way to do it
 our $dirseparator = ($^O =~ /Win/) ? '\\' : '/';
 our $interp       = ($^O =~ /Win/) ? $^X : undef;
@@ -312,6 +317,18 @@ our $dedicate_segment_line_estimate = 50000;
 #   not a latency one.  A file matched by '--large-file' is never also given a
 #   dedicated forked chunk.
 our $dedicate_segment_size = 50000000;    # 50 MB
+# Reading a single large .info file:  an uncompressed tracefile at least this
+#   large (bytes) is split at 'end_of_record' boundaries into '--parallel'
+#   segments which are parsed by child processes, then merged.  Otherwise,
+#   one big file (e.g., the usual genhtml input) would be parsed serially no
+#   matter how many cores are available.  0 disables the feature.
+our $info_split_size = 100000000;    # 100 MB
+# Merging very many tracefiles:  if nonzero, bound the memory used to merge
+#   them to (roughly) this many MB by spilling per-source-file records to
+#   on-disk buckets and then merging one group of buckets at a time - see
+#   AggregateTraces::_external_merge.  0 disables the feature.
+our $merge_memory_budget = 0;
+our $merge_buckets       = 128;
 
 our $lcov_filter_parallel = 1;            # enable by default
 our $lcov_filter_chunk_size;
@@ -1353,12 +1370,18 @@ my %rc_common = (
              "demangle_cpp"              => \@lcovutil::cpp_demangle,
              'excessive_count_threshold' => \$excessive_count_threshold,
 
-             'sort_input' => \$lcovutil::sort_inputs,
+             'sort_input'        => \$lcovutil::sort_inputs,
+             'tracefile_format'  => \$lcovutil::tracefile_format,
+             'result_transport'  => \$lcovutil::result_transport,
+             'count_data_format' => \$lcovutil::count_data_format,
 
              "fail_under_lines"       => \$fail_under_lines,
              "fail_under_branches"    => \$fail_under_branches,
              'lcov_filter_parallel'   => \$lcovutil::lcov_filter_parallel,
-             'lcov_filter_chunk_size' => \$lcovutil::lcov_filter_chunk_size,);
+             'lcov_filter_chunk_size' => \$lcovutil::lcov_filter_chunk_size,
+             'info_split_size'        => \$lcovutil::info_split_size,
+             'merge_memory_budget'    => \$lcovutil::merge_memory_budget,
+             'merge_buckets'          => \$lcovutil::merge_buckets,);
 
 # lcov needs to know the options which might get passed to geninfo in --capture mode
 our $defaultChunkSize;      # for performance tweaking
@@ -1443,7 +1466,8 @@ our %argCommon = ("tempdir=s"         => \$tempdirname,
                   "memory=i"          => \$lcovutil::maxMemory,
                   "forget-test-names" => \$TraceFile::ignore_testcase_name,
                   "preserve"          => \$lcovutil::preserve_intermediates,
-                  'sort-input'        => \$lcovutil::sort_inputs,);
+                  'sort-input'        => \$lcovutil::sort_inputs,
+                  'tracefile-format=s' => \$lcovutil::tracefile_format,);
 
 sub warnDeprecated
 {
@@ -1792,6 +1816,12 @@ sub parseOptions
                 unless grep(/^$x$/, @$valid);
         }
     }
+    die("invalid 'tracefile_format' value \"$lcovutil::tracefile_format\" - expected (info, binary)"
+    ) unless grep(/^$lcovutil::tracefile_format$/, 'info', 'binary');
+    die("invalid 'result_transport' value \"$lcovutil::result_transport\" - expected (pipe, file)"
+    ) unless grep(/^$lcovutil::result_transport$/, 'pipe', 'file');
+    die("invalid 'count_data_format' value \"$lcovutil::count_data_format\" - expected (hash, packed)"
+    ) unless grep(/^$lcovutil::count_data_format$/, 'hash', 'packed');
     # context only gets grabbed/stored with '--profile'
     $lcovutil::profile = ''
         if ($contextCallback && !defined($lcovutil::profile));
@@ -2307,6 +2337,8 @@ sub initial_state
     # clear profile - want only my contribution
     %lcovutil::profileData  = ();
     %lcovutil::warnOnlyOnce = ();
+    # result pipes of our siblings belong to our parent
+    %resultPipes = ();
 
     # clear pattern counts so we can update number found in children
     foreach my $patType (\@lcovutil::exclude_file_patterns,
@@ -2469,6 +2501,167 @@ sub update_state
     die("unexpected update data") unless -1 == $#_;    # exhausted list
 }
 
+# Child-to-parent result transport.
+# Each parallel stage used to have its child Storable::store its result
+#  into the temp directory, for the parent to Storable::retrieve after
+#  the child exited - so the data went through the filesystem twice.
+# Instead, the parent creates a pipe before the fork (result_pipe); the
+#  child writes a single length-prefixed Storable image to it (send_result)
+#  and the parent collects the bytes while it is waiting for children to
+#  finish (wait_child) - so transfer overlaps with the children which are
+#  still running, and the data is decoded straight from memory when the
+#  child is reaped (receive_result).
+# If 'result_transport' is 'file' or if the pipe cannot be created, the
+#  dump file is used as before.
+
+sub result_pipe
+{
+    return undef unless 'pipe' eq $result_transport;
+    my ($reader, $writer);
+    unless (pipe($reader, $writer)) {
+        lcovutil::info(1, "unable to create result pipe: $! - using file\n");
+        return undef;
+    }
+    binmode($reader);
+    binmode($writer);
+    return [$reader, $writer];
+}
+
+sub discard_result_pipe
+{
+    # called in the parent if the fork failed:  release both ends
+    my $pipe = shift;
+    return unless defined($pipe);
+    close($_) foreach (@$pipe);
+}
+
+sub expect_result
+{
+    # called in the parent, after fork
+    my ($pid, $pipe) = @_;
+    return unless defined($pipe);
+    my ($reader, $writer) = @$pipe;
+    close($writer);
+    $resultPipes{$pid} = [$reader, '', 0];
+}
+
+sub send_result
+{
+    # called in the child:  return true if successful (like Storable::store)
+    my ($pipe, $data, $dumpfile) = @_;
+    return Storable::store($data, $dumpfile) unless defined($pipe);
+    my ($reader, $writer) = @$pipe;
+    close($reader);
+    my $frozen = Storable::nfreeze($data);
+    my $len    = length($frozen);
+    my $ok     = print($writer pack('NN', $len >> 32, $len & 0xFFFFFFFF),
+                       $frozen);
+    return close($writer) && $ok;
+}
+
+sub _read_results
+{
+    # read whatever is available from the pipes of running children -
+    #  waiting up to $timeout seconds for something to arrive
+    my $timeout = shift;
+    my $rin     = '';
+    my %fds;
+    while (my ($pid, $r) = each(%resultPipes)) {
+        next if $r->[2];
+        my $fd = fileno($r->[0]);
+        vec($rin, $fd, 1) = 1;
+        $fds{$fd} = $r;
+    }
+    return 0 unless %fds;
+    my $rout;
+    my $n = select($rout = $rin, undef, undef, $timeout);
+    return 1 if $n <= 0;
+    while (my ($fd, $r) = each(%fds)) {
+        next unless vec($rout, $fd, 1);
+        my $got = sysread($r->[0], $r->[1], 1 << 20, length($r->[1]));
+        next if !defined($got) && $!{EINTR};
+        if (!$got) {
+            # EOF (or error) - child is done sending
+            close($r->[0]);
+            $r->[2] = 1;
+        }
+    }
+    return 1;
+}
+
+sub _finish_result
+{
+    # child exited:  collect anything still in its pipe
+    my $r = $resultPipes{shift()};
+    return if !defined($r) || $r->[2];
+    while (1) {
+        my $got = sysread($r->[0], $r->[1], 1 << 20, length($r->[1]));
+        next if !defined($got) && $!{EINTR};
+        last unless $got;
+    }
+    close($r->[0]);
+    $r->[2] = 1;
+}
+
+sub wait_child
+{
+    # drop-in replacement for 'wait()' - or for 'waitpid(-1, WNOHANG)' if
+    #  $noHang is set - which also collects results sent by children.
+    # A child blocked on a full pipe cannot exit, so we must keep reading
+    #  while we wait.
+    my $noHang = shift;
+    while (1) {
+        my $pid = waitpid(-1, POSIX::WNOHANG);
+        if (0 != $pid) {
+            if ($pid > 0) {
+                my $status = $?;
+                _finish_result($pid);
+                $? = $status;
+            }
+            return $pid;
+        }
+        if ($noHang) {
+            # grab what is already there, then check once more
+            _read_results(0);
+            $pid = waitpid(-1, POSIX::WNOHANG);
+            if ($pid > 0) {
+                my $status = $?;
+                _finish_result($pid);
+                $? = $status;
+            }
+            return $pid;
+        }
+        # nobody is sending anything:  just block
+        return wait() unless _read_results(0.1);
+    }
+}
+
+sub receive_result
+{
+    # called in the parent after child $pid has been reaped.
+    # Return ($data, $found):  $data is the decoded result if $wanted,
+    #  $found is true if the child sent anything at all.
+    # Dies if the data is corrupt or truncated.
+    my ($pid, $dumpfile, $wanted) = @_;
+    $wanted = 1 unless defined($wanted);
+    my $r = delete($resultPipes{$pid});
+    if (!defined($r)) {
+        # file transport
+        my $found = -f $dumpfile;
+        return (($found && $wanted) ? Storable::retrieve($dumpfile) : undef,
+                $found);
+    }
+    _finish_result($pid) unless $r->[2];
+    my $found = length($r->[1]);
+    return (undef, $found) unless $found && $wanted;
+    die("truncated result from child $pid\n") if $found < 8;
+    my ($hi, $lo) = unpack('NN', $r->[1]);
+    die("truncated result from child $pid\n")
+        unless $found == 8 + ($hi << 32) + $lo;
+    substr($r->[1], 0, 8, '');
+    return (Storable::thaw($r->[1]), $found);
+}
+
 sub warnSuppress($$)
 {
     my ($code, $errName) = @_;
@@ -4080,7 +4273,11 @@ use constant {
 
 sub new
 {
-    my $class    = shift;
+    my $class = shift;
+    # see 'count_data_format' in man lcovrc(5)
+    return PackedCountData->new(@_)
+        if ('packed' eq $lcovutil::count_data_format &&
+            $class eq 'CountData');
     my $filename = shift;
     my $sortable = defined($_[0]) ? shift : $UNSORTED;
     my $self = [{},
@@ -4100,14 +4297,10 @@ sub filename
     return $self->[FILENAME];
 }
 
-sub append
+sub _check_count
 {
-    # return 1 if we hit something new, 0 if not (count was already non-zero)
-    # using $suppressErrMsg to avoid reporting same thing for bot the
-    # 'testcase' entry and the 'summary' entry
+    # return $count - or zero, if it is not a valid count
     my ($self, $key, $count, $suppressErrMsg) = @_;
-    my $changed = 0;    # hit something new or not
-
     if (!Scalar::Util::looks_like_number($count)) {
         lcovutil::report_format_error($lcovutil::ERROR_FORMAT, 'hit', $count,
                                       'line "' . $self->filename() . ":$key\"")
@@ -4128,6 +4321,18 @@ sub append
                                       'line ' . $self->filename() . ":$key\""
         ) unless $suppressErrMsg;
     }
+    return $count;
+}
+
+sub append
+{
+    # return 1 if we hit something new, 0 if not (count was already non-zero)
+    # using $suppressErrMsg to avoid reporting same thing for bot the
+    # 'testcase' entry and the 'summary' entry
+    my ($self, $key, $count, $suppressErrMsg) = @_;
+    my $changed = 0;    # hit something new or not
+
+    $count = $self->_check_count($key, $count, $suppressErrMsg);
     my $data = $self->[HASH];
     if (!exists($data->{$key})) {
         $changed = 1;             # something new - whether we hit it or not
@@ -4198,13 +4403,23 @@ sub entries
     return scalar(keys(%{$_[0]->[HASH]}));
 }
 
+sub _hashOf
+{
+    # line -> count hash of $you - which may use a different storage format
+    #  than we do (see 'count_data_format')
+    my ($self, $you) = @_;
+    return $you->[HASH] if ref($you) eq 'CountData';
+    return {map({ ($_ => $you->value($_)) } $you->keylist())};
+}
+
 sub union
 {
     my $self = shift;
     my $info = shift;
 
     my $changed = 0;
-    while (my ($key, $value) = each(%{$info->[HASH]})) {
+    my $data    = $self->_hashOf($info);
+    while (my ($key, $value) = each(%$data)) {
         if ($self->append($key, $value)) {
             $changed = 1;
         }
@@ -4217,7 +4432,7 @@ sub intersect
     my $self     = shift;
     my $you      = shift;
     my $changed  = 0;
-    my $yourData = $you->[HASH];
+    my $yourData = $self->_hashOf($you);
     foreach my $key ($self->keylist()) {
         if (exists($yourData->{$key})) {
             # append your count to mine
@@ -4238,7 +4453,7 @@ sub difference
     my $self     = shift;
     my $you      = shift;
     my $changed  = 0;
-    my $yourData = $you->[HASH];
+    my $yourData = $self->_hashOf($you);
     foreach my $key ($self->keylist()) {
         if (exists($yourData->{$key})) {
             $self->remove($key);
@@ -4264,6 +4479,335 @@ sub get_found_and_hit
     return ($self->[FOUND], $self->[HIT]);
 }
 
+package PackedCountData;
+# CountData which stores its line -> count map as two packed strings:  the
+#  sorted line numbers (32 bit) and the corresponding counts (double) - 12
+#  bytes per line, rather than the 50 or more of a Perl hash entry.
+# Lines which do not arrive in increasing order are held in the CountData
+#  hash until an operation needs the sorted data.  Keys which are not line
+#  numbers stay in the hash.
+# Used if 'count_data_format' is 'packed' - see man lcovrc(5).
+
+use base 'CountData';
+
+use constant {
+              PENDING => 0,    # the CountData hash
+              FOUND   => 2,
+              HIT     => 3,
+              LINES   => 5,
+              COUNTS  => 6,
+              CURSOR  => 7,    # index of most recent lookup
+};
+
+sub new
+{
+    my ($class, $filename, $sortable) = @_;
+    my $self = CountData::new($class, $filename, $sortable);
+    push(@$self, '', '', 0);
+    return $self;
+}
+
+sub _isLine
+{
+    # a line number which fits into 32 bits
+    return $_[0] =~ /^(0|[1-9]\d{0,8})$/;
+}
+
+sub _find
+{
+    # return index of line $key in the packed data - or -1 if not found
+    my ($self, $key) = @_;
+    my $lines = \$self->[LINES];
+    my $n     = length($$lines) >> 2;
+    # callers usually walk the lines in order
+    my $next = $self->[CURSOR] + 1;
+    return $self->[CURSOR] = $next
+        if ($next < $n && vec($$lines, $next, 32) == $key);
+    my ($lo, $hi) = (0, $n - 1);
+    while ($lo <= $hi) {
+        my $mid  = ($lo + $hi) >> 1;
+        my $line = vec($$lines, $mid, 32);
+        if ($line < $key) {
+            $lo = $mid + 1;
+        } elsif ($line > $key) {
+            $hi = $mid - 1;
+        } else {
+            return $self->[CURSOR] = $mid;
+        }
+    }
+    return -1;
+}
+
+sub _count
+{
+    my ($self, $idx) = @_;
+    return unpack('d', substr($self->[COUNTS], $idx * 8, 8));
+}
+
+sub _flush
+{
+    # merge the pending lines into the packed data
+    my $self    = shift;
+    my $pending = $self->[PENDING];
+    my @keys    = sort({ $a <=> $b } grep({ _isLine($_) } keys(%$pending)));
+    return unless @keys;
+    my @lines  = unpack('N*', $self->[LINES]);
+    my @counts = unpack('d*', $self->[COUNTS]);
+    my (@l, @c);
+    my $i = 0;
+    foreach my $key (@keys) {
+        while ($i <= $#lines && $lines[$i] < $key) {
+            push(@l, $lines[$i]);
+            push(@c, $counts[$i++]);
+        }
+        push(@l, $key);
+        push(@c, delete($pending->{$key}));
+    }
+    $self->[LINES]  = pack('N*', @l, @lines[$i .. $#lines]);
+    $self->[COUNTS] = pack('d*', @c, @counts[$i .. $#counts]);
+}
+
+sub _unpack
+{
+    my $self = shift;
+    $self->_flush();
+    return ([unpack('N*', $self->[LINES])], [unpack('d*', $self->[COUNTS])]);
+}
+
+sub _repack
+{
+    my ($self, $lines, $counts) = @_;
+    $self->[LINES]  = pack('N*', @$lines);
+    $self->[COUNTS] = pack('d*', @$counts);
+}
+
+sub _report_excessive
+{
+    # 'append' complains about excessive counts - so we do too
+    my ($self, $key, $count) = @_;
+    $self->_check_count($key, $count)
+        if (defined($lcovutil::excessive_count_threshold) &&
+            $count > $lcovutil::excessive_count_threshold);
+}
+
+sub append
+{
+    my ($self, $key, $count, $suppressErrMsg) = @_;
+
+    $count = $self->_check_count($key, $count, $suppressErrMsg);
+    my $pending = $self->[PENDING];
+    my $idx     = -1;
+    my $current;
+    if (exists($pending->{$key})) {
+        $current = $pending->{$key};
+    } elsif ($key =~ /^(0|[1-9]\d{0,8})$/) {    # see _isLine
+        my $n = length($self->[LINES]) >> 2;
+        if (0 == $n || vec($self->[LINES], $n - 1, 32) < $key) {
+            # the usual case:  lines arrive in increasing order
+            $self->[LINES]  .= pack('N', $key);
+            $self->[COUNTS] .= pack('d', $count);
+            ++$self->[FOUND];
+            ++$self->[HIT] if ($count > 0);
+            return 1;
+        }
+        $idx = $self->_find($key);
+        $current = $self->_count($idx) if $idx >= 0;
+    }
+    if (!defined($current)) {
+        $pending->{$key} = $count;
+        ++$self->[FOUND];
+        ++$self->[HIT] if ($count > 0);
+        return 1;
+    }
+    my $changed = 0;
+    if ($count > 0 &&
+        $current == 0) {
+        ++$self->[HIT];
+        $changed = 1;
+    }
+    if ($idx < 0) {
+        $pending->{$key} = $count + $current;
+    } else {
+        substr($self->[COUNTS], $idx * 8, 8, pack('d', $count + $current));
+    }
+    return $changed;
+}
+
+sub value
+{
+    my ($self, $key) = @_;
+
+    my $pending = $self->[PENDING];
+    return $pending->{$key} if exists($pending->{$key});
+    return undef unless $key =~ /^(0|[1-9]\d{0,8})$/;    # see _isLine
+    my $idx = $self->_find($key);
+    return $idx < 0 ? undef :
+        unpack('d', substr($self->[COUNTS], $idx * 8, 8));
+}
+
+sub remove
+{
+    my ($self, $key, $check_if_present, $retainElement) = @_;
+
+    my $pending = $self->[PENDING];
+    my $idx     = -1;
+    my $current;
+    if (exists($pending->{$key})) {
+        $current = $pending->{$key};
+    } elsif (_isLine($key) &&
+             ($idx = $self->_find($key)) >= 0) {
+        $current = $self->_count($idx);
+    }
+    if (!defined($current)) {
+        die("$key not found") unless defined($check_if_present);
+        return 0;
+    }
+    --$self->[FOUND];
+    --$self->[HIT] if ($current > 0);
+    unless ($retainElement) {
+        if ($idx < 0) {
+            delete($pending->{$key});
+        } else {
+            substr($self->[LINES],  $idx * 4, 4, '');
+            substr($self->[COUNTS], $idx * 8, 8, '');
+        }
+    }
+    return 1;
+}
+
+sub keylist
+{
+    my $self = shift;
+    $self->_flush();
+    return (unpack('N*', $self->[LINES]), keys(%{$self->[PENDING]}));
+}
+
+sub entries
+{
+    my $self = shift;
+    return (length($self->[LINES]) >> 2) + scalar(keys(%{$self->[PENDING]}));
+}
+
+# union/intersect/difference merge the sorted line lists - rather than
+#  looking up each line in turn.  Keys which are not line numbers, and
+#  operands which use the other storage format, are handled by CountData.
+
+sub union
+{
+    my ($self, $info) = @_;
+    return $self->SUPER::union($info) unless ref($info) eq ref($self);
+
+    my ($yours, $yourCounts) = $info->_unpack();
+    my $changed = 0;
+    while (my ($key, $value) = each(%{$info->[PENDING]})) {
+        $changed = 1 if $self->append($key, $value);
+    }
+    return $changed unless @$yours;
+    my ($mine, $myCounts) = $self->_unpack();
+    my (@lines, @counts);
+    my $i = 0;
+    for (my $j = 0; $j <= $#$yours; ++$j) {
+        my ($key, $count) = ($yours->[$j], $yourCounts->[$j]);
+        $self->_report_excessive($key, $count);
+        while ($i <= $#$mine && $mine->[$i] < $key) {
+            push(@lines,  $mine->[$i]);
+            push(@counts, $myCounts->[$i++]);
+        }
+        push(@lines, $key);
+        if ($i <= $#$mine && $mine->[$i] == $key) {
+            my $current = $myCounts->[$i++];
+            if ($count > 0 &&
+                $current == 0) {
+                ++$self->[HIT];
+                $changed = 1;
+            }
+            push(@counts, $current + $count);
+        } else {
+            push(@counts, $count);
+            ++$self->[FOUND];
+            ++$self->[HIT] if ($count > 0);
+            $changed = 1;
+        }
+    }
+    push(@lines,  @$mine[$i .. $#$mine]);
+    push(@counts, @$myCounts[$i .. $#$myCounts]);
+    $self->_repack(\@lines, \@counts);
+    return $changed;
+}
+
+sub intersect
+{
+    my ($self, $you) = @_;
+    return $self->SUPER::intersect($you) unless ref($you) eq ref($self);
+
+    my ($mine,  $myCounts)   = $self->_unpack();
+    my ($yours, $yourCounts) = $you->_unpack();
+    my $changed = 0;
+    foreach my $key (keys(%{$self->[PENDING]})) {
+        if (exists($you->[PENDING]->{$key})) {
+            $changed = 1 if $self->append($key, $you->[PENDING]->{$key});
+        } else {
+            $self->remove($key);
+            $changed = 1;
+        }
+    }
+    my (@lines, @counts);
+    my $j = 0;
+    for (my $i = 0; $i <= $#$mine; ++$i) {
+        my ($key, $current) = ($mine->[$i], $myCounts->[$i]);
+        ++$j while ($j <= $#$yours && $yours->[$j] < $key);
+        if ($j <= $#$yours && $yours->[$j] == $key) {
+            my $count = $yourCounts->[$j];
+            $self->_report_excessive($key, $count);
+            if ($count > 0 &&
+                $current == 0) {
+                ++$self->[HIT];
+                $changed = 1;
+            }
+            push(@lines,  $key);
+            push(@counts, $current + $count);
+        } else {
+            --$self->[FOUND];
+            --$self->[HIT] if ($current > 0);
+            $changed = 1;
+        }
+    }
+    $self->_repack(\@lines, \@counts);
+    return $changed;
+}
+
+sub difference
+{
+    my ($self, $you) = @_;
+    return $self->SUPER::difference($you) unless ref($you) eq ref($self);
+
+    my ($mine,  $myCounts) = $self->_unpack();
+    my ($yours, undef)     = $you->_unpack();
+    my $changed = 0;
+    foreach my $key (keys(%{$self->[PENDING]})) {
+        if (exists($you->[PENDING]->{$key})) {
+            $self->remove($key);
+            $changed = 1;
+        }
+    }
+    my (@lines, @counts);
+    my $j = 0;
+    for (my $i = 0; $i <= $#$mine; ++$i) {
+        my ($key, $current) = ($mine->[$i], $myCounts->[$i]);
+        ++$j while ($j <= $#$yours && $yours->[$j] < $key);
+        if ($j <= $#$yours && $yours->[$j] == $key) {
+            --$self->[FOUND];
+            --$self->[HIT] if ($current > 0);
+            $changed = 1;
+        } else {
+            push(@lines,  $key);
+            push(@counts, $current);
+        }
+    }
+    $self->_repack(\@lines, \@counts);
+    return $changed;
+}
+
 package BranchElement;
 # branch element:  index, taken/not-taken count, optional expression
 # for baseline or current data, 'taken' is just a number (or '-')
@@ -6508,21 +7052,23 @@ sub merge
     my $me  = defined($self->version()) ? $self->version() : "<no version>";
     my $you = defined($info->version()) ? $info->version() : "<no version>";
 
+    # $countOp is a method name:  line data may be a CountData or a
+    #  PackedCountData
     my ($countOp, $funcOp, $brOp, $mcdcOp);
 
     if ($op == UNION) {
-        $countOp = \&CountData::union;
+        $countOp = 'union';
         $funcOp  = \&FunctionMap::union;
         $brOp    = \&BranchData::union;
         $mcdcOp  = \&MCDC_Data::union;
     } elsif ($op == INTERSECT) {
-        $countOp = \&CountData::intersect;
+        $countOp = 'intersect';
         $funcOp  = \&FunctionMap::intersect;
         $brOp    = \&BranchData::intersect;
         $mcdcOp  = \&MCDC_Data::intersect;
     } else {
         die("unexpected op $op") unless $op == DIFFERENCE;
-        $countOp = \&CountData::difference;
+        $countOp = 'difference';
         $funcOp  = \&FunctionMap::difference;
         $brOp    = \&BranchData::difference;
         $mcdcOp  = \&MCDC_Data::difference;
@@ -6532,12 +7078,12 @@ sub merge
     my $changed = 0;
 
     foreach my $name ($info->test()->keylist()) {
-        if (&$countOp($self->test($name), $info->test($name))) {
+        if ($self->test($name)->$countOp($info->test($name))) {
             $changed = 1;
         }
     }
     # if intersect and I contain some test that you don't, need to remove my data
-    if (&$countOp($self->sum(), $info->sum())) {
+    if ($self->sum()->$countOp($info->sum())) {
         $changed = 1;
     }
 
@@ -7235,6 +7781,8 @@ sub suppressCloseBrace
 package TraceFile;
 
 our $ignore_testcase_name;    # use default name, if set
+# unique id for children which parse segments of a tracefile - see _split_info
+our $readSegmentIdx = 0;
 use constant {
               FILES    => 0,
               COMMENTS => 1,
@@ -7252,7 +7800,8 @@ sub load
     my $self    = $class->new();
     my $context = MessageContext->new("loading $tracefile");
 
-    $self->_read_info($tracefile, $readSource, $verify_checksum);
+    $self->_read_info($tracefile, $readSource, $verify_checksum)
+        unless $self->_read_binary($tracefile);
 
     $self->applyFilters($readSource);
     return $self;
@@ -7338,7 +7887,18 @@ sub count_totals
     my $self = shift;
     # return list of (number files, [#lines, #hit], [#branches, #hit], [#functions,#hit])
     my @data = (0, [0, 0], [0, 0], [0, 0], [0, 0]);
+    my $lazy = tied(%{$self->[FILES]});
     foreach my $filename ($self->files()) {
+        if ($lazy && (my $t = $lazy->totals($filename))) {
+            # binary tracefile data which has not been read yet
+            ++$data[0];
+            for (my $i = 1; $i < 5; ++$i) {
+                next if 4 == $i && !$lcovutil::mcdc_coverage;
+                $data[$i]->[0] += $t->[2 * $i - 2];
+                $data[$i]->[1] += $t->[2 * $i - 1];
+            }
+            next;
+        }
         my $entry = $self->data($filename);
         ++$data[0];
         $data[1]->[0] += $entry->found();             # lines
@@ -7624,6 +8184,16 @@ sub merge_tracefile
     my $changed = 0;
     my $mine    = $self->[FILES];
     my $yours   = $trace->[FILES];
+    if (tied(%$yours) && $op == TraceInfo::UNION && !%$mine) {
+        # adopt binary tracefile data as is - so it is read only if used
+        $self->[FILES] = $yours;
+        $self->[STATE] = $trace->[STATE];
+        $self->add_comments($trace->comments());
+        return 1;
+    }
+    # filtering is done only if done on both sides
+    $self->[STATE] &= $trace->[STATE]
+        if tied(%$mine);
     foreach my $filename (keys %$mine) {
 
         if (exists($yours->{$filename})) {
@@ -8613,8 +9183,8 @@ sub _mergeParallelChunk
              $lcovutil::max_fork_fails != 0) ||
             $lcovutil::verbose);
     print(STDERR $childErr);
-    my $data = Storable::retrieve($dumped)
-        if (-f $dumped && $childstatus == 0);
+    my ($data, $found) =
+        lcovutil::receive_result($child, $dumped, $childstatus == 0);
     if (defined($data)) {
         my ($updates, $save, $state, $childFinish, $update) = @$data;
 
@@ -8647,7 +9217,7 @@ sub _mergeParallelChunk
         #$intervalMonitor->checkUpdate($processedFiles);
 
     } else {
-        if (!-f $dumped ||
+        if (!$found ||
             POSIX::SIGKILL == $signal) {
 
             if (exists($childRetryCounts->{$chunkId})) {
@@ -8659,7 +9229,7 @@ sub _mergeParallelChunk
                            "filter segment $chunkId",
                            (POSIX::SIGKILL == $signal ?
                                 "killed by OS - possibly due to out-of-memory" :
-                                "serialized data $dumped not found"),
+                                "serialized data from $child not found"),
                            $childRetryCounts->{$chunkId});
             push(@$worklist, $chunk);
         } else {
@@ -8715,7 +9285,8 @@ sub _processParallelChunk
 {
     # called from child
     my $childStart = Time::HiRes::gettimeofday();
-    my ($tmp, $chunk, $srcReader, $save, $state, $forkAt, $chunkId) = @_;
+    my ($tmp, $chunk, $srcReader, $save, $state, $forkAt, $chunkId, $pipe) =
+        @_;
     # clear profile - want only my contribution
     my $currentState = lcovutil::initial_state('filter', $chunkId);
     my $stdout_file  = File::Spec->catfile($tmp, "filter_$$.log");
@@ -8796,10 +9367,11 @@ sub _processParallelChunk
     $lcovutil::profileData{filt_child}{$chunkId} = $end - $start;
     my $data;
     eval {
-        $data = Storable::store([\@updates, $save, $state, $then,
-                                 lcovutil::compute_update($currentState)
-                                ],
-                                $dumpf);
+        $data = lcovutil::send_result($pipe,
+                                      [\@updates, $save, $state, $then,
+                                       lcovutil::compute_update($currentState)
+                                      ],
+                                      $dumpf);
     };
     if ($@ || !defined($data)) {
         lcovutil::ignorable_error($lcovutil::ERROR_PARALLEL,
@@ -8934,7 +9506,7 @@ sub _processFilterWorklist
                             . " remaining\n")
                         if ((($currentParallel + 1) * $currentSize) >
                             $lcovutil::maxMemory);
-                    my $child       = wait();
+                    my $child       = lcovutil::wait_child();
                     my $childstatus = $?;
                     unless (exists($children{$child})) {
                         lcovutil::report_unknown_child($child);
@@ -8955,10 +9527,12 @@ sub _processFilterWorklist
 
                 # parallel processing...
                 $lcovutil::deferWarnings = 1;
-                my $now = Time::HiRes::gettimeofday();
-                my $pid = fork();
+                my $now  = Time::HiRes::gettimeofday();
+                my $pipe = lcovutil::result_pipe();
+                my $pid  = fork();
                 if (!defined($pid)) {
                     # fork failed
+                    lcovutil::discard_result_pipe($pipe);
                     ++$failedAttempts;
                     lcovutil::report_fork_failure('process filter chunk',
                                                   $!, $failedAttempts);
@@ -8971,11 +9545,13 @@ sub _processFilterWorklist
                     # I'm the child
                     my $status =
                         _processParallelChunk($tmp, $d, $srcReader, \@save,
-                                              \@state, $now, _filterChunkId());
+                                              \@state, $now, _filterChunkId(),
+                                              $pipe);
                     exit($status);    # normal return
                 } else {
                     # parent
                     my $chunkId = _filterChunkId();
+                    lcovutil::expect_result($pid, $pipe);
                     $children{$pid} = [$d, $now, $chunkId];
                     lcovutil::debug(1, "fork:$pid ID $chunkId\n");
                     ++$currentParallel;
@@ -8985,7 +9561,7 @@ sub _processFilterWorklist
 
         }    # while (each segment in worklist)
         while ($currentParallel != 0) {
-            my $child       = wait();
+            my $child       = lcovutil::wait_child();
             my $childstatus = $?;
             unless (exists($children{$child})) {
                 lcovutil::report_unknown_child($child);
@@ -9022,6 +9598,11 @@ sub applyFilters
     return
         if ($mask == ($self->[STATE] & $mask));
 
+    if (tied(%{$self->[FILES]}) && !$self->_filtersNeedData()) {
+        $self->_applyNameFilters();
+        return;
+    }
+
     # have to look through each file in each testcase; they may be different
     # due to differences in #ifdefs when the corresponding tests were compiled.
     my @filter_workList;
@@ -9096,6 +9677,38 @@ sub applyFilters
     }
 }
 
+sub _filtersNeedData
+{
+    # return true if applyFilters has to look at the coverage data - rather
+    #  than just the file names
+    my $self = shift;
+    return 1 if lcovutil::is_filter_enabled();
+    return (0 == ($self->[STATE] & DID_DERIVE) &&
+            defined($lcovutil::derive_function_end_line) &&
+            $lcovutil::derive_function_end_line != 0 &&
+            defined($lcovutil::func_coverage));
+}
+
+sub _applyNameFilters
+{
+    # applyFilters for binary tracefile data when no filter needs to look at
+    #  the coverage data:  exclude files by name without reading them, and
+    #  check the consistency of the others when they are first used.
+    my $self = shift;
+    my $lazy = tied(%{$self->[FILES]});
+    foreach my $name ($self->files()) {
+        my $source_file = $lazy->name($name);
+        if (TraceFile::skipCurrentFile($source_file)) {
+            $self->remove($source_file);
+        } elsif (lcovutil::is_external($source_file)) {
+            lcovutil::info("excluding 'external' file '$source_file'\n");
+            $self->remove($source_file);
+        }
+    }
+    $lazy->check_consistency(1);
+    $self->[STATE] |= DID_DERIVE;
+}
+
 sub is_language
 {
     my ($lang, $filename) = @_;
@@ -9151,6 +9764,80 @@ sub is_language
 #
 # Die on error.
 #
+#
+# binary tracefile format:
+#   BINARY_MAGIC
+#   per-file data:  zlib-compressed Storable::nfreeze(TraceInfo) for each file
+#   index:  Storable::nfreeze({version, comments, state,
+#                              files => {name => [offset, length, totals]}})
+#   index offset:  8 bytes, big-endian
+# 'totals' is (lines found, hit, branches found, hit, functions found, hit,
+#   MC/DC found, hit) - so summaries do not need to read the per-file data.
+
+use constant {
+              BINARY_MAGIC   => "LCOVBIN1\n",
+              BINARY_VERSION => 1,
+};
+
+sub is_binary
+{
+    my $filename = shift;
+    my $magic    = '';
+    if (open(my $hdl, '<:raw', $filename)) {
+        read($hdl, $magic, length(BINARY_MAGIC));
+        close($hdl);
+    }
+    return $magic eq BINARY_MAGIC;
+}
+
+sub _read_binary
+{
+    # read the index of a binary tracefile - the per-file data is read when
+    #  it is first used.  Return 0 if this is not a binary tracefile.
+    my ($self, $tracefile) = @_;
+
+    return 0 unless -f $tracefile && TraceFile::is_binary($tracefile);
+    lcovutil::info(1, "Reading binary data file $tracefile\n");
+
+    open(my $hdl, '<:raw', $tracefile) or
+        die("unable to open $tracefile: $!\n");
+    my $size = -s $hdl;
+    my $trailer;
+    (sysseek($hdl, $size - 8, 0) &&
+     8 == sysread($hdl, $trailer, 8)) or
+        die("$tracefile: truncated binary tracefile\n");
+    my ($hi, $lo) = unpack('NN', $trailer);
+    my $offset = $hi * 4294967296 + $lo;
+    my $length = $size - 8 - $offset;
+    my $data   = '';
+    ($offset >= length(BINARY_MAGIC) &&
+     $length > 0 &&
+     sysseek($hdl, $offset, 0) &&
+     $length == sysread($hdl, $data, $length)) or
+        die("$tracefile: corrupt binary tracefile index\n");
+    close($hdl);
+    my $index = eval { Storable::thaw($data) };
+    ('HASH' eq ref($index) && exists($index->{files})) or
+        die("$tracefile: corrupt binary tracefile index\n");
+    die("$tracefile: unsupported binary tracefile version " .
+        $index->{version} . "\n")
+        unless $index->{version} == BINARY_VERSION;
+
+    my %files;
+    while (my ($name, $entry) = each(%{$index->{files}})) {
+        my $key = $lcovutil::case_insensitive ? lc($name) : $name;
+        $files{$key} = [$name, @$entry];
+    }
+    my %lazy;
+    tie(%lazy, 'LazyTraceFiles', $tracefile, \%files);
+    $self->[FILES] = \%lazy;
+    $self->add_comments(@{$index->{comments}});
+    # filters are re-applied with this run's options - but function end lines
+    #   need not be derived again
+    $self->[STATE] = $index->{state} & DID_DERIVE;
+    return 1;
+}
+
 sub _read_info
 {
     my ($self, $tracefile, $readSourceCallback, $verify_checksum) = @_;
@@ -9160,29 +9847,6 @@ sub _read_info
         $readSourceCallback = ReadCurrentSource->new();
     }
 
-    # per file data
-    my $sumcount;      # line total counts in this file
-    my $funcdata;      # function total counts in this file
-    my $sumbrcount;    # branch total counts
-    my $mcdcCount;     # MD/DC total counts
-
-    my $checkdata;     # line checksums
-        # hash of per-testcase coverage data per testcase, in this file
-    my $testdata;       # hash of testname -> line coverage
-    my $testfncdata;    # hash of testname -> function coverage
-    my $testbrdata;     # hash of testname -> branch data
-    my $testMcdc;       #     -> MC/DC data
-
-    my $lineMap;        # line coverage for particular testcase
-    my $funcMap;        # func coverage   "    "
-    my $branchMap;      # branch coverage "   "
-    my $mcdcMap;        # MC/DC coverage  "   "
-
-    my $testname;            # Current test name
-    my $filename;            # Current filename
-    my $current_mcdc;
-    my $changed_testname;    # If set, warn about changed testname
-
     lcovutil::info(1, "Reading data file $tracefile\n");
 
     # Check if file exists and is readable
@@ -9196,16 +9860,358 @@ sub _read_info
         die("not a plain file: $tracefile!\n");
     }
 
-    # Check for .gz extension
-    my $inFile = InOutFile->in($tracefile, $lcovutil::demangle_cpp_cmd);
-    local *INFO = $inFile->hdl();
+    my ($changed_testname, $testname);
+    my $segments = _split_info($tracefile);
+    if ($segments) {
+        ($changed_testname, $testname) =
+            $self->_read_info_parallel($tracefile, $readSourceCallback,
+                                       $verify_checksum, $segments);
+    } else {
+        ($changed_testname, $testname) =
+            $self->_parse_info($tracefile, $readSourceCallback,
+                               $verify_checksum);
+    }
 
-    $testname = "";
-    my $fileData;
-    my $functionMap;
-    my $skipCurrentFile = 0;
-    my %fnIdxMap;
-    my $branchBlock;
+    # Calculate lines_found and lines_hit for each file
+    foreach my $filename ($self->files()) {
+        my $filedata = $self->data($filename);
+
+        # Filter out empty files
+        if ($filedata->sum()->entries() == 0) {
+            delete($self->[FILES]->{$filename});
+            next;
+        }
+        # Filter out empty test cases
+        foreach $testname ($filedata->test()->keylist()) {
+            if (!$filedata->test()->mapped($testname) ||
+                $filedata->test($testname)->entries() == 0) {
+                $filedata->test()->remove($testname);
+                $filedata->testfnc()->remove($testname);
+                $filedata->testbr()->remove($testname);
+                $filedata->testcase_mcdc()->remove($testname);
+            }
+        }
+    }
+
+    if (scalar($self->files()) == 0) {
+        lcovutil::ignorable_error($lcovutil::ERROR_EMPTY,
+                              "no valid records found in tracefile $tracefile");
+    }
+    if (defined($changed_testname)) {
+        lcovutil::ignorable_warning($lcovutil::ERROR_FORMAT,
+                    "invalid characters removed from testname in " .
+                        "tracefile $tracefile: '$changed_testname'->'$testname'\n"
+        );
+    }
+}
+
+# return (testname, original name if invalid characters were replaced)
+sub _parse_testname
+{
+    my ($name, $diff, $where) = @_;
+    my $testname = defined($name) ? $name : "";
+    my $orig     = $testname;
+    my $changed;
+    if ($testname =~ s/\W/_/g) {
+        $changed = $orig;
+    }
+    $testname .= $diff if (defined($diff));
+    if (defined($ignore_testcase_name) &&
+        $ignore_testcase_name) {
+        lcovutil::debug(1,
+                  "using default  testcase rather than $testname at $where\n");
+
+        $testname = '';
+    }
+    return ($testname, $changed);
+}
+
+# Decide whether to parse '$tracefile' in parallel and, if so, find the
+#  segment boundaries:  split the file into (at most) '--parallel' byte
+#  ranges of similar size, each ending just after an 'end_of_record' line.
+#  This is a single pass over the file which looks only for newlines, and
+#  for 'end_of_record' and 'TN:' lines near the boundaries - so it is much
+#  cheaper than parsing.
+# The serial reader accumulates the MC/DC data of a source file which
+#  appears more than once into the same block - which merging segments
+#  cannot reproduce.  So, if MC/DC is enabled, also note which segments
+#  each source file with MC/DC data appears in, and read serially if
+#  any appears in more than one.
+# Return undef if the file should be read serially, else list of
+#  [start offset, end offset, first line number, last 'TN:' line before start]
+sub _split_info
+{
+    my $tracefile = shift;
+
+    return undef
+        if ($lcovutil::in_child_process ||
+            !defined($lcovutil::maxParallelism) ||
+            $lcovutil::maxParallelism < 2 ||
+            $tracefile =~ /\.gz$/ ||
+            $lcovutil::demangle_cpp_cmd);
+    my $size = (stat($tracefile))[7];
+    return undef
+        unless (exists($ENV{LCOV_FORCE_PARALLEL}) ||
+                (0 != $lcovutil::info_split_size &&
+                 $size >= $lcovutil::info_split_size));
+    my $count  = $lcovutil::maxParallelism;
+    my $target = $size / $count;
+
+    open(my $hdl, '<', $tracefile) or
+        die("cannot read file $tracefile: $!\n");
+    binmode($hdl);
+    my @segments;
+    my $start     = 0;    # current segment
+    my $startLine = 1;
+    my $startTN;
+    my $offset = 0;       # file offset of the text we are looking at
+    my $lineNo = 1;       # line number at $offset
+    my $tn;               # most recent 'TN:' line before $offset
+    my $tail   = '';      # trailing partial line from the previous block
+    my %sfSegments;       # source file -> segment index -> 1
+    my %sfMcdc;           # source files which have MC/DC data
+    my $sf = '';
+    my $scan = sub {
+        my $chunk = shift;
+        return unless $lcovutil::mcdc_coverage;
+        while ($chunk =~ /^(?:SF:([^\n]*)|MCDC:)/mg) {
+            if (defined($1)) {
+                $sf = ReadCurrentSource::resolve_path($1, 1);
+                $sfSegments{$sf}{scalar(@segments)} = 1;
+            } else {
+                $sfMcdc{$sf} = 1;
+            }
+        }
+    };
+    while (1) {
+        my $len = sysread($hdl, my $block, 4 << 20);
+        die("cannot read file $tracefile: $!\n") unless defined($len);
+        last unless $len;
+        my $text = $tail . $block;
+        # look at complete lines only
+        my $nl = rindex($text, "\n");
+        $tail = substr($text, $nl + 1, length($text) - $nl - 1, '');
+        my $pos = 0;    # part of $text already accounted for
+        while (scalar(@segments) < $count - 1) {
+            my $want = $start + $target - $offset;
+            last if $want >= length($text);
+            pos($text) = $want < $pos ? $pos : $want;
+            last unless $text =~ /^end_of_record[^\n]*\n/mg;
+            my $end   = pos($text);
+            my $chunk = substr($text, $pos, $end - $pos);
+            $scan->($chunk);
+            $lineNo += ($chunk =~ tr/\n//);
+            $tn = $1 if ($chunk =~ /.*^(TN:[^\n]*)/ms);
+            push(@segments, [$start, $offset + $end, $startLine, $startTN]);
+            ($start, $startLine, $startTN) = ($offset + $end, $lineNo, $tn);
+            $pos = $end;
+        }
+        my $chunk = substr($text, $pos);
+        $scan->($chunk);
+        $lineNo += ($chunk =~ tr/\n//);
+        $tn = $1 if ($chunk =~ /.*^(TN:[^\n]*)/ms);
+        $offset += length($text);
+    }
+    close($hdl) or die("unable to close $tracefile: $!\n");
+    push(@segments, [$start, $size, $startLine, $startTN])
+        if $start < $size;
+    foreach my $f (keys(%sfMcdc)) {
+        if (scalar(keys(%{$sfSegments{$f}})) > 1) {
+            lcovutil::info(1,
+                "$tracefile: MC/DC data for $f in more than one segment - reading serially\n"
+            );
+            return undef;
+        }
+    }
+    return scalar(@segments) > 1 ? \@segments : undef;
+}
+
+# parse each of the segments found by _split_info in a child process, then
+#  merge the results - in order, so the result is the same as serial parsing.
+# A segment whose child failed for any reason is parsed by the parent, so any
+#  error is reported in the usual way.
+# Return (changed testname, testname) - see _parse_info
+sub _read_info_parallel
+{
+    my ($self, $tracefile, $readSourceCallback, $verify_checksum, $segments) =
+        @_;
+    my $nSegments = scalar(@$segments);
+    lcovutil::info(1, "Reading $tracefile in $nSegments segments\n");
+
+    my $tmp = File::Temp->newdir(
+                          "read_datXXXX",
+                          DIR     => $lcovutil::tmp_dir,
+                          CLEANUP => !defined($lcovutil::preserve_intermediates)
+    );
+    my %children;
+    my @result;
+    my $next = 0;    # next segment to merge
+    my @changed;
+
+    my $merge = sub {
+        # merge completed segments, in order
+        while ($next < $nSegments && defined($result[$next])) {
+            my ($part, $stdout, $stderr, $update, @rtn) = @{$result[$next]};
+            print(STDOUT $stdout) if $stdout;
+            print(STDERR $stderr) if $stderr;
+            lcovutil::update_state(@$update) if $update;
+            @changed = @rtn if defined($rtn[0]);
+            $self->merge_tracefile($part, TraceInfo::UNION);
+            $result[$next++] = 0;    # release the data
+        }
+    };
+    my $serial = sub {
+        my $idx  = shift;
+        my $part = TraceFile->new();
+        my @rtn  =
+            $part->_parse_info($tracefile, $readSourceCallback,
+                               $verify_checksum, $segments->[$idx]);
+        $result[$idx] = [$part, undef, undef, undef, @rtn];
+    };
+
+    $lcovutil::deferWarnings = 1;
+    for (my $idx = 0; $idx < $nSegments; ++$idx) {
+        my $now  = Time::HiRes::gettimeofday();
+        my $pipe = lcovutil::result_pipe();
+        my $pid  = fork();
+        if (!defined($pid)) {
+            lcovutil::discard_result_pipe($pipe);
+            lcovutil::info(1, "fork() failed: parsing segment $idx serially\n");
+            $serial->($idx);
+            next;
+        }
+        if (0 == $pid) {
+            # I'm the child
+            my $id = $lcovutil::jobIdPrefix . $readSegmentIdx;
+            my $currentState = lcovutil::initial_state('read', $id);
+            my $part         = TraceFile->new();
+            my $status       = 0;
+            my @rtn;
+            my ($stdout, $stderr) = Capture::Tiny::capture {
+                eval {
+                    @rtn =
+                        $part->_parse_info($tracefile, $readSourceCallback,
+                                           $verify_checksum, $segments->[$idx]);
+                };
+                if ($@) {
+                    print(STDERR $@);
+                    $status = 1;
+                }
+                $lcovutil::profileData{read}{$id} =
+                    Time::HiRes::gettimeofday() - $now;
+            };
+            exit($status) if $status;
+            my $file = File::Spec->catfile($tmp, "read_$$");
+            my $data;
+            eval {
+                $data =
+                    lcovutil::send_result($pipe,
+                                          [$part, $stdout, $stderr,
+                                           lcovutil::compute_update(
+                                                                 $currentState),
+                                           @rtn
+                                          ],
+                                          $file);
+            };
+            exit(!$data || $@ ? 1 : 0);
+        }
+        lcovutil::expect_result($pid, $pipe);
+        $children{$pid} = $idx;
+        ++$readSegmentIdx;
+    }
+    while (%children) {
+        my $child = lcovutil::wait_child();
+        last if -1 == $child;
+        unless (exists($children{$child})) {
+            lcovutil::report_unknown_child($child);
+            next;
+        }
+        my $idx    = delete($children{$child});
+        my $status = $?;
+        my $file   = File::Spec->catfile($tmp, "read_$child");
+        $result[$idx] =
+            eval { (lcovutil::receive_result($child, $file, 0 == $status))[0] };
+        unlink($file) if -f $file;
+        if (!defined($result[$idx])) {
+            lcovutil::info(1,
+                      "segment $idx of $tracefile failed: parsing serially\n");
+            $serial->($idx);
+        }
+        $merge->();
+    }
+    # any child we lost track of
+    foreach my $idx (values(%children)) {
+        $serial->($idx);
+    }
+    $merge->();
+    return @changed;
+}
+
+# parse the .info file - or the segment [start, end) of it, if '$segment'
+#  is specified.
+# Return (changed testname, testname) so the caller can warn about invalid
+#  characters.
+sub _parse_info
+{
+    my ($self, $tracefile, $readSourceCallback, $verify_checksum, $segment) =
+        @_;
+
+    # per file data
+    my $sumcount;      # line total counts in this file
+    my $funcdata;      # function total counts in this file
+    my $sumbrcount;    # branch total counts
+    my $mcdcCount;     # MD/DC total counts
+
+    my $checkdata;     # line checksums
+        # hash of per-testcase coverage data per testcase, in this file
+    my $testdata;       # hash of testname -> line coverage
+    my $testfncdata;    # hash of testname -> function coverage
+    my $testbrdata;     # hash of testname -> branch data
+    my $testMcdc;       #     -> MC/DC data
+
+    my $lineMap;        # line coverage for particular testcase
+    my $funcMap;        # func coverage   "    "
+    my $branchMap;      # branch coverage "   "
+    my $mcdcMap;        # MC/DC coverage  "   "
+
+    my $testname;            # Current test name
+    my $filename;            # Current filename
+    my $current_mcdc;
+    my $changed_testname;    # If set, warn about changed testname
+
+    my $inFile;
+    my $segmentEnd;     # parse only up to here - see _split_info
+    my $segmentDone;
+    $testname = "";
+    if ($segment) {
+        my ($start, $end, $firstLine, $tnLine) = @$segment;
+        open($inFile, '<', $tracefile) or
+            die("cannot read file $tracefile: $!\n");
+        seek($inFile, $start, 0) or
+            die("cannot seek to $start in $tracefile: $!\n");
+        $segmentEnd = $end;
+        # testcase name from the last 'TN:' line before the segment
+        ($testname, $changed_testname) =
+            _parse_testname($1, $2, "$tracefile:" . ($firstLine - 1))
+            if (defined($tnLine) && $tnLine =~ /^TN:([^,]*)(,diff)?/);
+    } else {
+        # Check for .gz extension
+        $inFile = InOutFile->in($tracefile, $lcovutil::demangle_cpp_cmd);
+    }
+    local *INFO = $segment ? $inFile : $inFile->hdl();
+    if ($segment) {
+        # 'tell' makes INFO the handle which '$.' refers to - so messages
+        #  and file locations refer to the actual line number
+        die("unexpected position in $tracefile")
+            unless tell(INFO) == $segment->[0];
+        $. = $segment->[2] - 1;
+    }
+
+    my $fileData;
+    my $functionMap;
+    my $skipCurrentFile = 0;
+    my %fnIdxMap;
+    my $branchBlock;
     my $currentBlockLine;
     my $currentBlock;
     my $branchIndex;
@@ -9304,20 +10310,10 @@ sub _read_info
 
             /^TN:([^,]*)(,diff)?/ && do {
                 # Test name information found
-                $testname = defined($1) ? $1 : "";
-                my $orig = $testname;
-                if ($testname =~ s/\W/_/g) {
-                    $changed_testname = $orig;
-                }
-                $testname .= $2 if (defined($2));
-                if (defined($ignore_testcase_name) &&
-                    $ignore_testcase_name) {
-                    lcovutil::debug(1,
-                        "using default  testcase rather than $testname at $tracefile:$.\n"
-                    );
-
-                    $testname = '';
-                }
+                my $changed;
+                ($testname, $changed) =
+                    _parse_testname($1, $2, "$tracefile:$.");
+                $changed_testname = $changed if defined($changed);
                 last;
             };
 
@@ -9587,6 +10583,8 @@ sub _read_info
 
             /^end_of_record/ && do {
                 # Found end of section marker
+                $segmentDone = tell(INFO) >= $segmentEnd
+                    if defined($segmentEnd);
                 if ($filename) {
                     if (!defined($fileData->version()) &&
                         $lcovutil::compute_file_version &&
@@ -9638,43 +10636,9 @@ sub _read_info
             # default
             last;
         }
+        last if $segmentDone;
     }
-
-    # Calculate lines_found and lines_hit for each file
-    foreach $filename ($self->files()) {
-        #$data = $result{$filename};
-
-        ($testdata, $sumcount, undef, undef, $testfncdata, $testbrdata,
-         $sumbrcount) = $self->data($filename)->get_info();
-
-        # Filter out empty files
-        if ($self->data($filename)->sum()->entries() == 0) {
-            delete($self->[FILES]->{$filename});
-            next;
-        }
-        my $filedata = $self->data($filename);
-        # Filter out empty test cases
-        foreach $testname ($filedata->test()->keylist()) {
-            if (!$filedata->test()->mapped($testname) ||
-                $filedata->test($testname)->entries() == 0) {
-                $filedata->test()->remove($testname);
-                $filedata->testfnc()->remove($testname);
-                $filedata->testbr()->remove($testname);
-                $filedata->testcase_mcdc()->remove($testname);
-            }
-        }
-    }
-
-    if (scalar($self->files()) == 0) {
-        lcovutil::ignorable_error($lcovutil::ERROR_EMPTY,
-                              "no valid records found in tracefile $tracefile");
-    }
-    if (defined($changed_testname)) {
-        lcovutil::ignorable_warning($lcovutil::ERROR_FORMAT,
-                    "invalid characters removed from testname in " .
-                        "tracefile $tracefile: '$changed_testname'->'$testname'\n"
-        );
-    }
+    return ($changed_testname, $testname);
 }
 
 # write data to filename (stdout if '-')
@@ -9687,11 +10651,95 @@ sub write_info_file($$$)
         lcovutil::ignorable_error($lcovutil::ERROR_EMPTY,
                                   "coverage DB is empty");
     }
+    if ('binary' eq $lcovutil::tracefile_format) {
+        $self->write_binary($filename);
+        return;
+    }
     my $file = InOutFile->out($filename);
     my $hdl  = $file->hdl();
     $self->write_info($hdl, $do_checksum);
 }
 
+#
+# write data in binary format - see '_read_binary', above.
+# Data which was read from a binary tracefile and not used since is copied
+#   without being deserialized - unless it is to be checked for consistency.
+# Source file names are munged as for the .info format - unless '$keepNames'
+#   is set (e.g., to save intermediate data which will be read back).
+
+sub write_binary
+{
+    my ($self, $filename, $keepNames) = @_;
+
+    my $hdl;
+    if ('-' eq $filename) {
+        $hdl = \*STDOUT;
+    } else {
+        open($hdl, '>', $filename) or
+            die("unable to create $filename: $!\n");
+    }
+    binmode($hdl);
+    print($hdl BINARY_MAGIC);
+    my $offset = length(BINARY_MAGIC);
+    my %index;
+    my $files = $self->[FILES];
+    my $lazy  = tied(%$files);
+    foreach my $key (sort keys %$files) {
+        my ($name, $data, $totals) =
+            ($lazy && $lazy->deferred()) ? $lazy->raw($key) : ();
+        if (!defined($data) ||
+            (!$keepNames &&
+                ReadCurrentSource::resolve_path($name, 1) ne $name)
+        ) {
+            my $entry = $files->{$key};
+            die("expected TraceInfo, got '" . ref($entry) . "'")
+                unless ('TraceInfo' eq ref($entry));
+            $name = $entry->filename();
+            die("expected to have filtered $name out")
+                if lcovutil::is_external($name);
+            # munge the source file name, if requested
+            $name = ReadCurrentSource::resolve_path($name, 1)
+                unless $keepNames;
+            local $entry->[TraceInfo::FILENAME] = $name;
+            ($data, $totals) = _encode_binary($entry);
+        }
+        print($hdl $data);
+        $index{$name} = [$offset, length($data), @$totals];
+        $offset += length($data);
+    }
+    _write_binary_index($hdl, $offset, \%index, [$self->comments()],
+                        $self->[STATE]);
+    close($hdl) or die("unable to close $filename: $!\n")
+        unless '-' eq $filename;
+}
+
+# return (binary data, totals) for one TraceInfo
+sub _encode_binary
+{
+    my $entry = shift;
+    # fastest compression:  still smaller than the text format
+    return (Compress::Zlib::compress(Storable::nfreeze($entry), 1),
+            [$entry->found(), $entry->hit(),
+             $entry->branch_found(), $entry->branch_hit(),
+             $entry->function_found(), $entry->function_hit(),
+             $entry->mcdc_found(), $entry->mcdc_hit()
+            ]);
+}
+
+# write the index and the trailer, following the per-file data which ends
+#  at '$offset'
+sub _write_binary_index
+{
+    my ($hdl, $offset, $index, $comments, $state) = @_;
+    print($hdl Storable::nfreeze({version  => BINARY_VERSION,
+                                  comments => $comments,
+                                  state    => $state,
+                                  files    => $index
+                                 }
+          ),
+          pack('NN', int($offset / 4294967296), $offset % 4294967296));
+}
+
 #
 # write data in .info format
 # returns array of (lines found, lines hit, functions found, functions hit,
@@ -9710,7 +10758,11 @@ sub write_info($$$)
     foreach my $comment ($self->comments()) {
         print(INFO_HANDLE '#', $comment, "\n");
     }
+    # binary tracefile data which we read only in order to write it is
+    #  released again afterward - so we don't hold all of it at once
+    my $lazy = tied(%{$self->[FILES]});
     foreach my $filename (sort($self->files())) {
+        my $release     = $lazy && !$lazy->is_loaded($filename);
         my $entry       = $self->data($filename);
         my $source_file = $entry->filename();
         die("expected to have filtered $source_file out")
@@ -9905,9 +10957,200 @@ sub write_info($$$)
             print(INFO_HANDLE "LH:$hit\n");
             print(INFO_HANDLE "end_of_record\n");
         }
+        $lazy->release($filename) if $release;
     }
 }
 
+package LazyTraceFiles;
+# tied hash of file name -> TraceInfo, for data read from a binary tracefile:
+#  the data for each file is deserialized when it is first used.
+
+sub TIEHASH
+{
+    my ($class, $filename, $index) = @_;
+    # $index: key -> [file name, offset, length, totals...]
+    my $self = {filename => $filename,
+                index    => $index,
+                loaded   => {},
+                read     => {},    # index entries of files we deserialized
+                check    => 0,
+                hdl      => undef,
+                pid      => 0,
+                keys     => [],};
+    return bless $self, $class;
+}
+
+sub _handle
+{
+    my $self = shift;
+    # a forked child must not share the parent's file offset
+    if ($self->{pid} != $$) {
+        open(my $hdl, '<:raw', $self->{filename}) or
+            die("unable to open $self->{filename}: $!\n");
+        $self->{hdl} = $hdl;
+        $self->{pid} = $$;
+    }
+    return $self->{hdl};
+}
+
+sub raw
+{
+    # return (file name, serialized data, totals) for a file which has not
+    #   been read yet - or empty list
+    my ($self, $key) = @_;
+    my $entry = $self->{index}->{$key};
+    return () unless defined($entry);
+    my ($name, $offset, $length, @totals) = @$entry;
+    my $hdl  = $self->_handle();
+    my $data = '';
+    sysseek($hdl, $offset, 0) or
+        die("$self->{filename}: unable to seek: $!\n");
+    while (length($data) < $length) {
+        sysread($hdl, $data, $length - length($data), length($data)) or
+            die("$self->{filename}: unexpected end of file\n");
+    }
+    return ($name, $data, \@totals);
+}
+
+sub name
+{
+    my ($self, $key) = @_;
+    return exists($self->{loaded}->{$key}) ?
+        $self->{loaded}->{$key}->filename() :
+        $self->{index}->{$key}->[0];
+}
+
+sub totals
+{
+    # return the index totals for a file which has not been read yet - or
+    #  undef if its data must be read anyway:  the consistency check may
+    #  report errors and fix the data (see '_checkConsistency')
+    my ($self, $key) = @_;
+    return undef unless $self->deferred();
+    my $entry = $self->{index}->{$key};
+    return defined($entry) ? [@$entry[3 .. $#$entry]] : undef;
+}
+
+sub check_consistency
+{
+    my ($self, $check) = @_;
+    $self->{check} = $check;
+}
+
+sub deferred
+{
+    # may data which has not been read yet be used without deserializing it?
+    #  Not if it is to be checked for consistency first
+    my $self = shift;
+    return !($self->{check} && $lcovutil::check_data_consistency);
+}
+
+sub FETCH
+{
+    my ($self, $key) = @_;
+    my $loaded = $self->{loaded};
+    return $loaded->{$key} if exists($loaded->{$key});
+    my ($name, $data) = $self->raw($key);
+    return undef unless defined($data);
+    my $serialized = Compress::Zlib::uncompress($data);
+    my $info = defined($serialized) ? Storable::thaw($serialized) : undef;
+    die("$self->{filename}: corrupt data for $name\n")
+        unless 'TraceInfo' eq ref($info);
+    $info->location($self->{filename}, 0);
+    $self->{read}->{$key} = delete($self->{index}->{$key});
+    $loaded->{$key} = $info;
+    TraceFile::_checkConsistency($info) if $self->{check};
+    return $info;
+}
+
+sub is_loaded
+{
+    my ($self, $key) = @_;
+    return exists($self->{loaded}->{$key});
+}
+
+sub release
+{
+    # drop the deserialized data for a file we read, but did not replace:
+    #  it will be read again if it is used again.
+    # The caller must know that the data has not been modified.
+    my ($self, $key) = @_;
+    my $entry = delete($self->{read}->{$key});
+    return unless defined($entry);
+    delete($self->{loaded}->{$key});
+    $self->{index}->{$key} = $entry;
+}
+
+sub STORE
+{
+    my ($self, $key, $value) = @_;
+    delete($self->{index}->{$key});
+    delete($self->{read}->{$key});
+    $self->{loaded}->{$key} = $value;
+}
+
+sub EXISTS
+{
+    my ($self, $key) = @_;
+    return exists($self->{loaded}->{$key}) || exists($self->{index}->{$key});
+}
+
+sub DELETE
+{
+    my ($self, $key) = @_;
+    delete($self->{index}->{$key});
+    delete($self->{read}->{$key});
+    return delete($self->{loaded}->{$key});
+}
+
+sub CLEAR
+{
+    my $self = shift;
+    $self->{index}  = {};
+    $self->{loaded} = {};
+    $self->{read}   = {};
+}
+
+sub FIRSTKEY
+{
+    my $self = shift;
+    $self->{keys} = [keys(%{$self->{index}}), keys(%{$self->{loaded}})];
+    return shift(@{$self->{keys}});
+}
+
+sub NEXTKEY
+{
+    my $self = shift;
+    return shift(@{$self->{keys}});
+}
+
+sub SCALAR
+{
+    my $self = shift;
+    return scalar(keys(%{$self->{index}})) + scalar(keys(%{$self->{loaded}}));
+}
+
+# Storable (e.g., to return data from a child process):  read everything
+sub STORABLE_freeze
+{
+    my ($self, $cloning) = @_;
+    $self->FETCH($_) foreach (keys(%{$self->{index}}));
+    return ('', $self->{loaded});
+}
+
+sub STORABLE_thaw
+{
+    my ($self, $cloning, $serialized, $loaded) = @_;
+    %$self = (filename => undef,
+              index    => {},
+              loaded   => $loaded,
+              read     => {},
+              check    => 0,
+              hdl      => undef,
+              pid      => 0,
+              keys     => [],);
+}
+
 package AggregateTraces;
 # parse and merge TraceFiles - possibly in parallel
 #  - common utility, used by lcov 'add_trace' and genhtml multi-file read
@@ -9917,6 +11160,16 @@ package AggregateTraces;
 our $function_mapping;
 # need a static external segment index lest the exe aggregate multiple groups of data
 our $segmentIdx = 0;
+# ... and for the children which merge the results of adjacent segments
+our $mergeIdx = 0;
+# number of chunks per core that the tracefile list is divided into - see
+#   _size_chunks
+our $chunks_per_core = 4;
+# in-memory data is roughly this many times larger than its Storable image -
+#   used to estimate the memory needed to merge a bucket; see _external_merge
+our $storable_expansion = 10;
+# format version of the 'lcov --incremental-state' manifest
+our $incremental_version = 2;
 
 sub find_from_glob
 {
@@ -9974,6 +11227,40 @@ sub find_from_glob
     return @merge;
 }
 
+# return TraceFile - or undef if the file is missing, empty, or unreadable
+#  and the error is ignored
+sub _load_tracefile
+{
+    my ($tracefile, $readSourceFile) = @_;
+
+    if (!-f $tracefile ||
+        -z $tracefile) {
+        lcovutil::ignorable_error($lcovutil::ERROR_EMPTY,
+                                  "trace file '$tracefile' "
+                                      .
+                                      (-z $tracefile ? 'is empty' :
+                                           'does not exist'));
+        return undef;
+    }
+    my $now = Time::HiRes::gettimeofday();
+    my $current;
+    eval {
+        $current = TraceFile->load($tracefile, $readSourceFile,
+                                   $lcovutil::verify_checksum, 1);
+        lcovutil::debug("after load $tracefile: memory: " .
+                        lcovutil::current_process_size() . "\n")
+            if $lcovutil::debug;    # predicate to avoid function call...
+    };
+    $lcovutil::profileData{parse}{$tracefile} =
+        Time::HiRes::gettimeofday() - $now;
+    if ($@) {
+        lcovutil::ignorable_error($lcovutil::ERROR_CORRUPT,
+                                  "unable to read trace file '$tracefile': $@");
+        return undef;
+    }
+    return $current;
+}
+
 sub _process_segment($$$)
 {
     my ($total_trace, $readSourceFile, $segment) = @_;
@@ -9981,7 +11268,6 @@ sub _process_segment($$$)
     my @interesting;
     my $total = scalar(@$segment);
     foreach my $tracefile (@$segment) {
-        my $now = Time::HiRes::gettimeofday();
         --$total;
         lcovutil::info("Merging $tracefile..$total remaining"
                            .
@@ -9991,30 +11277,9 @@ sub _process_segment($$$)
                            "\n"
         ) if (1 != scalar(@$segment));    # ...in segment $segId
         my $context = MessageContext->new("merging $tracefile");
-        if (!-f $tracefile ||
-            -z $tracefile) {
-            lcovutil::ignorable_error($lcovutil::ERROR_EMPTY,
-                                      "trace file '$tracefile' "
-                                          .
-                                          (-z $tracefile ? 'is empty' :
-                                               'does not exist'));
-            next;
-        }
-        my $current;
-        eval {
-            $current = TraceFile->load($tracefile, $readSourceFile,
-                                       $lcovutil::verify_checksum, 1);
-            lcovutil::debug("after load $tracefile: memory: " .
-                            lcovutil::current_process_size() . "\n")
-                if $lcovutil::debug;    # predicate to avoid function call...
-        };
+        my $current = _load_tracefile($tracefile, $readSourceFile);
+        next unless defined($current);
         my $then = Time::HiRes::gettimeofday();
-        $lcovutil::profileData{parse}{$tracefile} = $then - $now;
-        if ($@) {
-            lcovutil::ignorable_error($lcovutil::ERROR_CORRUPT,
-                                  "unable to read trace file '$tracefile': $@");
-            next;
-        }
         if ($function_mapping) {
             foreach my $srcFileName ($current->files()) {
                 my $traceInfo = $current->data($srcFileName);
@@ -10046,6 +11311,1011 @@ sub _process_segment($$$)
     return @interesting;
 }
 
+# Divide the file list into contiguous chunks of similar total size:
+#  '$chunks_per_core' times as many chunks as we have cores, so that children
+#  which drew small chunks can pick up more work while others are still busy
+#  with large ones.  A file larger than the target size gets a chunk to itself.
+# Return list of [files, bytes], in file list order.
+sub _size_chunks
+{
+    my $filelist = shift;
+    my @sizes    = map({ (stat($_))[7] // 0 } @$filelist);
+    my $total    = 0;
+    $total += $_ foreach (@sizes);
+    my $target = $total / ($lcovutil::maxParallelism * $chunks_per_core);
+
+    my @chunks;
+    my ($current, $bytes) = ([], 0);
+    for (my $i = 0; $i <= $#$filelist; ++$i) {
+        if (@$current && $bytes + $sizes[$i] > $target) {
+            push(@chunks, [$current, $bytes]);
+            ($current, $bytes) = ([], 0);
+        }
+        push(@$current, $filelist->[$i]);
+        $bytes += $sizes[$i];
+    }
+    push(@chunks, [$current, $bytes]) if @$current;
+    return @chunks;
+}
+
+# merge segment result '$from' into '$into':  both are
+#  [TraceFile, effective tracefiles, function map] - as returned by a child
+sub _combine_segment
+{
+    my ($into, $from) = @_;
+    my ($trace, $effective, $func_map) = @$into;
+    my ($current, $changed, $map) = @$from;
+
+    if ($function_mapping) {
+        die("segment returned empty function data") unless defined($map);
+        while (my ($key, $data) = each(%$map)) {
+            $func_map->{$key} = [$data->[0], []]
+                unless exists($func_map->{$key});
+            die("mismatched function name '" . $data->[0] . "' at $key")
+                unless ($data->[0] eq $func_map->{$key}->[0]);
+            push(@{$func_map->{$key}->[1]}, @{$data->[1]});
+        }
+    } else {
+        die("segment returned empty trace data") unless defined($current);
+        if ($trace->merge_tracefile($current, TraceInfo::UNION)) {
+            # something in this segment improved coverage...so save
+            #   the effective input files from this one
+            push(@$effective, @$changed);
+        }
+    }
+}
+
+# find two adjacent completed ranges of chunks which can be merged.
+#  A range which has no data (its child failed, and the error was ignored)
+#  is simply absorbed by its neighbour.
+# Return merge task or undef.
+sub _next_merge
+{
+    my $done = shift;
+    foreach my $first (sort({ $a <=> $b } keys(%$done))) {
+        my $left = $done->{$first};
+        next unless defined($left);
+        my $right = $done->{$left->[1] + 1};
+        next unless defined($right);
+        delete($done->{$right->[0]});
+        if (!defined($left->[2]) || !defined($right->[2])) {
+            $done->{$first} = [$first, $right->[1],
+                               defined($left->[2]) ? @$left[2, 3] :
+                                   @$right[2, 3]
+            ];
+            return _next_merge($done);
+        }
+        delete($done->{$first});
+        return ['merge', $first, $right->[1], $left, $right];
+    }
+    return undef;
+}
+
+# executed in a child process:  parse a chunk of tracefiles, or merge the
+#  results of two adjacent ranges of chunks.  Save result for the next
+#  merge, send our state to the parent, then exit.
+sub _run_task
+{
+    my ($task, $id, $start, $total_trace, $readSourceFile, $tempDir, $pipe) =
+        @_;
+    my $type = $task->[0];
+
+    my $stdout_file = File::Spec->catfile($tempDir, "lcov_$$.log");
+    my $stderr_file = File::Spec->catfile($tempDir, "lcov_$$.err");
+
+    # phase label matches the key of the task's profile data:  {$id}{total}
+    #  for a parse, tree_merge{$id} for a merge
+    my $currentState =
+        lcovutil::initial_state('parse' eq $type ? 'aggregate' : 'tree_merge',
+                                $id);
+    my $status = 0;
+    my $result;
+    my ($stdout, $stderr, $code) = Capture::Tiny::capture {
+        eval {
+            if ('parse' eq $type) {
+                my @interesting =
+                    _process_segment($total_trace, $readSourceFile,
+                                     $task->[3]);
+                $result = [$total_trace, \@interesting, $function_mapping];
+            } else {
+                my ($left, $right) =
+                    map({ Storable::retrieve($_->[2]) or
+                              die("unable to retrieve " . $_->[2] . "\n") }
+                        @$task[3, 4]);
+                _combine_segment($left, $right);
+                $result = $left;
+            }
+        };
+        if ($@) {
+            print(STDERR $@);
+            $status = 1;
+        }
+        $lcovutil::profileData{$id}{total} =
+            Time::HiRes::gettimeofday() - $start
+            if ('parse' eq $type);
+    };
+    # print stdout and stderr ...
+    foreach my $d ([$stdout_file, $stdout], [$stderr_file, $stderr]) {
+        next
+            unless ($d->[1]);    # only print if there is something to print
+        my $f = InOutFile->out($d->[0]);
+        my $h = $f->hdl();
+        print($h $d->[1]);
+    }
+    if (0 == $status) {
+        # the data, and (separately) our state update - the parent reads
+        #  only the latter.  The data is read by another child, so it
+        #  goes into a file
+        my $file  = File::Spec->catfile($tempDir, "dumper_$$");
+        my $state = File::Spec->catfile($tempDir, "state_$$");
+        my $data;
+        eval {
+            $data = Storable::store($result, $file) &&
+                lcovutil::send_result($pipe,
+                                      lcovutil::compute_update($currentState),
+                                      $state);
+        };
+        if ($@ || !defined($data)) {
+            lcovutil::ignorable_error($lcovutil::ERROR_PARALLEL,
+                              "Child $$ serialize failed" . ($@ ? ": $@" : ''));
+        }
+    }
+    exit($status);
+}
+
+# Parallel implementation:
+#  - divide the file list into contiguous chunks of similar total size (see
+#    _size_chunks) - more chunks than we have cores.
+#  - parse-and-merge each chunk in a child.  Chunks are handed out largest
+#    first, whenever a child slot is free - so children which finish early
+#    pick up more work, and a chunk of large files is not queued behind
+#    others in a static segment.
+#  - as soon as two adjacent ranges of chunks are complete, fork a child to
+#    merge them.  Only adjacent ranges are merged, so data is combined in
+#    file list order (as it is when merging serially), and the reduction
+#    is a tree whose depth is log2 of the number of chunks.  Merges are
+#    scheduled before new chunks, to keep the amount of pending data small.
+#  - the parent reads only the state updates from its children - not their
+#    data - until the single remaining result, which it loads and merges
+#    into '$total_trace':  one union rather than one per segment.
+# The reasoning is that one of our examples appears to take 1.3s to load
+#   the trace file, and 0.8s to merge it into the master list - so we want
+#   to parallelize both the load and the merge, as much as possible.
+# Note that we keep adjacent files in the same chunk.  This plays more
+#   nicely with the "--prune-tests" option because we expect that files with
+#   similar names (e.g., as returned by 'glob') have similar coverage profiles
+#   and are thus not likely to all be 'effective'.  If we had put them into
+#   different chunks, then each might think that their variant is 'effective'.
+# Return list of effective tracefiles.
+sub _parallel_merge
+{
+    my ($total_trace, $readSourceFile, $filelist) = @_;
+
+    my @chunks  = _size_chunks($filelist);
+    my $nChunks = scalar(@chunks);
+    lcovutil::info("Using $nChunks segment" .
+                   ($nChunks > 1 ? 's' : '') .
+                   ' for ' . scalar(@$filelist) . " tracefiles\n");
+    $lcovutil::profileData{config} = {}
+        unless exists($lcovutil::profileData{config});
+    $lcovutil::profileData{config}{segments} = $nChunks;
+
+    # kind of a hack...write to the named directory that the user gave
+    #   us rather than to a funny generated name
+    my $tempDir = defined($lcovutil::tempdirname) ? $lcovutil::tempdirname :
+        lcovutil::create_temp_dir();
+
+    # task: [type, first chunk, last chunk, ...]
+    #   'parse': [.., tracefiles, bytes]
+    #   'merge': [.., left range, right range]
+    # completed range: [first chunk, last chunk, dumpfile or undef,
+    #                   label of the job which produced it]
+    my @queue = sort({ $b->[4] <=> $a->[4] or $a->[1] <=> $b->[1] }
+                     map({ ['parse', $_, $_, @{$chunks[$_]}] }
+                         0 .. $nChunks - 1));
+    my %done;    # first chunk -> completed range
+    my %children;
+    my %childRetryCounts;
+    my $failedAttempts = 0;
+    my @effective;
+
+    while (%children || @queue || scalar(keys(%done)) > 1) {
+        while (scalar(keys(%children)) < $lcovutil::maxParallelism) {
+            my $task = _next_merge(\%done) // shift(@queue);
+            last unless defined($task);
+            my $id =
+                'parse' eq $task->[0] ? $segmentIdx++ :
+                ($lcovutil::jobIdPrefix . $mergeIdx++);
+            $lcovutil::deferWarnings = 1;
+            my $now  = Time::HiRes::gettimeofday();
+            my $pipe = lcovutil::result_pipe();
+            my $pid  = fork();
+            if (!defined($pid)) {
+                lcovutil::discard_result_pipe($pipe);
+                ++$failedAttempts;
+                lcovutil::report_fork_failure(
+                                   "process segment", $!, $failedAttempts);
+                if ('parse' eq $task->[0]) {
+                    unshift(@queue, $task);
+                } else {
+                    $done{$_->[0]} = $_ foreach (@$task[3, 4]);
+                }
+                last;
+            }
+            $failedAttempts = 0;
+            if (0 == $pid) {
+                # I'm the child
+                _run_task($task, $id, $now, $total_trace, $readSourceFile,
+                          $tempDir, $pipe);
+            }
+            lcovutil::expect_result($pid, $pipe);
+            $children{$pid} = [$task, $now, $id];
+            # the jobs whose results this one merges - see 'spreadsheet.py'
+            $lcovutil::profileData{tree_merge_inputs}{$id} =
+                [map({ $_->[3] } @$task[3, 4])]
+                if 'merge' eq $task->[0];
+        }
+        # a fork failed with nothing running:  try again
+        next unless %children;
+
+        my $child       = lcovutil::wait_child();
+        my $now         = Time::HiRes::gettimeofday();
+        my $raw_status  = $?;
+        my $childstatus = $raw_status >> 8;
+        my $signal      = $raw_status & 0xFF;
+        unless (exists($children{$child})) {
+            lcovutil::report_unknown_child($child);
+            next;
+        }
+        my ($task, $start, $id) = @{delete($children{$child})};
+        my ($type, $first, $last) = @$task;
+        my $label = ('parse' eq $type ? 'aggregate_' : 'tree_merge_') . $id;
+        lcovutil::info(1,
+                       "Finished $type segment $id, status $childstatus" .
+                           ($lcovutil::debug ?
+                                (' mem:' . lcovutil::current_process_size()) :
+                                '') .
+                           "\n");
+        my $dumpfile  = File::Spec->catfile($tempDir, "dumper_$child");
+        my $statefile = File::Spec->catfile($tempDir, "state_$child");
+        my $childLog  = File::Spec->catfile($tempDir, "lcov_$child.log");
+        my $childErr  = File::Spec->catfile($tempDir, "lcov_$child.err");
+
+        foreach my $f ($childLog, $childErr) {
+            if (!-f $f) {
+                $f = '';    # there was no output
+                next;
+            }
+            if (open(RESTORE, "<", $f)) {
+                # slurp into a string and eval..
+                my $str = do { local $/; <RESTORE> };    # slurp whole thing
+                close(RESTORE) or die("unable to close $f: $!\n");
+                unlink $f
+                    unless ($str && $lcovutil::preserve_intermediates);
+                $f = $str;
+            } else {
+                $f = "unable to open $f: $!";
+                if (0 == $childstatus) {
+                    lcovutil::report_parallel_error('aggregate',
+                                            $ERROR_PARALLEL, $child, 0, $f,
+                                            keys(%children));
+                }
+            }
+        }
+        print(STDOUT $childLog)
+            if ((0 != $childstatus &&
+                 $signal != POSIX::SIGKILL &&
+                 $lcovutil::max_fork_fails != 0) ||
+                $lcovutil::verbose);
+        print(STDERR $childErr);
+
+        my $update;
+        if (0 == $childstatus && -f $dumpfile) {
+            eval { ($update) = lcovutil::receive_result($child, $statefile); };
+            if ($@ || !defined($update)) {
+                $childstatus = 1 << 8 unless $childstatus;
+                lcovutil::report_parallel_error('aggregate',
+                                     $ERROR_PARALLEL, $child, $childstatus,
+                                     "unable to deserialize segment $id:$@",
+                                     keys(%children));
+            }
+        } else {
+            lcovutil::receive_result($child, $statefile, 0);    # discard
+        }
+        unlink $statefile if -f $statefile;
+        if (defined($update)) {
+            lcovutil::update_state(@$update);
+            $done{$first} = [$first, $last, $dumpfile, $label];
+            if ('merge' eq $type) {
+                unlink($_->[2]) foreach (@$task[3, 4]);
+            }
+        } elsif (!-f $dumpfile ||
+                 POSIX::SIGKILL == $signal) {
+            # try again
+            $childRetryCounts{$id} += 1;
+            lcovutil::report_fork_failure(
+                             "aggregate segment $id",
+                             (POSIX::SIGKILL == $signal ?
+                                  "killed by OS - possibly due to out-of-memory"
+                              :
+                                  "serialized data $dumpfile not found"),
+                             $childRetryCounts{$id});
+            if ('parse' eq $type) {
+                unshift(@queue, $task);
+            } else {
+                $done{$_->[0]} = $_ foreach (@$task[3, 4]);
+            }
+        } else {
+            lcovutil::report_parallel_error('aggregate',
+                                            $ERROR_CHILD, $child, $childstatus,
+                                            "while processing segment $id",
+                                            keys(%children));
+            # error was ignored:  lose the data from this segment.  If a
+            #  merge failed, then its inputs are fine:  merge them here
+            #  instead - out of order, but nothing is lost
+            if ('merge' eq $type) {
+                foreach my $range (@$task[3, 4]) {
+                    _combine_dump($total_trace, \@effective, $range->[2]);
+                }
+            }
+            $done{$first} = [$first, $last, undef, $label];
+            unlink $dumpfile if -f $dumpfile;
+        }
+        my $end = Time::HiRes::gettimeofday();
+        if ('parse' eq $type) {
+            $lcovutil::profileData{$id}{undump} = $end - $now;
+            $lcovutil::profileData{$id}{merge}  = $end - $start;
+        } else {
+            $lcovutil::profileData{tree_merge}{$id} = $now - $start;
+        }
+    }
+
+    # and finally, the one remaining result
+    my @result = values(%done);
+    die("unexpected segment count " . scalar(@result))
+        unless scalar(@result) <= 1;
+    if (@result && defined($result[0]->[2])) {
+        my $then = Time::HiRes::gettimeofday();
+        _combine_dump($total_trace, \@effective, $result[0]->[2]);
+        $lcovutil::profileData{final_union} =
+            Time::HiRes::gettimeofday() - $then;
+    }
+    return @effective;
+}
+
+# merge the data which a child saved in '$dumpfile' (if any) into
+#  '$total_trace' - then remove the file
+sub _combine_dump
+{
+    my ($total_trace, $effective, $dumpfile) = @_;
+    return unless defined($dumpfile);
+    eval {
+        my $data = Storable::retrieve($dumpfile) or
+            die("unable to retrieve $dumpfile\n");
+        _combine_segment([$total_trace, $effective, $function_mapping], $data);
+    };
+    if ($@) {
+        lcovutil::ignorable_error($ERROR_PARALLEL,
+                                "unable to deserialize merged data $dumpfile: $@");
+    }
+    unlink $dumpfile;
+}
+
+# External (out-of-core) merge - used if 'merge_memory_budget' is set:
+#  - 'spill':  read the tracefiles - in contiguous chunks, one per child -
+#    and append each source file record (tracefile index, Storable data)
+#    to one of 'merge_buckets' files, chosen by a hash of the source file
+#    name.  Only one tracefile and a bounded amount of buffered output are
+#    held in memory at any time.
+#  - 'bucket':  merge groups of buckets whose estimated size fits in the
+#    budget.  Records are merged in tracefile order - so the 'effective'
+#    tracefiles (see '--prune-tests') are the same as when merging in
+#    memory:  a tracefile is effective if it improved the coverage of any
+#    of its source files.  Filters are applied to the merged data, which is
+#    written in binary tracefile format.
+#  - concatenate the binary segments into a single file, which becomes the
+#    (lazily loaded) data of '$total_trace' - see LazyTraceFiles.
+# The budget is shared by the processes which run at the same time.  It
+#  cannot be smaller than what is needed to hold the largest single input
+#  tracefile, or the merged data of the largest source file.
+# Return list of effective tracefiles.
+sub _external_merge
+{
+    my ($total_trace, $readSourceFile, $filelist, $filters) = @_;
+
+    my $nBuckets = $lcovutil::merge_buckets;
+    die("invalid 'merge_buckets' value \"$nBuckets\" - expected positive integer"
+    ) unless ($nBuckets =~ /^[0-9]+$/ && $nBuckets > 0);
+    my $parallel = $lcovutil::maxParallelism;
+    my $share    = $lcovutil::merge_memory_budget * (1 << 20) / $parallel;
+    my $dir      = lcovutil::create_temp_dir();
+
+    my @chunks;
+    if (1 == $parallel) {
+        @chunks = ([$filelist, 0]);
+    } else {
+        local $chunks_per_core = 1;
+        @chunks = _size_chunks($filelist);
+    }
+    my @tasks;
+    my $first = 0;
+    for (my $i = 0; $i <= $#chunks; ++$i) {
+        my $files = $chunks[$i]->[0];
+        push(@tasks, [$i, $first, $files]);
+        $first += scalar(@$files);
+    }
+    lcovutil::info("Spilling " . scalar(@$filelist) .
+                   " tracefiles to $nBuckets buckets\n");
+    my @spilled = _run_external(
+        'spill',
+        \@tasks,
+        sub {
+            my ($chunk, $first, $files) = @{$_[0]};
+            # keep buffered output to a fraction of the budget
+            return
+                _spill_chunk($readSourceFile, $files, $first, $chunk, $dir,
+                             $share / 4);
+        },
+        $dir);
+
+    # largest record of each source file, in each bucket:  approximately
+    #   the size of the merged data
+    my (@comments, %sizes);
+    foreach my $r (@spilled) {
+        push(@comments, @{$r->[0]});
+        while (my ($bucket, $files) = each(%{$r->[1]})) {
+            my $max = $sizes{$bucket} //= {};
+            while (my ($key, $length) = each(%$files)) {
+                $max->{$key} = $length
+                    if ($max->{$key} // 0) < $length;
+            }
+        }
+    }
+    @spilled = ();
+    my %estimate;
+    my $total = 0;
+    foreach my $bucket (keys(%sizes)) {
+        my $bytes = 0;
+        $bytes += $_ foreach (values(%{$sizes{$bucket}}));
+        $estimate{$bucket} = $bytes * $storable_expansion;
+        $total += $estimate{$bucket};
+    }
+    %sizes = ();
+    # group adjacent buckets - but make at least one group per process
+    my $target = $total / $parallel;
+    $target = $share if $share < $target;
+    my @batches;
+    my ($current, $bytes) = ([], 0);
+    foreach my $bucket (sort({ $a <=> $b } keys(%estimate))) {
+        my $size = $estimate{$bucket};
+        lcovutil::info(
+                   "bucket $bucket estimated size " . int($size / (1 << 20)) .
+                       "MB exceeds memory budget:  increase 'merge_buckets'\n")
+            if $size > $share;
+        if (@$current && $bytes + $size > $target) {
+            push(@batches, $current);
+            ($current, $bytes) = ([], 0);
+        }
+        push(@$current, $bucket);
+        $bytes += $size;
+    }
+    push(@batches, $current) if @$current;
+    lcovutil::info("Merging $nBuckets buckets in " . scalar(@batches) .
+                   " group" . (1 == scalar(@batches) ? '' : 's') . "\n");
+    my @merged = _run_external(
+        'bucket',
+        [map({ [$_, $batches[$_]] } 0 .. $#batches)],
+        sub {
+            my ($batch, $buckets) = @{$_[0]};
+            return
+                _merge_buckets($readSourceFile, $buckets, scalar(@chunks),
+                               $dir, File::Spec->catfile($dir, "merged_$batch"),
+                               $filters);
+        },
+        $dir);
+    unless ($lcovutil::preserve_intermediates) {
+        for (my $chunk = 0; $chunk <= $#chunks; ++$chunk) {
+            unlink(File::Spec->catfile($dir, "spill_${chunk}_$_"))
+                foreach (0 .. $nBuckets - 1);
+        }
+    }
+
+    # and concatenate the segments
+    my $then  = Time::HiRes::gettimeofday();
+    my $store = File::Spec->catfile($dir, 'merged.bin');
+    open(my $hdl, '>:raw', $store) or
+        die("unable to create $store: $!\n");
+    print($hdl TraceFile::BINARY_MAGIC);
+    my $offset = length(TraceFile::BINARY_MAGIC);
+    my (%index, %effective);
+    for (my $batch = 0; $batch <= $#merged; ++$batch) {
+        my ($segment, $changed) = @{$merged[$batch]};
+        $effective{$_} = 1 foreach (@$changed);
+        while (my ($name, $entry) = each(%$segment)) {
+            $index{$name} = [$offset + $entry->[0], @$entry[1 .. $#$entry]];
+        }
+        my $f = File::Spec->catfile($dir, "merged_$batch");
+        open(my $in, '<:raw', $f) or die("unable to open $f: $!\n");
+        my $data;
+        while (my $n = read($in, $data, 1 << 20)) {
+            print($hdl $data);
+            $offset += $n;
+        }
+        close($in);
+        unlink($f) unless $lcovutil::preserve_intermediates;
+    }
+    # filters were applied to each group
+    my $state = TraceFile::DID_FILTER | TraceFile::DID_DERIVE;
+    TraceFile::_write_binary_index($hdl, $offset, \%index, \@comments, $state);
+    close($hdl) or die("unable to close $store: $!\n");
+    $total_trace->_read_binary($store);
+    $total_trace->[TraceFile::STATE] = $state;
+    $lcovutil::profileData{final_union} = Time::HiRes::gettimeofday() - $then;
+
+    return map({ $filelist->[$_] } sort({ $a <=> $b } keys(%effective)));
+}
+
+# write the source file records of the tracefiles in '$files' - the first
+#  of which is number '$first' in the complete list - to the bucket files
+#  of chunk '$chunk'.  Output is buffered up to '$limit' bytes.
+# Return [comments, {bucket => {source file => largest record size}}]
+sub _spill_chunk
+{
+    my ($readSourceFile, $files, $first, $chunk, $dir, $limit) = @_;
+    my $nBuckets = $lcovutil::merge_buckets;
+    my (%buffer, %sizes, @comments);
+    my $buffered = 0;
+    my $flush    = sub {
+        while (my ($bucket, $data) = each(%buffer)) {
+            my $f = File::Spec->catfile($dir, "spill_${chunk}_$bucket");
+            open(my $hdl, '>>:raw', $f) or die("unable to open $f: $!\n");
+            print($hdl $data);
+            close($hdl) or die("unable to close $f: $!\n");
+        }
+        %buffer   = ();
+        $buffered = 0;
+    };
+    # a task which failed in a child is run again - so start from scratch
+    unlink(File::Spec->catfile($dir, "spill_${chunk}_$_"))
+        foreach (0 .. $nBuckets - 1);
+
+    my $total = scalar(@$files);
+    my $idx   = $first;
+    foreach my $tracefile (@$files) {
+        my $fileIdx = $idx++;
+        --$total;
+        lcovutil::info("Merging $tracefile..$total remaining\n")
+            if (1 != scalar(@$files));
+        my $context = MessageContext->new("merging $tracefile");
+        my $current = _load_tracefile($tracefile, $readSourceFile);
+        next unless defined($current);
+        my $then = Time::HiRes::gettimeofday();
+        push(@comments, $current->comments());
+        foreach my $key ($current->files()) {
+            my $data   = Storable::nfreeze($current->data($key));
+            my $length = length($data);
+            my $bucket = unpack('N', Digest::MD5::md5($key)) % $nBuckets;
+            $buffer{$bucket} .= pack('NN', $fileIdx, $length) . $data;
+            $buffered += $length + 8;
+            my $max = \$sizes{$bucket}{$key};
+            $$max = $length if (!defined($$max) || $$max < $length);
+        }
+        $flush->() if $buffered > $limit;
+        $lcovutil::profileData{append}{$tracefile} =
+            Time::HiRes::gettimeofday() - $then;
+    }
+    $flush->();
+    return [\@comments, \%sizes];
+}
+
+# merge the records in buckets '@$buckets' of each of the '$nChunks' chunks,
+#  apply filters, and write the result in binary format to '$out'.
+# Return [{source file => [offset, length, totals]}, [effective indices]]
+sub _merge_buckets
+{
+    my ($readSourceFile, $buckets, $nChunks, $dir, $out, $filters) = @_;
+
+    my $trace = TraceFile->new();
+    my %effective;
+    foreach my $bucket (@$buckets) {
+        for (my $chunk = 0; $chunk < $nChunks; ++$chunk) {
+            my $f = File::Spec->catfile($dir, "spill_${chunk}_$bucket");
+            next unless -f $f;
+            open(my $hdl, '<:raw', $f) or die("unable to open $f: $!\n");
+            my ($header, $data);
+            while (8 == read($hdl, $header, 8)) {
+                my ($fileIdx, $length) = unpack('NN', $header);
+                $length == read($hdl, $data, $length) or
+                    die("$f: unexpected end of file\n");
+                my $info = Storable::thaw($data);
+                my $name = $info->filename();
+                if (!$trace->contains($name)) {
+                    $trace->insert($name, $info);
+                    $effective{$fileIdx} = 1;
+                } elsif ($trace->data($name)
+                         ->merge($info, TraceInfo::UNION, $name)) {
+                    $effective{$fileIdx} = 1;
+                }
+            }
+            close($hdl);
+        }
+    }
+    # filters had been disabled while reading the tracefiles
+    lcovutil::reenable_cov_filters($filters);
+    $trace->applyFilters($readSourceFile);
+    lcovutil::disable_cov_filters();
+
+    open(my $hdl, '>:raw', $out) or die("unable to create $out: $!\n");
+    my %index;
+    my $offset = 0;
+    foreach my $key ($trace->files()) {
+        my $entry = $trace->data($key);
+        my ($data, $totals) = TraceFile::_encode_binary($entry);
+        print($hdl $data);
+        $index{$entry->filename()} = [$offset, length($data), @$totals];
+        $offset += length($data);
+    }
+    close($hdl) or die("unable to close $out: $!\n");
+    return [\%index, [keys(%effective)]];
+}
+
+# run '$work->($task)' for each of '@$tasks' - in up to '--parallel' child
+#  processes.  A task whose child failed is run again in this process, so
+#  that errors are reported (or ignored) as usual.
+# Return list of results, in task order.
+sub _run_external
+{
+    my ($phase, $tasks, $work, $dir) = @_;
+    my @result;
+    my $serial = sub {
+        my $idx = shift;
+        my $now = Time::HiRes::gettimeofday();
+        $result[$idx] = $work->($tasks->[$idx]);
+        $lcovutil::profileData{$phase}{$lcovutil::jobIdPrefix . $idx} =
+            Time::HiRes::gettimeofday() - $now;
+    };
+    if (1 == $lcovutil::maxParallelism) {
+        $serial->($_) foreach (0 .. $#$tasks);
+        return @result;
+    }
+
+    $lcovutil::deferWarnings = 1;
+    my %children;
+    my $next = 0;
+    while ($next <= $#$tasks || %children) {
+        if ($next <= $#$tasks &&
+            scalar(keys(%children)) < $lcovutil::maxParallelism) {
+            my $idx  = $next++;
+            my $now  = Time::HiRes::gettimeofday();
+            my $pipe = lcovutil::result_pipe();
+            my $pid  = fork();
+            if (!defined($pid)) {
+                lcovutil::discard_result_pipe($pipe);
+                lcovutil::info(1,
+                       "fork() failed: running $phase task $idx serially\n");
+                $serial->($idx);
+                next;
+            }
+            if (0 == $pid) {
+                # I'm the child
+                my $id           = $lcovutil::jobIdPrefix . $idx;
+                my $currentState = lcovutil::initial_state($phase, $id);
+                my $status       = 0;
+                my $rtn;
+                my ($stdout, $stderr) = Capture::Tiny::capture {
+                    eval { $rtn = $work->($tasks->[$idx]); };
+                    if ($@) {
+                        print(STDERR $@);
+                        $status = 1;
+                    }
+                    $lcovutil::profileData{$phase}{$id} =
+                        Time::HiRes::gettimeofday() - $now;
+                };
+                exit($status) if $status;
+                my $file = File::Spec->catfile($dir, "${phase}_$$");
+                my $data;
+                eval {
+                    $data =
+                        lcovutil::send_result($pipe,
+                                   [$rtn, $stdout, $stderr,
+                                    lcovutil::compute_update($currentState)
+                                   ],
+                                   $file);
+                };
+                exit(!$data || $@ ? 1 : 0);
+            }
+            lcovutil::expect_result($pid, $pipe);
+            $children{$pid} = $idx;
+            next;
+        }
+        my $child = lcovutil::wait_child();
+        last if -1 == $child;
+        unless (exists($children{$child})) {
+            lcovutil::report_unknown_child($child);
+            next;
+        }
+        my $idx  = delete($children{$child});
+        my $file = File::Spec->catfile($dir, "${phase}_$child");
+        my $data =
+            eval { (lcovutil::receive_result($child, $file, 0 == $?))[0] };
+        unlink($file) if -f $file;
+        if (defined($data)) {
+            my ($rtn, $stdout, $stderr, $update) = @$data;
+            print(STDOUT $stdout) if $stdout;
+            print(STDERR $stderr) if $stderr;
+            lcovutil::update_state(@$update);
+            $result[$idx] = $rtn;
+        } else {
+            lcovutil::info(1, "$phase task $idx failed: running it serially\n");
+            $serial->($idx);
+        }
+    }
+    # any child we lost track of
+    $serial->($_) foreach (values(%children));
+    return @result;
+}
+
+# Incremental merge - see 'lcov --incremental-state'.  '$dir' holds the
+#  merged (and filtered) data from previous runs, in binary tracefile
+#  format, and a manifest of the tracefiles which were folded in:
+#  path -> [size, mtime, digest, source files].
+#  - a tracefile whose size and mtime - or else digest - match the manifest
+#    is not read again.
+#  - a new tracefile is read and merged into the saved data.
+#  - if a tracefile has changed, the saved data of each source file it
+#    contained is dropped, and rebuilt from the other tracefiles in the
+#    manifest which contain that source file.  The new version is then
+#    merged as above.
+#  - tracefiles in the manifest which are not in '@files' are retained -
+#    unless they no longer exist:  then their source files are rebuilt as
+#    if they had changed, and they are dropped from the manifest.
+# The state is rebuilt from scratch - from '@files' and the tracefiles in
+#  the manifest - if it is inconsistent, or if it was saved by a different
+#  version of lcov or with different options.  It is an error if the
+#  manifest cannot be read.
+# Return (TraceFile, state) - see 'save_incremental_state'.
+sub incremental_merge
+{
+    my ($readSourceFile, $dir, @files) = @_;
+
+    my $manifestFile = File::Spec->catfile($dir, 'manifest');
+    my $dataFile     = File::Spec->catfile($dir, 'merged.bin');
+    my $signature    = _incremental_signature();
+    my ($manifest, @previous);
+    if (-f $manifestFile) {
+        $manifest = eval { Storable::retrieve($manifestFile) };
+        my $reason;
+        if ('HASH' ne ref($manifest) ||
+            'HASH' ne ref($manifest->{inputs})) {
+            # we don't know which tracefiles were merged before
+            lcovutil::ignorable_error($lcovutil::ERROR_CORRUPT,
+                "$manifestFile: unreadable incremental state manifest: remove '$dir' - or ignore this error - to start over from the specified tracefiles"
+            );
+            $reason   = 'corrupt manifest';
+            $manifest = undef;
+        } elsif (($manifest->{version} // 0) != $incremental_version) {
+            $reason = 'unsupported manifest version';
+        } elsif ($manifest->{signature} ne $signature) {
+            $reason = 'lcov version or options changed';
+        } elsif (!-f $dataFile ||
+                 -s $dataFile != $manifest->{size} ||
+                 _file_digest($dataFile) ne $manifest->{digest}) {
+            $reason = 'merged data is missing or out of date';
+        }
+        if (defined($reason)) {
+            lcovutil::info("Rebuilding incremental state in $dir: $reason\n");
+            # from the tracefiles we merged before, as well as the new ones
+            @previous = sort(keys(%{$manifest->{inputs}}))
+                if defined($manifest);
+            $manifest = undef;
+        }
+    } elsif (!-d $dir) {
+        File::Path::make_path($dir);
+    }
+    my $inputs = defined($manifest) ? $manifest->{inputs} : {};
+    foreach my $path (@previous) {
+        if (-f $path) {
+            push(@files, $path);
+        } else {
+            lcovutil::info(
+                   "$path no longer exists: removing it from incremental state\n");
+        }
+    }
+
+    # which tracefiles do we need to read?
+    #   [path, name, complete] - only the 'affected' source files are
+    #   read from tracefiles which are not 'complete'
+    my (@read, %seen, %affected);
+    foreach my $name (@files) {
+        my $path = Cwd::abs_path($name) // $name;
+        next if $seen{$path}++;
+        my $entry = $inputs->{$path};
+        my ($size, $mtime) = (stat($path))[7, 9];
+        if (defined($entry) && defined($size)) {
+            next if ($entry->[0] == $size && $entry->[1] == $mtime);
+            my $digest = _file_digest($path);
+            if (defined($digest) && $entry->[2] eq $digest) {
+                # touched but not modified
+                @$entry[0, 1] = ($size, $mtime);
+                next;
+            }
+            $affected{$_} = 1 foreach (@{$entry->[3]});
+            delete($inputs->{$path});
+        }
+        push(@read, [$path, $name, 1]);
+    }
+    # tracefiles in the manifest which have since been deleted:  drop their
+    #  data, and rebuild the source files they contained from the others
+    my $nRemoved = 0;
+    foreach my $path (sort(keys(%$inputs))) {
+        next if ($seen{$path} || -f $path);
+        lcovutil::info(
+                   "$path no longer exists: removing it from incremental state\n");
+        $affected{$_} = 1 foreach (@{$inputs->{$path}->[3]});
+        delete($inputs->{$path});
+        ++$nRemoved;
+    }
+    my $nChanged = scalar(@read);
+    if (%affected) {
+        foreach my $path (sort(keys(%$inputs))) {
+            push(@read, [$path, $path, 0])
+                if grep({ exists($affected{$_}) } @{$inputs->{$path}->[3]});
+        }
+    }
+    lcovutil::info("Incremental state $dir: $nChanged of " .
+                   scalar(keys(%seen)) . " tracefiles new or changed" .
+                   ($nRemoved ? ", $nRemoved removed" : '') .
+                   (%affected ?
+                        ', ' . (scalar(@read) - $nChanged) .
+                        ' re-read to rebuild ' . scalar(keys(%affected)) .
+                        ' source files' :
+                        '') .
+                   "\n");
+
+    # as in 'merge':  read with filters disabled, then filter the result
+    my $save_filters = lcovutil::disable_cov_filters();
+    my @tasks;
+    if (1 == $lcovutil::maxParallelism) {
+        @tasks = ([\@read]) if @read;
+    } else {
+        local $chunks_per_core = 1;
+        my $first = 0;
+        foreach my $chunk (_size_chunks([map({ $_->[0] } @read)])) {
+            my $last = $first + scalar(@{$chunk->[0]}) - 1;
+            push(@tasks, [[@read[$first .. $last]]]);
+            $first = $last + 1;
+        }
+    }
+    my $new = TraceFile->new();
+    foreach my $r (
+        _run_external(
+            'incremental',
+            \@tasks,
+            sub {
+                return _read_incremental($readSourceFile, $_[0]->[0],
+                                         \%affected);
+            },
+            lcovutil::create_temp_dir())
+    ) {
+        my ($trace, $meta) = @$r;
+        $new->merge_tracefile($trace, TraceInfo::UNION);
+        @$inputs{keys(%$meta)} = values(%$meta);
+    }
+    lcovutil::reenable_cov_filters($save_filters);
+    $new->applyFilters($readSourceFile);
+
+    my $total = TraceFile->new();
+    my $state = TraceFile::DID_FILTER | TraceFile::DID_DERIVE;
+    if (defined($manifest)) {
+        # saved data was filtered with the same options
+        $total->_read_binary($dataFile);
+        $total->[TraceFile::STATE] = $state;
+        foreach my $key (keys(%affected)) {
+            $total->remove($key) if $total->contains($key);
+        }
+    }
+    $total->merge_tracefile($new, TraceInfo::UNION);
+    $total->[TraceFile::STATE] = $state;
+
+    return ($total,
+            {dir      => $dir,
+             comments => [$total->comments()],
+             manifest => {version   => $incremental_version,
+                          signature => $signature,
+                          inputs    => $inputs
+             }
+            });
+}
+
+# read the tracefiles in '@$list' ([path, name, complete]) - keeping only
+#  the source files in '%$affected' from those which are not 'complete'.
+# Return [TraceFile, {path => manifest entry}]
+sub _read_incremental
+{
+    my ($readSourceFile, $list, $affected) = @_;
+    my $trace = TraceFile->new();
+    my %meta;
+    foreach my $f (@$list) {
+        my ($path, $name, $complete) = @$f;
+        lcovutil::info(1, "Merging $name\n");
+        my $context = MessageContext->new("merging $name");
+        my ($size, $mtime) = (stat($path))[7, 9];
+        my $digest  = _file_digest($path);
+        my $current = _load_tracefile($name, $readSourceFile);
+        next unless defined($current);
+        if ($complete) {
+            $meta{$path} = [$size, $mtime, $digest, [$current->files()]];
+        } else {
+            foreach my $key ($current->files()) {
+                $current->remove($key) unless exists($affected->{$key});
+            }
+        }
+        $trace->merge_tracefile($current, TraceInfo::UNION);
+    }
+    return [$trace, \%meta];
+}
+
+sub _file_digest
+{
+    my $path = shift;
+    open(my $hdl, '<:raw', $path) or return undef;
+    my $digest = Digest::MD5->new()->addfile($hdl)->b64digest();
+    close($hdl);
+    return $digest;
+}
+
+# options which change the merged data:  if they differ from the ones the
+#  incremental state was saved with, the state is rebuilt
+sub _incremental_signature
+{
+    return
+        Digest::MD5::md5_base64(
+            Storable::nfreeze([
+                    $lcovutil::VERSION,
+                    $lcovutil::br_coverage,
+                    $lcovutil::func_coverage,
+                    $lcovutil::mcdc_coverage,
+                    [map({ defined($_) ? 1 : 0 } @lcovutil::cov_filter)],
+                    [map({ $_->[1] } @lcovutil::omit_line_patterns)],
+                    [map({ $_->[1] } @lcovutil::exclude_function_patterns)],
+                    [map({ $_->[1] } @lcovutil::include_file_patterns)],
+                    [map({ $_->[1] } @lcovutil::exclude_file_patterns)],
+                    [map({ $_->[0] } @lcovutil::file_subst_patterns)],
+                    [@lcovutil::internal_dirs],
+                    $lcovutil::opt_no_external,
+                    $lcovutil::derive_function_end_line,
+                    $lcovutil::case_insensitive,
+                    $TraceFile::ignore_testcase_name
+                ]));
+}
+
+# save the state returned by 'incremental_merge', with the merged data
+#  '$trace'.  The data is written first:  the manifest records its size and
+#  digest, so that an interrupted update is detected (and the state rebuilt)
+#  the next time.
+sub save_incremental_state
+{
+    my ($state, $trace) = @_;
+    my $dir          = $state->{dir};
+    my $manifestFile = File::Spec->catfile($dir, 'manifest');
+    my $dataFile     = File::Spec->catfile($dir, 'merged.bin');
+    my $tmp          = "$dataFile.$$";
+    {
+        # don't save comments which were added after the merge - e.g., from
+        #   the command line
+        local $trace->[TraceFile::COMMENTS] = $state->{comments};
+        $trace->write_binary($tmp, 1);
+    }
+    $state->{manifest}->{size}   = -s $tmp;
+    $state->{manifest}->{digest} = _file_digest($tmp);
+    Storable::nstore($state->{manifest}, "$manifestFile.$$") or
+        die("unable to write $manifestFile.$$\n");
+    rename($tmp, $dataFile) or
+        die("unable to rename $tmp to $dataFile: $!\n");
+    rename("$manifestFile.$$", $manifestFile) or
+        die("unable to rename $manifestFile.$$ to $manifestFile: $!\n");
+}
+
 sub merge
 {
     my $readSourceFile;
@@ -10112,281 +12382,18 @@ sub merge
         $filelist        = \@sorted_filelist;
     }
 
-    if (1 != $lcovutil::maxParallelism &&
-        (exists($ENV{LCOV_FORCE_PARALLEL}) ||
-            1 < $nTests)
+    if ($lcovutil::merge_memory_budget &&
+        !$function_mapping &&
+        1 < $nTests) {
+        @effective =
+            _external_merge($total_trace, $readSourceFile, $filelist,
+                            $save_filters);
+    } elsif (1 != $lcovutil::maxParallelism &&
+             (exists($ENV{LCOV_FORCE_PARALLEL}) ||
+                 1 < $nTests)
     ) {
-        # parallel implementation is to segment the file list into N
-        #  segments, then parse-and-merge scalar(@merge)/N files in each slave,
-        #  then merge the slave result.
-        # The reasoning is that one of our examples appears to take 1.3s to
-        #   load the trace file, and 0.8s to merge it into the master list.
-        # We thus want to parallelize both the load and the merge, as much as
-        #   possible.
-        # Note that we try to keep the files in the order they were specified
-        #   in the segments (i.e., so adjacent files go in order, into the same
-        #   segment).  This plays more nicely with the "--prune-tests" option
-        #   because we expect that files with similar names (e.g., as returned
-        #   by 'glob' have similar coverage profiles and are thus not likely to
-        #   all be 'effective'.  If we had put them into different segments,
-        #   then each segment might think that their variant is 'effective' -
-        #   whereas we will notice that only one is effective if they are all
-        #   in the same segment.
-
-        my @segments;
-        my $testsPerSegment =
-            ($nTests > $lcovutil::maxParallelism) ?
-            int(($nTests + $lcovutil::maxParallelism - 1) /
-                $lcovutil::maxParallelism) :
-            1;
-        my $idx = 0;
-        foreach my $tracefile (@$filelist) {
-            my $seg = $idx / $testsPerSegment;
-            $seg -= 1 if $seg == $lcovutil::maxParallelism;
-            push(@segments, [])
-                if ($seg >= scalar(@segments));
-            push(@{$segments[$seg]}, $tracefile);
-            ++$idx;
-        }
-        lcovutil::info("Using " .
-                       scalar(@segments) .
-                       ' segment' . (scalar(@segments) > 1 ? 's' : '') .
-                       " of $testsPerSegment test" .
-                       ($testsPerSegment > 1 ? 's' : '') . "\n");
-        $lcovutil::profileData{config} = {}
-            unless exists($lcovutil::profileData{config});
-        $lcovutil::profileData{config}{segments} = scalar(@segments);
-
-        # kind of a hack...write to the named directory that the user gave
-        #   us rather than to a funny generated name
-        my $tempDir = defined($lcovutil::tempdirname) ? $lcovutil::tempdirname :
-            lcovutil::create_temp_dir();
-        my %children;
-        my @pending;
-        my $failedAttempts = 0;
-        my %childRetryCounts;
-        do {
-            while (my $segment = pop(@segments)) {
-                $lcovutil::deferWarnings = 1;
-                my $now = Time::HiRes::gettimeofday();
-                my $pid = fork();
-                if (!defined($pid)) {
-                    ++$failedAttempts;
-                    lcovutil::report_fork_failure('process segment',
-                                                  $!, $failedAttempts);
-                    push(@segments, $segment);
-                    next;
-                }
-                $failedAttempts = 0;
-
-                if (0 == $pid) {
-                    # I'm the child
-                    my $stdout_file =
-                        File::Spec->catfile($tempDir, "lcov_$$.log");
-                    my $stderr_file =
-                        File::Spec->catfile($tempDir, "lcov_$$.err");
-
-                    my $currentState =
-                        lcovutil::initial_state('aggregate', $segmentIdx);
-                    my $status = 0;
-                    my @interesting;
-                    my ($stdout, $stderr, $code) = Capture::Tiny::capture {
-                        eval {
-                            @interesting =
-                                _process_segment($total_trace,
-                                                 $readSourceFile, $segment);
-                        };
-                        if ($@) {
-                            print(STDERR $@);
-                            $status = 1;
-                        }
-
-                        my $then = Time::HiRes::gettimeofday();
-                        $lcovutil::profileData{$segmentIdx}{total} =
-                            $then - $now;
-                    };
-                    # print stdout and stderr ...
-                    foreach
-                        my $d ([$stdout_file, $stdout], [$stderr_file, $stderr])
-                    {
-                        next
-                            unless ($d->[1])
-                            ;    # only print if there is something to print
-                        my $f = InOutFile->out($d->[0]);
-                        my $h = $f->hdl();
-                        print($h $d->[1]);
-                    }
-                    my $file = File::Spec->catfile($tempDir, "dumper_$$");
-                    my $data;
-                    eval {
-                        $data =
-                            Storable::store(
-                                        [$total_trace,
-                                         \@interesting,
-                                         $function_mapping,
-                                         lcovutil::compute_update($currentState)
-                                        ],
-                                        $file);
-                    };
-                    if ($@ || !defined($data)) {
-                        lcovutil::ignorable_error($lcovutil::ERROR_PARALLEL,
-                              "Child $$ serialize failed" . ($@ ? ": $@" : ''));
-                    }
-                    exit($status);
-                } else {
-                    $children{$pid} = [$now, $segmentIdx, $segment];
-                    push(@pending, $segment);
-                }
-                $segmentIdx++;
-            }
-            # now wait for all the children to finish...
-            foreach (@pending) {
-                my $child       = wait();
-                my $now         = Time::HiRes::gettimeofday();
-                my $raw_status  = $?;
-                my $childstatus = $raw_status >> 8;
-                my $raw_signal  = $raw_status & 0xFF;
-                unless (exists($children{$child})) {
-                    lcovutil::report_unknown_child($child);
-                    next;
-                }
-                my ($start, $idx, $segment) = @{$children{$child}};
-                lcovutil::info(
-                          1,
-                          "Merging segment $idx, status $childstatus"
-                              .
-                              (
-                              $lcovutil::debug ?
-                                  (' mem:' . lcovutil::current_process_size()) :
-                                  '') .
-                              "\n");
-                my $dumpfile = File::Spec->catfile($tempDir, "dumper_$child");
-                my $childLog = File::Spec->catfile($tempDir, "lcov_$child.log");
-                my $childErr = File::Spec->catfile($tempDir, "lcov_$child.err");
-
-                foreach my $f ($childLog, $childErr) {
-                    if (!-f $f) {
-                        $f = '';    # there was no output
-                        next;
-                    }
-                    if (open(RESTORE, "<", $f)) {
-                        # slurp into a string and eval..
-                        my $str =
-                            do { local $/; <RESTORE> };    # slurp whole thing
-                        close(RESTORE) or die("unable to close $f: $!\n");
-                        unlink $f
-                            unless ($str && $lcovutil::preserve_intermediates);
-                        $f = $str;
-                    } else {
-                        $f = "unable to open $f: $!";
-                        if (0 == $childstatus) {
-                            lcovutil::report_parallel_error('aggregate',
-                                                 $ERROR_PARALLEL, $child, 0, $f,
-                                                 keys(%children));
-                        }
-                    }
-                }
-                my $signal = $raw_signal;
-
-                print(STDOUT $childLog)
-                    if ((0 != $childstatus &&
-                         $signal != POSIX::SIGKILL &&
-                         $lcovutil::max_fork_fails != 0) ||
-                        $lcovutil::verbose);
-                print(STDERR $childErr);
-
-                # undump the data
-                my $data = Storable::retrieve($dumpfile)
-                    if (-f $dumpfile && 0 == $childstatus);
-                if (defined($data)) {
-                    eval {
-                        my ($current, $changed, $func_map, $update) = @$data;
-                        my $then = Time::HiRes::gettimeofday();
-                        $lcovutil::profileData{$idx}{undump} = $then - $now;
-                        lcovutil::update_state(@$update);
-                        if ($function_mapping) {
-                            if (!defined($func_map)) {
-                                lcovutil::report_parallel_error(
-                                    'aggregate',
-                                    $ERROR_PARALLEL,
-                                    $child,
-                                    0,
-                                    "segment $idx returned empty function data",
-                                    keys(%children));
-                                next;
-                            }
-                            while (my ($key, $data) = each(%$func_map)) {
-                                $function_mapping->{$key} = [$data->[0], []]
-                                    unless exists($function_mapping->{$key});
-                                die("mismatched function name '" .
-                                    $data->[0] . "' at $key")
-                                    unless ($data->[0] eq
-                                            $function_mapping->{$key}->[0]);
-                                push(@{$function_mapping->{$key}->[1]},
-                                     @{$data->[1]});
-                            }
-                        } else {
-                            if (!defined($current)) {
-                                lcovutil::report_parallel_error(
-                                    'aggregate',
-                                    $ERROR_PARALLEL,
-                                    $child,
-                                    0,
-                                    "segment $idx returned empty trace data",
-                                    keys(%children));
-                                next;
-                            }
-                            if ($total_trace->merge_tracefile(
-                                                      $current, TraceInfo::UNION
-                            )) {
-                                # something in this segment improved coverage...so save
-                                #   the effective input files from this one
-                                push(@effective, @$changed);
-                            }
-                        }
-                    };    # end eval
-                    if ($@) {
-                        $childstatus = 1 << 8 unless $childstatus;
-                        lcovutil::report_parallel_error(
-                            'aggregate',
-                            $ERROR_PARALLEL,
-                            $child,
-                            $childstatus,
-                            "unable to deserialize segment $idx $dumpfile:$@",
-                            keys(%children));
-                    }
-                }
-                if (!defined($data) || 0 != $childstatus) {
-                    if (!-f $dumpfile ||
-                        POSIX::SIGKILL == $signal) {
-
-                        if (exists($childRetryCounts{$idx})) {
-                            $childRetryCounts{$idx} += 1;
-                        } else {
-                            $childRetryCounts{$idx} = 1;
-                        }
-                        lcovutil::report_fork_failure(
-                             "aggregate segment $idx",
-                             (POSIX::SIGKILL == $signal ?
-                                  "killed by OS - possibly due to out-of-memory"
-                              :
-                                  "serialized data $dumpfile not found"),
-                             $childRetryCounts{$idx});
-                        push(@segments, $segment);
-                    } else {
-
-                        lcovutil::report_parallel_error('aggregate',
-                                             $ERROR_CHILD, $child, $childstatus,
-                                             "while processing segment $idx",
-                                             keys(%children));
-                    }
-                }
-                my $end = Time::HiRes::gettimeofday();
-                $lcovutil::profileData{$idx}{merge} = $end - $start;
-                unlink $dumpfile
-                    if -f $dumpfile;
-            }
-        } while (@segments);
+        @effective =
+            _parallel_merge($total_trace, $readSourceFile, $filelist);
     } else {
         # sequential
         @effective = _process_segment($total_trace, $readSourceFile, $filelist);
@@ -1,17 +1,26 @@
 #!/usr/bin/env python3
 
-import xlsxwriter
 import argparse
+import csv
 import json
 import pdb
+import re
 import datetime
+import heapq
+import math
 import os.path
 import os
 import sys
 
-from xlsxwriter.utility import xl_rowcol_to_cell
 from functools import cmp_to_key
 
+try:
+    # only needed for .xlsx output - text export and '--compare' work without
+    import xlsxwriter
+    from xlsxwriter.utility import xl_rowcol_to_cell
+except ImportError:
+    xlsxwriter = None
+
 devMinThreshold = 1.5
 devMaxThreshold = 2.0
 thresholdPercent = 0.15
@@ -952,6 +961,682 @@ class GenerateSpreadsheet(object):
                 pass
         s.close()
 
+
+def profileTool(data):
+    """Return name of the tool which wrote profile 'data' - or None if this
+    does not look like lcov profile data."""
+    cfg = data.get('config') if isinstance(data, dict) else None
+    if not isinstance(cfg, dict):
+        return None
+    tool = cfg.get('tool', 'unknown')
+    if (tool == 'lcov' and
+        -1 != cfg.get('cmdLine', '').find('--call-from-lcov')):
+        tool = 'geninfo'
+    return tool
+
+
+def toNumber(v):
+    """Return 'v' as a number - or None if it is not one."""
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return v
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def profileItem(path, value):
+    """Classify one leaf of the profile - at 'path' (tuple of keys):
+       return ('scalar', key, value) for whole-run data ('total', config, ...),
+       ('column', key, id, value) for per-file/chunk/segment/job values,
+       or None if the leaf is not used.
+    lcov segment data ({segment: {key: value}}) is transposed so segments
+    look like any other id, and per-job peak memory is converted to MB
+    columns 'peakVM' and 'peakRSS' - as in the spreadsheet.
+    """
+    top = path[0]
+    if top == 'config':
+        if len(path) == 2:
+            return ('scalar', 'config.' + path[1], value)
+        return None
+    n = toNumber(value)
+    if n is None:
+        return None
+    if top in ('memory', 'memoryPeak'):
+        label = {'vsize': 'peakVM', 'rss': 'peakRSS'}.get(path[-1])
+        if label is None:
+            return None
+        if top == 'memoryPeak' and len(path) == 2:
+            return ('scalar', label, n / (1 << 20))
+        if top == 'memory' and len(path) == 3:
+            return ('column', label, path[1], n / (1 << 20))
+        return None
+    if len(path) == 1:
+        return ('scalar', top, n)
+    if len(path) == 2:
+        if top.isdigit():
+            # lcov: per-segment data
+            return ('column', path[1], 'segment ' + top, n)
+        return ('column', top, str(path[1]), n)
+    return None
+
+
+def profileLeaves(data, path=()):
+    """Yield (path, value) for each scalar in the (loaded) profile 'data'."""
+    for k, v in (data.items() if isinstance(data, dict) else enumerate(data)):
+        if isinstance(v, (dict, list)):
+            for leaf in profileLeaves(v, path + (k,)):
+                yield leaf
+        else:
+            yield path + (k,), v
+
+
+def profileColumns(data):
+    """Flatten profile 'data' into (scalars, columns):
+         scalars: {key: value} - whole-run values ('total', config, ...)
+         columns: {key: {id: value}} - per-file/chunk/segment/job values.
+    """
+    scalars = {}
+    columns = {}
+    for path, v in profileLeaves(data):
+        item = profileItem(path, v)
+        if item is None:
+            continue
+        if item[0] == 'scalar':
+            scalars[item[1]] = item[2]
+        else:
+            columns.setdefault(item[1], {})[item[2]] = item[3]
+    return scalars, columns
+
+
+class ProfileReader(object):
+    """Incremental JSON reader:  iterate over (path, value) for each scalar
+    in the file, without holding more than a block of the text - or any of
+    the decoded data - in memory.  'path' is the tuple of object keys and
+    array indices leading to the value.
+    Profiles of very large genhtml runs can be several hundred MB of JSON;
+    json.load needs several times that.
+    """
+    token = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*")|'
+                       r'(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)|'
+                       r'(true|false|null)|([{}\[\]:,]))')
+    literals = {'true': True, 'false': False, 'null': None}
+
+    def __init__(self, name, blockSize=1 << 20):
+        self._name = name
+        self._blockSize = blockSize
+
+    def _tokens(self):
+        with open(self._name) as f:
+            buf = ''
+            pos = 0
+            eof = False
+            while True:
+                m = self.token.match(buf, pos)
+                # a token close to the end of the buffer might be truncated
+                #   ('1.5' read as '1') - so read more first
+                if not eof and (m is None or m.end() + 64 > len(buf)):
+                    block = f.read(self._blockSize)
+                    eof = not block
+                    buf = buf[pos:] + block
+                    pos = 0
+                    continue
+                if m is None:
+                    if buf[pos:].strip():
+                        raise ValueError("%s: unexpected '%s' at offset %d" %
+                                         (self._name, buf[pos:pos + 20], pos))
+                    return
+                pos = m.end()
+                yield m.lastindex, m.group(m.lastindex)
+
+    def __iter__(self):
+        stack = []   # '{' or '[' per open container
+        path = []    # current key/index in each open container
+        expectKey = False
+        for kind, tok in self._tokens():
+            if kind == 4:
+                if tok == '{' or tok == '[':
+                    stack.append(tok)
+                    path.append(0)
+                    expectKey = tok == '{'
+                elif tok == '}' or tok == ']':
+                    stack.pop()
+                    path.pop()
+                    # next is ',' or another close - not a key - even if
+                    #  the container was empty
+                    expectKey = False
+                elif tok == ',':
+                    if stack[-1] == '[':
+                        path[-1] += 1
+                    else:
+                        expectKey = True
+                continue
+            if kind == 1:
+                value = json.loads(tok)
+            elif kind == 2:
+                value = float(tok) if ('.' in tok or 'e' in tok or
+                                       'E' in tok) else int(tok)
+            else:
+                value = self.literals[tok]
+            if expectKey:
+                path[-1] = value
+                expectKey = False
+            else:
+                yield tuple(path), value
+
+
+class RunningStats(object):
+    """Single-pass (Welford) count/total/max/average/standard deviation of
+    a sequence of values, plus the 'top' largest (value, id) pairs."""
+
+    def __init__(self, top):
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._top = top
+        self._heap = []
+
+    def add(self, id, value):
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+        if len(self._heap) < self._top:
+            heapq.heappush(self._heap, (value, id))
+        elif self._top and value > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (value, id))
+
+    def average(self):
+        return self._mean
+
+    def stddev(self):
+        # sample standard deviation - as Excel STDEV in the spreadsheet
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self._m2 / (self.count - 1))
+
+    def top(self):
+        """Largest values first:  list of (id, value, deviations from
+        average)."""
+        dev = self.stddev()
+        return [(id, v, (v - self._mean) / dev if dev else 0.0)
+                for v, id in sorted(self._heap, reverse=True)]
+
+
+def tableName(name, tool, used):
+    """Base name for the tables written for profile 'name'.  Same naming as
+    the worksheets:  the directory, if the file is named after the tool."""
+    p, f = os.path.split(name)
+    base = os.path.splitext(f)[0]
+    if base == tool and os.path.split(p)[1]:
+        base = os.path.split(p)[1]
+    unique = base
+    i = 0
+    while unique in used:
+        unique = '%s_%d' % (base, i)
+        i += 1
+    used.add(unique)
+    return unique
+
+
+def streamStats(files, args):
+    """Stream each profile and report per-key statistics and the largest
+    items - in constant memory, whatever the size of the profile.
+    Print the report - or, in csv/tsv format, write it as '<name>.summary',
+    '<name>.stats' and '<name>.top' tables.  Return exit status."""
+    if args.format != 'xlsx':
+        delimiter = '\t' if args.format == 'tsv' else ','
+        outDir = args.out or 'stats'
+        os.makedirs(outDir, exist_ok=True)
+    used = set()
+    status = 0
+    for name in files:
+        scalars = {}
+        stats = {}
+        try:
+            for path, v in ProfileReader(name):
+                item = profileItem(path, v)
+                if item is None:
+                    continue
+                if item[0] == 'scalar':
+                    scalars[item[1]] = item[2]
+                else:
+                    if item[1] not in stats:
+                        stats[item[1]] = RunningStats(args.top)
+                    stats[item[1]].add(item[2], item[3])
+        except (OSError, ValueError) as err:
+            print("%s: unable to parse: %s" % (name, str(err)))
+            status = 1
+            continue
+        if 'config.tool' not in scalars:
+            print("%s: no 'config' data key - I think this is not lcov performance data - skipping" % (name))
+            continue
+        tool = scalars['config.tool']
+        if (tool == 'lcov' and
+            -1 != str(scalars.get('config.cmdLine', '')).find('--call-from-lcov')):
+            tool = 'geninfo'
+        keys = sorted(stats.keys())
+
+        if args.format == 'xlsx':
+            print("%s: %s" % (name, tool))
+            for k in ('total', 'overall', 'peakRSS', 'peakVM'):
+                if k in scalars:
+                    print("  %-14s %12.2f" % (k, scalars[k]))
+            print("  %-14s %8s %12s %12s %12s %12s" % (
+                'key', 'count', 'total', 'max', 'avg', 'stddev'))
+            for k in keys:
+                s = stats[k]
+                print("  %-14s %8d %12.4f %12.4f %12.4f %12.4f" % (
+                    k, s.count, s.total, s.max, s.average(), s.stddev()))
+            for k in keys:
+                print("  largest '%s':" % (k))
+                for id, v, dev in stats[k].top():
+                    print("    %12.4f %6.1f sigma  %s" % (v, dev, id))
+            continue
+
+        unique = tableName(name, tool, used)
+        outName = os.path.join(outDir, '%s.summary.%s' % (unique, args.format))
+        with open(outName, 'w', newline='') as out:
+            w = csv.writer(out, delimiter=delimiter)
+            w.writerow(['key', 'value'])
+            w.writerow(['profile', name])
+            w.writerow(['tool', tool])
+            for k in sorted(scalars.keys()):
+                w.writerow([k, formatValue(scalars[k])])
+        outName = os.path.join(outDir, '%s.stats.%s' % (unique, args.format))
+        with open(outName, 'w', newline='') as out:
+            w = csv.writer(out, delimiter=delimiter)
+            w.writerow(['key', 'count', 'total', 'max', 'avg', 'stddev'])
+            for k in keys:
+                s = stats[k]
+                w.writerow([k, s.count] + [formatValue(x) for x in (
+                    s.total, s.max, s.average(), s.stddev())])
+        outName = os.path.join(outDir, '%s.top.%s' % (unique, args.format))
+        with open(outName, 'w', newline='') as out:
+            w = csv.writer(out, delimiter=delimiter)
+            w.writerow(['key', 'rank', 'id', 'value', 'sigma'])
+            for k in keys:
+                for rank, (id, v, dev) in enumerate(stats[k].top(), 1):
+                    w.writerow([k, rank, id, formatValue(v),
+                                formatValue(dev)])
+        if args.verbose:
+            print("wrote %s statistics for %s" % (unique, name))
+    return status
+
+
+# name a section after the first of these keys it contains
+sectionNames = ('file', 'chunk', 'segment', 'source', 'diff', 'parse',
+                'peakRSS')
+
+def profileSections(columns):
+    """Group 'columns' into sections (tables) of keys which describe the same
+    ids - e.g., the geninfo per-file data, or per-chunk data.
+    Return list of (section name, [keys]).
+    """
+    keys = sorted(columns.keys())
+    owner = {k: k for k in keys}
+
+    def find(k):
+        while owner[k] != k:
+            owner[k] = owner[owner[k]]
+            k = owner[k]
+        return k
+
+    idOwner = {}
+    for k in keys:
+        for id in columns[k]:
+            if id in idOwner:
+                owner[find(k)] = find(idOwner[id])
+            else:
+                idOwner[id] = k
+    groups = {}
+    for k in keys:
+        groups.setdefault(find(k), []).append(k)
+    sections = []
+    for group in groups.values():
+        name = next((n for n in sectionNames if n in group), group[0])
+        sections.append((name, group))
+    return sorted(sections)
+
+
+def formatValue(v):
+    if isinstance(v, float):
+        return '%.6f' % v
+    return str(v)
+
+
+def loadProfile(name):
+    """Return (data, tool) for profile file 'name' - or (None, None) after
+    printing a message, if it cannot be used."""
+    try:
+        with open(name) as f:
+            data = json.load(f)
+    except Exception as err:
+        print("%s: unable to parse: %s" % (name, str(err)))
+        return None, None
+    tool = profileTool(data)
+    if tool is None:
+        print("%s: no 'config' data key - I think this is not lcov performance data - skipping" % (name))
+        return None, None
+    return data, tool
+
+
+def writeColumnar(outDir, files, args):
+    """Write each profile as a set of text tables:  one file with the
+    whole-run data, and one per section - with one row per id and one
+    column per key.  Much faster than building a workbook.
+    """
+    delimiter = '\t' if args.format == 'tsv' else ','
+    os.makedirs(outDir, exist_ok=True)
+    used = set()
+    for name in files:
+        data, tool = loadProfile(name)
+        if data is None:
+            continue
+        unique = tableName(name, tool, used)
+        scalars, columns = profileColumns(data)
+        outName = os.path.join(outDir, '%s.summary.%s' % (unique, args.format))
+        with open(outName, 'w', newline='') as out:
+            w = csv.writer(out, delimiter=delimiter)
+            w.writerow(['key', 'value'])
+            w.writerow(['profile', name])
+            w.writerow(['tool', tool])
+            for k in sorted(scalars.keys()):
+                w.writerow([k, formatValue(scalars[k])])
+        for section, keys in profileSections(columns):
+            ids = set()
+            for k in keys:
+                ids.update(columns[k].keys())
+            outName = os.path.join(outDir, '%s.%s.%s' % (unique, section,
+                                                         args.format))
+            with open(outName, 'w', newline='') as out:
+                w = csv.writer(out, delimiter=delimiter)
+                w.writerow(['id'] + keys)
+                w.writerows([id] + [formatValue(columns[k][id])
+                                    if id in columns[k] else ''
+                                    for k in keys]
+                            for id in sorted(ids))
+        if args.verbose:
+            print("wrote %s tables for %s" % (unique, name))
+
+
+def compareProfiles(oldName, newName, args):
+    """Print per-key totals and the largest per-item regressions between
+    two profiles.  Return exit status."""
+    oldData, oldTool = loadProfile(oldName)
+    newData, newTool = loadProfile(newName)
+    if oldData is None or newData is None:
+        return 1
+    if oldTool != newTool:
+        print("Warning: comparing %s profile %s with %s profile %s" % (
+            oldTool, oldName, newTool, newName))
+    oldScalars, oldCols = profileColumns(oldData)
+    newScalars, newCols = profileColumns(newData)
+
+    def change(old, new):
+        if old:
+            return '%+.1f%%' % (100.0 * (new - old) / old)
+        return ''
+
+    print("old: %s\nnew: %s" % (oldName, newName))
+    print("%-16s %14s %14s %10s" % ('key', 'old', 'new', 'change'))
+    regressions = []
+    for k in ['total', 'overall'] + args.keys:
+        if k in oldScalars and k in newScalars:
+            # whole-run value
+            print("%-16s %14.2f %14.2f %10s" % (
+                k, oldScalars[k], newScalars[k],
+                change(oldScalars[k], newScalars[k])))
+        elif k in oldCols and k in newCols:
+            # summing peak memory of different jobs means nothing
+            agg = max if k in ('peakRSS', 'peakVM') else sum
+            o = agg(oldCols[k].values())
+            n = agg(newCols[k].values())
+            label = k if agg is sum else k + ' (max)'
+            print("%-16s %14.2f %14.2f %10s" % (label, o, n, change(o, n)))
+        if k in oldCols and k in newCols:
+            common = set(oldCols[k].keys()) & set(newCols[k].keys())
+            for id in common:
+                delta = newCols[k][id] - oldCols[k][id]
+                if delta > 0:
+                    regressions.append((delta, k, id, oldCols[k][id],
+                                        newCols[k][id]))
+            onlyOne = len(oldCols[k]) + len(newCols[k]) - 2 * len(common)
+            if onlyOne and args.verbose:
+                print("  %s: %d ids appear in only one profile" % (k, onlyOne))
+
+    if regressions:
+        regressions.sort(reverse=True)
+        print("\ntop regressions:")
+        print("%-10s %-40s %12s %12s %12s" % ('key', 'id', 'old', 'new', 'delta'))
+        for delta, k, id, o, n in regressions[:args.top]:
+            if len(id) > 40:
+                id = '...' + id[-37:]
+            print("%-10s %-40s %12.4f %12.4f %+12.4f" % (k, id, o, n, delta))
+    return 0
+
+
+def profileTasks(data, tool):
+    """Return the parallel phases recorded in profile 'data':  list of
+    (phase name, [(id, work, merge, queue)], deps) - one task per child job,
+    in dispatch order:
+       work:  time the child spent running
+       merge: time the parent spent (serially) undumping and merging the
+              child's result
+       queue: measured time the finished child waited for the parent - or
+              None if the profile does not say
+    'deps' maps the id of a job which cannot start before other jobs have
+    finished to the list of those job ids - or to None if the profile does
+    not say which.
+    """
+    def ids(section):
+        return sorted(data.get(section, {}).keys(),
+                      key=lambda x: int(x) if str(x).isdigit() else x)
+
+    def val(section, id):
+        return toNumber(data.get(section, {}).get(id)) or 0.0
+
+    def child(section, mergeKeys, queueKey):
+        return [(id, val(section, id), sum(val(k, id) for k in mergeKeys),
+                 toNumber(data.get(queueKey, {}).get(id)))
+                for id in ids(section)]
+
+    phases = []
+    if tool == 'geninfo':
+        phases.append(('capture', child('child', ('undump', 'merge'), 'queue'),
+                       {}))
+    elif tool == 'genhtml':
+        phases.append(('html', child('child', ('merge_segment',),
+                                     'mergeDelay'), {}))
+    elif tool == 'lcov' and 'tree_merge' in data:
+        # segments are handed out largest first as child slots free up -
+        #   segment ids are assigned at fork, so id order is dispatch order.
+        #   Adjacent results are merged by children too, as soon as both
+        #   are available:  the parent only collects their state ('undump')
+        #   - and does one final union, which is serial time outside the
+        #   parallel phase.
+        segs = [(k, toNumber(v.get('total')) or 0.0,
+                 toNumber(v.get('undump')) or 0.0, None)
+                for k, v in data.items()
+                if k.isdigit() and isinstance(v, dict)]
+        segs.sort(key=lambda t: int(t[0]))
+        merges = [('m' + k, toNumber(data['tree_merge'][k]) or 0.0, 0.0,
+                   None) for k in ids('tree_merge')]
+
+        def taskId(label):
+            # job labels are 'aggregate_<segment>' or 'tree_merge_<id>'
+            phase, _, id = str(label).rpartition('_')
+            return 'm' + id if phase == 'tree_merge' else id
+
+        known = {t[0] for t in segs + merges}
+        inputs = data.get('tree_merge_inputs', {})
+        deps = {}
+        for id, _, _, _ in merges:
+            # older profiles do not record the inputs
+            labels = inputs.get(id[1:])
+            deps[id] = None if labels is None else \
+                [i for i in map(taskId, labels) if i in known]
+        phases.append(('aggregate', segs + merges, deps))
+    elif tool == 'lcov':
+        # all the aggregate segments are forked up front and their 'merge'
+        #   time runs from fork until the parent finished merging - so it is
+        #   the end time of that merge.  Walk the merges in order to find the
+        #   parent's share of each.
+        segs = sorted([(toNumber(v.get('merge')) or 0.0, k,
+                        toNumber(v.get('total')) or 0.0)
+                       for k, v in data.items()
+                       if k.isdigit() and isinstance(v, dict)])
+        tasks = []
+        prevEnd = 0.0
+        for end, id, work in segs:
+            start = max(work, prevEnd)
+            tasks.append((id, work, max(0.0, end - start), None))
+            prevEnd = max(end, prevEnd)
+        tasks.sort(key=lambda t: int(t[0]))
+        phases.append(('aggregate', tasks, {}))
+    # any tool may run the filters in parallel
+    phases.append(('filter', child('filt_child', ('filt_undump', 'filt_merge'),
+                                   'filt_queue'), {}))
+    return [p for p in phases if p[1]]
+
+
+def simulateSchedule(tasks, nWorkers, deps=None):
+    """Model of the fork/merge loop in the lcov tools:  the parent forks a
+    child for each task while fewer than 'nWorkers' are running; otherwise it
+    waits for the first child to finish and merges its result - serially -
+    before that slot is reused.
+    A task listed in 'deps' is forked only after the parent has collected
+    all the jobs it depends on - and then ahead of the tasks which depend on
+    nothing, as the lcov tree merge does.
+    Return (elapsed, parent idle time, time finished children waited for the
+    parent)."""
+    deps = deps or {}
+    running = []
+    done = set()
+    now = 0.0
+    idle = 0.0
+    queued = 0.0
+    pending = list(tasks)
+    while pending or running:
+        while pending and len(running) < nWorkers:
+            ready = [t for t in pending
+                     if all(d in done for d in deps.get(t[0]) or ())]
+            if not ready:
+                break
+            task = next((t for t in ready if t[0] in deps), ready[0])
+            pending.remove(task)
+            id, work, merge, _ = task
+            heapq.heappush(running, (now + work, merge, id))
+        finish, merge, id = heapq.heappop(running)
+        if finish > now:
+            idle += finish - now
+            now = finish
+        else:
+            queued += now - finish
+        now += merge
+        done.add(id)
+    return now, idle, queued
+
+
+def criticalPath(name, args):
+    """Rebuild the parallel timeline of profile 'name' and report where the
+    wall time went - and what a different '--parallel' would buy.
+    Return exit status."""
+    data, tool = loadProfile(name)
+    if data is None:
+        return 1
+    parallel = int(toNumber(data['config'].get('maxParallel')) or 1)
+    total = toNumber(data.get('total'))
+    phases = profileTasks(data, tool)
+    print("%s: %s, --parallel %d%s" % (
+        name, tool, parallel,
+        (', measured %.2fs' % total) if total is not None else ''))
+    if not phases:
+        print("  no parallel job data - nothing to analyze")
+        return 0
+
+    section = 0.0    # simulated time in the parallel phases
+    work = 0.0       # total child time
+    merge = 0.0      # total parent merge time
+    for phase, tasks, deps in phases:
+        w = sum(t[1] for t in tasks)
+        m = sum(t[2] for t in tasks)
+        elapsed, idle, queued = simulateSchedule(tasks, parallel, deps)
+        unlimited = simulateSchedule(tasks, len(tasks), deps)[0]
+        measuredQueue = [t[3] for t in tasks if t[3] is not None]
+        section += elapsed
+        work += w
+        merge += m
+        print("  phase %s: %d jobs, child time %.2fs (longest %.2fs), parent merge %.2fs" % (
+            phase, len(tasks), w, max(t[1] for t in tasks), m))
+        print("    %-36s %10.2fs" % ('timeline length', elapsed))
+        unknown = sum(1 for d in deps.values() if d is None)
+        if unknown:
+            print("    note: inputs of %d merge jobs not recorded - treated as independent" % unknown)
+        print("    %-36s %10.2fs%s" % ('critical path (unlimited workers)',
+                                       unlimited,
+                                       ' (lower bound)' if unknown else ''))
+        print("    %-36s %10.2fs (%.0f%%)" % (
+            'worker idle', parallel * elapsed - w,
+            100.0 * (parallel * elapsed - w) / (parallel * elapsed)
+            if elapsed else 0.0))
+        print("    %-36s %10.2fs (%.0f%% of phase)" % (
+            'parent merging', m, 100.0 * m / elapsed if elapsed else 0.0))
+        print("    %-36s %10.2fs (%.0f%% of phase)" % (
+            'parent waiting for children', idle,
+            100.0 * idle / elapsed if elapsed else 0.0))
+        print("    %-36s %10.2fs%s" % (
+            'children waiting for merge', queued,
+            (' (measured %.2fs)' % sum(measuredQueue))
+            if measuredQueue else ''))
+        if args.verbose:
+            print("    %-8s %10s %10s %10s" % ('job', 'child', 'merge',
+                                              'queue'))
+            for id, w, m, q in tasks:
+                print("    %-8s %10.3f %10.3f %10s" % (
+                    id, w, m, '%.3f' % q if q is not None else ''))
+
+    # anything outside the parallel phases is serial:  setup, reading and
+    #   writing data, ...
+    serial = max(0.0, total - section) if total is not None else 0.0
+    print("  %-38s %10.2fs" % ('serial outside parallel phases', serial))
+    sequential = serial + merge + work
+    if sequential <= 0:
+        return 0
+    fraction = (serial + merge) / sequential
+    print("  %-38s %10.2f" % ('serial fraction', fraction))
+    print("  %10s %12s %12s" % ('--parallel', 'Amdahl', 'simulated'))
+    for n in args.predict or sorted({parallel, 2 * parallel, 4 * parallel}):
+        amdahl = sequential * (fraction + (1.0 - fraction) / n)
+        simulated = serial + sum(simulateSchedule(tasks, n, deps)[0]
+                                 for phase, tasks, deps in phases)
+        print("  %10d %11.2fs %11.2fs" % (n, amdahl, simulated))
+    print("  %10s %11.2fs %11.2fs" % (
+        'unlimited', sequential * fraction,
+        serial + sum(simulateSchedule(tasks, len(tasks), deps)[0]
+                     for phase, tasks, deps in phases)))
+    return 0
+
+
+def parallelList(value):
+    """argparse type:  comma-separated list of '--parallel' values."""
+    try:
+        values = [int(x) for x in value.split(',')]
+    except ValueError:
+        values = [0]
+    if min(values) < 1:
+        raise argparse.ArgumentTypeError(
+            "values must be integers >= 1: '%s'" % value)
+    return values
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(
@@ -960,11 +1645,33 @@ Simple utility to turn genhtml/geninfo/lcov "profile" JSON output files into a s
 
 Example usage:
   $ spreadsheet.py -o foo.xlsx data.json data2.json data3.json ...
+  $ spreadsheet.py --format csv -o foo_tables data.json data2.json ...
+  $ spreadsheet.py --compare before.json after.json
 """)
 
     parser.add_argument("-o", dest='out', action='store',
-                        default='stats.xlsx',
-                        help='save excel to file')
+                        default=None,
+                        help='save excel to file (default: stats.xlsx) - or directory, for csv/tsv format (default: stats)')
+    parser.add_argument("--format", dest='format', default='xlsx',
+                        choices=['xlsx', 'csv', 'tsv'],
+                        help='output format:  Excel workbook, or comma/tab separated text tables - one file per section of each profile')
+    parser.add_argument("--compare", dest='compare', nargs=2,
+                        metavar=('OLD', 'NEW'),
+                        help='print the largest differences between two profiles rather than writing a spreadsheet')
+    parser.add_argument("--stats", dest='stats', action='store_true',
+                        default=False,
+                        help='stream the profiles and report per-key statistics and the --top largest items, in constant memory - rather than writing a spreadsheet')
+    parser.add_argument("--critical-path", dest='criticalPath',
+                        action='store_true', default=False,
+                        help='rebuild the parallel timeline from the profiles and report critical path, idle and merge time, and predicted elapsed time for other --parallel values - rather than writing a spreadsheet')
+    parser.add_argument("--predict", dest='predict', default=None,
+                        type=parallelList,
+                        help="comma-separated list of --parallel values to predict elapsed time for in critical path mode.  Default: 1, 2 and 4 times the profiled value")
+    parser.add_argument("--keys", dest='keys',
+                        default='parse,append,file,chunk,merge,peakRSS',
+                        help="comma-separated list of keys to compare.  Default: '%(default)s'")
+    parser.add_argument("--top", dest='top', type=int, default=20,
+                        help='number of regressions to print in compare mode, or of largest items per key in stats mode.  Default: %(default)s')
     parser.add_argument("--threshold", dest='thresholdPercent', type=float,
                         help="difference from average smaller than this percentage is ignored (not colorized).  Default %0.2f" % (thresholdPercent))
     parser.add_argument("--low", dest='devMinThreshold', type=float,
@@ -984,4 +1691,24 @@ Example usage:
         print(str(err))
         sys.exit(2)
 
-    GenerateSpreadsheet(args.out, args.files, args)
+    if args.compare:
+        args.keys = args.keys.split(',')
+        sys.exit(compareProfiles(args.compare[0], args.compare[1], args))
+
+    if args.criticalPath:
+        status = 0
+        for f in args.files:
+            status |= criticalPath(f, args)
+        sys.exit(status)
+
+    if args.stats:
+        sys.exit(streamStats(args.files, args))
+
+    if args.format != 'xlsx':
+        writeColumnar(args.out or 'stats', args.files, args)
+        sys.exit(0)
+
+    if xlsxwriter is None:
+        print("Error: xlsxwriter module not found - needed for .xlsx output.  Use '--format csv' or '--format tsv', or install xlsxwriter.")
+        sys.exit(1)
+    GenerateSpreadsheet(args.out or 'stats.xlsx', args.files, args)
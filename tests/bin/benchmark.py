@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Performance regression benchmark for LCOV.
+
+Generates fake coverage data from the tests/profiles/{small,medium,large}
+descriptions (via mkinfo), then runs the lcov merge and genhtml steps at
+several --parallel levels.  For each step, records wall time and peak
+memory, and saves the '--profile' JSON written by the tool, in a results
+directory.
+
+Results are compared against a stored baseline;  the script fails if wall
+time or peak memory regresses by more than the configured tolerance.
+
+Example:
+    # record a baseline
+    benchmark.py --profiles small,medium --parallel 1,4 --save-baseline
+    # ... change the code, then compare
+    benchmark.py --profiles small,medium --parallel 1,4
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Import local utilities
+sys.path.insert(0, str(Path(__file__).parent))
+from common import find_topdir, timestamp, get_parallel_default
+from test_worker import run_and_wait
+
+
+# ANSI color codes for output
+BOLD = '\033[1m'
+GREEN = '\033[32m'
+RED = '\033[31m'
+RESET = '\033[0m'
+
+
+def parse_list(value: str) -> list:
+    return [v for v in value.split(',') if v]
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Run LCOV performance benchmarks and compare against a baseline')
+
+    parser.add_argument('--profiles', type=parse_list, default=['small', 'medium'],
+                        help='Comma-separated list of tests/profiles to use (default: small,medium)')
+
+    parser.add_argument('--parallel', type=parse_list, default=None,
+                        help='Comma-separated list of --parallel levels (default: 1 and CPU count)')
+
+    parser.add_argument('--steps', type=parse_list, default=['merge', 'genhtml'],
+                        help='Comma-separated list of steps to run: merge, genhtml (default: both)')
+
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Run each step this many times and keep the best result (default: 1)')
+
+    parser.add_argument('--results', metavar='DIR', default=None,
+                        help='Directory to store results (default: benchmark.d in test directory)')
+
+    parser.add_argument('--baseline', metavar='FILE', default=None,
+                        help='Baseline summary to compare against (default: DIR/baseline.json)')
+
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Save the results of this run as the new baseline')
+
+    parser.add_argument('--time-tolerance', type=float, default=10.0,
+                        help='Allowed wall time regression, in percent (default: 10)')
+
+    parser.add_argument('--memory-tolerance', type=float, default=10.0,
+                        help='Allowed peak memory regression, in percent (default: 10)')
+
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='Ignore wall time regressions of steps faster than this many seconds (default: 0.5)')
+
+    parser.add_argument('--timeout', type=int, default=3600,
+                        help='Per-step timeout in seconds (default: 3600)')
+
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Verbose output')
+
+    args = parser.parse_args()
+    if args.parallel is None:
+        args.parallel = sorted({1, get_parallel_default()})
+    args.parallel = [int(p) for p in args.parallel]
+    return args
+
+
+class Benchmark:
+    """Generate data for each profile and time the tools on it."""
+
+    def __init__(self, args):
+        self.args = args
+        self.topdir = find_topdir()
+        self.bindir = self.topdir.parent / 'bin'
+        self.results_dir = Path(args.results) if args.results else self.topdir / 'benchmark.d'
+        self.run_dir = self.results_dir / time.strftime('%Y%m%d-%H%M%S')
+        self.baseline_file = Path(args.baseline) if args.baseline else self.results_dir / 'baseline.json'
+        self.env = os.environ.copy()
+        self.env['LANG'] = 'C'
+        self.summary = {}
+
+    def run_step(self, key, cmd, cwd, profile_json):
+        """Run one step 'repeat' times;  record the best wall time and
+        the largest peak memory."""
+        best = None
+        for _ in range(self.args.repeat):
+            start = time.time()
+            exit_code, stdout, stderr, rusage, timed_out = run_and_wait(
+                cmd, str(cwd), self.env, self.args.timeout)
+            wall = time.time() - start
+            if timed_out or exit_code != 0:
+                print(f"{RED}{key} failed{RESET} (exit {exit_code}): {' '.join(cmd)}")
+                if self.args.verbose:
+                    print(stdout)
+                    print(stderr)
+                return False
+            # ru_maxrss is the largest process in the tree (kB on Linux)
+            maxrss = rusage.ru_maxrss
+            if sys.platform == 'darwin':
+                maxrss //= 1024
+            if best is None:
+                best = {'wall_s': wall, 'maxrss_kb': maxrss}
+            else:
+                best['wall_s'] = min(best['wall_s'], wall)
+                best['maxrss_kb'] = max(best['maxrss_kb'], maxrss)
+        self.summary[key] = best
+        shutil.copy(profile_json, self.run_dir / f"{key}.json")
+        print(f"  {key:<28} {best['wall_s']:8.2f}s {best['maxrss_kb'] / 1024:9.1f}MB")
+        return True
+
+    def run_profile(self, profile):
+        """Generate data for 'profile' and run the steps on it."""
+        profile_file = self.topdir / 'profiles' / profile
+        if not profile_file.exists():
+            print(f"{RED}no such profile '{profile}'{RESET}")
+            return False
+        ok = True
+        with tempfile.TemporaryDirectory(prefix=f'lcov_bench_{profile}_') as tmp:
+            work = Path(tmp)
+            exit_code, stdout, stderr, _, _ = run_and_wait(
+                [str(self.topdir / 'bin' / 'mkinfo'), str(profile_file),
+                 '-o', 'src/', '--seed', '0'],
+                str(work), self.env, self.args.timeout)
+            if exit_code != 0:
+                print(f"{RED}mkinfo {profile} failed{RESET}\n{stderr}")
+                return False
+            infos = ['full.info', 'target.info', 'part1.info', 'part2.info']
+            for parallel in self.args.parallel:
+                # mkinfo data is not entirely self-consistent
+                common = ['--config-file', str(self.topdir / 'lcovrc'),
+                          '--ignore', 'inconsistent',
+                          '--parallel', str(parallel),
+                          '--profile', 'profile.json']
+                if 'merge' in self.args.steps:
+                    cmd = [str(self.bindir / 'lcov'), '-o', 'merged.info'] + common
+                    for f in infos:
+                        cmd += ['-a', f]
+                    ok &= self.run_step(f"{profile}_merge_j{parallel}", cmd,
+                                        work, work / 'profile.json')
+                if 'genhtml' in self.args.steps:
+                    cmd = [str(self.bindir / 'genhtml'), '-o', 'html',
+                           'full.info'] + common
+                    ok &= self.run_step(f"{profile}_genhtml_j{parallel}", cmd,
+                                        work, work / 'profile.json')
+                    shutil.rmtree(work / 'html', ignore_errors=True)
+        return ok
+
+    def compare(self):
+        """Compare summary against baseline.  Return number of regressions."""
+        try:
+            with open(self.baseline_file) as f:
+                baseline = json.load(f)['results']
+        except (OSError, ValueError, KeyError):
+            print(f"No baseline found in {self.baseline_file}")
+            return 0
+        regressions = 0
+        print(f"{BOLD}Comparison with {self.baseline_file}{RESET}")
+        for key, current in sorted(self.summary.items()):
+            if key not in baseline:
+                continue
+            base = baseline[key]
+            for field, tolerance, minimum in (
+                    ('wall_s', self.args.time_tolerance, self.args.min_time),
+                    ('maxrss_kb', self.args.memory_tolerance, 0)):
+                old = base.get(field, 0)
+                new = current[field]
+                if old <= 0:
+                    continue
+                change = 100.0 * (new - old) / old
+                if change > tolerance and new >= minimum:
+                    regressions += 1
+                    print(f"  {RED}{key} {field}: {old:.2f} -> {new:.2f} (+{change:.1f}%){RESET}")
+                elif self.args.verbose:
+                    print(f"  {key} {field}: {old:.2f} -> {new:.2f} ({change:+.1f}%)")
+        if regressions == 0:
+            print(f"  {GREEN}no regressions{RESET}")
+        return regressions
+
+    def run(self):
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        print(f"{BOLD}Benchmark results in {self.run_dir}{RESET}")
+        ok = True
+        for profile in self.args.profiles:
+            ok &= self.run_profile(profile)
+
+        data = {
+            'date': timestamp(),
+            'profiles': self.args.profiles,
+            'parallel': self.args.parallel,
+            'results': self.summary,
+        }
+        with open(self.run_dir / 'summary.json', 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+        regressions = self.compare()
+        if self.args.save_baseline and ok:
+            shutil.copy(self.run_dir / 'summary.json', self.baseline_file)
+            print(f"Saved baseline {self.baseline_file}")
+        if not ok or regressions:
+            return 1
+        return 0
+
+
+def main():
+    args = parse_args()
+    sys.exit(Benchmark(args).run())
+
+
+if __name__ == '__main__':
+    main()
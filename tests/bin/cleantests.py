@@ -88,7 +88,7 @@ def main():
     topdir = find_topdir()
     
     # Clean test artifacts in topdir
-    for artifact in ['test.log', 'test.counts', 'test.time']:
+    for artifact in ['test.log', 'test.counts', 'test.time', 'test.results.json']:
         f = topdir / artifact
         if f.exists():
             f.unlink()
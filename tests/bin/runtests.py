@@ -10,12 +10,14 @@ Default execution is serial. Use -j N for parallel execution.
 """
 
 import argparse
+import json
 import os
 import sys
 import re
+import shutil
 import time
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import threading
 import subprocess
 
@@ -35,6 +37,16 @@ BLUE = '\033[34m'
 RESET = '\033[0m'
 
 
+def parse_size(value: str) -> int:
+    """Convert size string (e.g., '16G', '512M', '100000K'; default unit: MB)
+    to kB."""
+    units = {'K': 1, 'M': 1024, 'G': 1024 * 1024, 'T': 1024 * 1024 * 1024}
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', value, re.IGNORECASE)
+    if not m:
+        raise argparse.ArgumentTypeError(f"invalid size '{value}'")
+    return int(float(m.group(1)) * units[(m.group(2) or 'M').upper()])
+
+
 def parse_args():
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(
@@ -51,7 +63,7 @@ def parse_args():
                         help='Number of parallel workers (default: serial; 0=CPU count)')
     
     parser.add_argument('--coverage', metavar='DB',
-                        help='Enable coverage mode with database path')
+                        help='Enable coverage mode with database path.  Per-test databases are merged into DB (Perl) and pycov.dat (Python) as the tests finish')
     
     parser.add_argument('--script-args', dest='script_args',
                         help='Arguments to pass to test scripts')
@@ -71,6 +83,23 @@ def parse_args():
     parser.add_argument('--timeout', type=int, default=None,
                         help='Per-test timeout in seconds (default: 1200s if coverage, 300s otherwise)')
     
+    parser.add_argument('--history', metavar='FILE', default=None,
+                        help='Test duration history used to schedule parallel runs (default: test.history in test directory)')
+    
+    parser.add_argument('--schedule', choices=['longest', 'makefile'],
+                        default='longest',
+                        help='Parallel execution order: longest expected duration first (default), or Makefile order')
+    
+    parser.add_argument('--memory-budget', dest='memory_budget', metavar='SIZE',
+                        type=parse_size, default=None,
+                        help='Start parallel tests only while their expected peak memory (from --history) fits in SIZE (e.g. 16G, 512M; default unit MB).  Tests with unknown or larger memory use run alone')
+    
+    parser.add_argument('--results', metavar='FILE', default=None,
+                        help='Write per-test results (status, time, peak memory) as JSON (default: test.results.json in test directory)')
+    
+    parser.add_argument('--cgroup', metavar='DIR', default=None,
+                        help='Delegated cgroup v2 directory:  run each test in its own child group and report its memory.peak')
+    
     parser.add_argument('-s', '--silent', action='store_true',
                         help='Silent mode (for Makefile compatibility)')
     
@@ -92,6 +121,133 @@ def parse_args():
 
 
 
+class CoverageMerger:
+    """Merge per-test coverage databases while the tests are running.
+
+    Each finished test's Perl (Devel::Cover) database and Python coverage
+    data file enters a binary tree of pairwise merges:  two results at the
+    same depth are merged into one at the next depth, on a worker from the
+    test pool.  Only the final combine of the (at most log2(N)) partial
+    results is left after the last test finishes.
+    """
+
+    def __init__(self, coverage_dir: Path, destinations: dict, verbose=False):
+        self.coverage_dir = coverage_dir
+        self.merge_dir = coverage_dir / '.merge'
+        # names the Perl database once it holds the data of every database
+        #  in 'coverage_dir' - 'make info' then need not merge them again
+        self.stamp = coverage_dir / '.merged'
+        self.stamp.unlink(missing_ok=True)
+        # kind -> final merged database
+        self.destinations = destinations
+        self.verbose = verbose
+        # kind -> {depth: path} - results waiting for a partner
+        self.waiting = {kind: {} for kind in destinations}
+        # kind -> paths which could not be merged - left for the final combine
+        self.leftover = {kind: [] for kind in destinations}
+        self.seen = set()
+        self.jobs = []  # (kind, depth, inputs, output) ready to run
+        self.count = 0
+
+    def _intermediate(self, path: Path) -> bool:
+        return path.parent == self.merge_dir
+
+    def add_test(self, test_name: str):
+        """Queue the coverage data of a finished test."""
+        name = test_name.replace('/', '_')
+        perl_db = self.coverage_dir / name
+        # a test which ran no Perl code has an empty database directory
+        if 'perl' in self.destinations and (perl_db / 'runs').is_dir():
+            self._add('perl', perl_db, 0)
+        py_data = self.coverage_dir / f"{name}_py"
+        if 'python' in self.destinations and py_data.exists():
+            self._add('python', py_data, 0)
+
+    def _add(self, kind: str, path: Path, depth: int):
+        self.seen.add(path)
+        waiting = self.waiting[kind]
+        if depth in waiting:
+            self.count += 1
+            output = self.merge_dir / f"{kind}_{self.count}"
+            self.jobs.append((kind, depth + 1, [waiting.pop(depth), path],
+                              output))
+        else:
+            waiting[depth] = path
+
+    def next_job(self):
+        """Return the next merge job to run - or None."""
+        return self.jobs.pop(0) if self.jobs else None
+
+    @staticmethod
+    def merge(kind: str, inputs: list, output: Path) -> bool:
+        """Merge coverage 'inputs' into 'output'.  Runs on a pool worker."""
+        output.parent.mkdir(parents=True, exist_ok=True)
+        env = os.environ.copy()
+        if kind == 'perl':
+            cmd = ['cover', '-silent', '-write', str(output)] + \
+                [str(i) for i in inputs]
+        else:
+            # 'combine' removes its input files - as the serial merge did
+            cmd = ['coverage', 'combine'] + [str(i) for i in inputs]
+            env['COVERAGE_FILE'] = str(output)
+        try:
+            result = subprocess.run(cmd, env=env, stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, check=False)
+            return result.returncode == 0 and output.exists()
+        except OSError:
+            return False
+
+    def job_done(self, job, ok: bool):
+        """Record the result of merge 'job' - and queue the next level."""
+        kind, depth, inputs, output = job
+        if not ok:
+            if self.verbose:
+                print(f"Warning: {kind} coverage merge of {len(inputs)} databases failed - retrying at the end")
+            self.leftover[kind].extend(inputs)
+            return
+        for i in inputs:
+            if self._intermediate(i):
+                shutil.rmtree(i, ignore_errors=True) if i.is_dir() else i.unlink(missing_ok=True)
+        self._add(kind, output, depth)
+
+    def finish(self):
+        """Combine the remaining partial results into the final databases.
+        Call after all tests and merge jobs have finished."""
+        # pairs queued by the last tests are folded into the final combine
+        for kind, depth, inputs, output in self.jobs:
+            self.leftover[kind].extend(inputs)
+        self.jobs = []
+        if 'python' in self.destinations:
+            # Python data written by anything other than a test we ran
+            for f in self.coverage_dir.glob('*_py'):
+                if f not in self.seen:
+                    self.leftover['python'].append(f)
+        if 'perl' in self.destinations:
+            # databases left by earlier runs - e.g., of a subset of the tests
+            for db in self.coverage_dir.glob('*'):
+                if (db / 'runs').is_dir() and db not in self.seen:
+                    self.leftover['perl'].append(db)
+        for kind, dest in self.destinations.items():
+            inputs = list(self.waiting[kind].values()) + self.leftover[kind]
+            if not inputs:
+                continue
+            if dest.is_dir():
+                shutil.rmtree(dest)
+            elif dest.exists():
+                dest.unlink()
+            if len(inputs) == 1 and self._intermediate(inputs[0]):
+                inputs[0].rename(dest)
+                ok = True
+            else:
+                ok = self.merge(kind, inputs, dest)
+            if not ok:
+                print(f"Warning: final {kind} coverage merge failed")
+            elif kind == 'perl':
+                self.stamp.write_text(str(dest) + '\n')
+        shutil.rmtree(self.merge_dir, ignore_errors=True)
+
+
 class TestRunner:
     """Main test runner class."""
     
@@ -109,10 +265,12 @@ class TestRunner:
             self.parallel = get_parallel_default()
         else:
             self.parallel = args.parallel
+        self.history_file = Path(args.history) if args.history else self.topdir / 'test.history'
         self.results = []
         self.results_lock = threading.Lock()
         self.print_lock = threading.Lock()
         self.start_time = None
+        self.merger = None
         
     def setup(self):
         """Initialize test environment."""
@@ -126,6 +284,12 @@ class TestRunner:
         # Create coverage directory if needed
         if self.args.coverage:
             self.coverage_dir.mkdir(parents=True, exist_ok=True)
+            shutil.rmtree(self.coverage_dir / '.merge', ignore_errors=True)
+            self.merger = CoverageMerger(
+                self.coverage_dir,
+                {'perl': Path(self.args.coverage),
+                 'python': self.topdir / 'pycov.dat'},
+                self.args.verbose)
         
         # Initialize main log file
         log_file = self.topdir / 'test.log'
@@ -242,6 +406,95 @@ class TestRunner:
             pass
         return tests
 
+    def load_history(self) -> dict:
+        """
+        Return {test_name: {'duration_ms': expected duration,
+                            'memory_kb': expected peak memory}}
+        from history file.
+        """
+        try:
+            with open(self.history_file) as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        for name, h in history.items():
+            if not isinstance(h, dict):
+                # older history:  duration only
+                history[name] = {'duration_ms': h}
+        return history
+    
+    def save_history(self):
+        """Update history file with durations and peak memory from this run.
+        Expected values are moving averages, so one unusually slow or
+        fast run does not distort the schedule.
+        """
+        history = self.load_history()
+        for r in self.results:
+            if r.duration_ms <= 0 or r.result == 'skip':
+                continue
+            h = history.setdefault(r.name, {})
+            for key, value in (('duration_ms', r.duration_ms),
+                               ('memory_kb', r.memory_kb)):
+                if value <= 0:
+                    continue
+                h[key] = (h[key] + value) // 2 if key in h else value
+        tmp = self.history_file.with_suffix('.tmp')
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(history, f, indent=1, sort_keys=True)
+            tmp.replace(self.history_file)
+        except OSError as e:
+            if self.args.verbose:
+                print(f"Warning: cannot write {self.history_file}: {e}")
+    
+    def schedule(self, tests: list, history: dict) -> list:
+        """
+        Order tests longest-expected-first (LPT):  the executor starts each
+        test on the first free worker, so long tests start early and the
+        short ones fill in around them - rather than a long test starting
+        last and stretching the run.
+        Tests with no history are assumed to be as long as the longest
+        known test, so they are not left until the end.
+        Sort is stable:  equal (or unknown) tests keep Makefile order.
+        """
+        durations = {name: h['duration_ms'] for name, h in history.items()
+                     if 'duration_ms' in h}
+        if not durations:
+            return tests
+        longest = max(durations.values())
+        ordered = sorted(tests, key=lambda t: -durations.get(t[0], longest))
+        if self.args.debug:
+            # estimated makespan of the greedy schedule
+            workers = [0] * self.parallel
+            for name, _ in ordered:
+                i = workers.index(min(workers))
+                workers[i] += durations.get(name, longest)
+            print(f"DEBUG: expected makespan {max(workers) / 1000:.1f}s", file=sys.stderr)
+        return ordered
+    
+    def _next_test(self, pending: list, estimates: list, in_use: int,
+                   running: int):
+        """
+        Return index (in 'pending') of the next test to start, or None if
+        we should wait for a running test to finish first.
+        Without a memory budget, that is the first pending test.
+        Otherwise, it is the first test whose expected peak memory fits in
+        what is left of the budget.  A test with unknown memory use, or
+        which is larger than the whole budget, runs only when nothing else
+        is running (and nothing else starts until it is done).
+        """
+        budget = self.args.memory_budget
+        if budget is None:
+            return 0
+        for i, idx in enumerate(pending):
+            mem = estimates[idx]
+            if mem is None or mem > budget:
+                if running == 0:
+                    return i
+            elif in_use + mem <= budget:
+                return i
+        return None
+    
     def run_all_tests(self, tests: list):
         """
         Run all tests in parallel using ThreadPoolExecutor.
@@ -251,6 +504,14 @@ class TestRunner:
         if total == 0:
             return
         
+        history = self.load_history()
+        # serial runs keep Makefile order - as the shell driver did
+        if self.parallel > 1 and self.args.schedule == 'longest':
+            tests = self.schedule(tests, history)
+        # expected peak memory of each test - None if unknown
+        estimates = [history.get(name, {}).get('memory_kb')
+                     for name, _ in tests]
+        
         if not self.args.silent:
             with self.print_lock:
                 parallel_str = f"parallel={self.parallel}" if self.parallel > 1 else "serial"
@@ -272,38 +533,71 @@ class TestRunner:
             test_args = [
                 (test_name, str(test_path), str(self.log_dir), str(self.topdir),
                  str(self.coverage_dir), self.args.script_args, self.args.timeout,
-                 self.args.coverage, self.args.debug)
+                 self.args.coverage, self.args.debug, self.args.cgroup)
                 for test_name, test_path in tests
             ]
             
-            # Submit all tests
-            futures = [executor.submit(run_test_worker, *args) for args in test_args]
-            if self.args.debug:
-                print(f"DEBUG: All tests submitted, waiting for completion", file=sys.stderr)
-                sys.stderr.flush()
-            
-            # Collect results as they complete
-            for future in as_completed(futures):
-                try:
-                    result = future.result()
-                    with self.results_lock:
-                        self.results.append(result)
-                    self._print_result(result)
-                except Exception as e:
-                    # Find which test failed
-                    idx = futures.index(future)
-                    test_name, test_path = tests[idx]
-                    error_result = TestResult(
-                        name=test_name,
-                        result='fail',
-                        exit_code=1,
-                        duration_ms=0,
-                        memory_kb=0,
-                        error_msg=str(e)
-                    )
-                    with self.results_lock:
-                        self.results.append(error_result)
-                    self._print_result(error_result)
+            # Start tests as workers (and memory budget) become available
+            pending = list(range(total))
+            running = {}  # future -> (test index, expected memory)
+            merging = {}  # future -> coverage merge job
+            in_use = 0
+            while pending or running or merging:
+                # coverage merges first:  they shorten the final combine
+                while self.merger and len(running) + len(merging) < self.parallel:
+                    job = self.merger.next_job()
+                    if job is None:
+                        break
+                    merging[executor.submit(CoverageMerger.merge, job[0],
+                                            job[2], job[3])] = job
+                while pending and len(running) + len(merging) < self.parallel:
+                    i = self._next_test(pending, estimates, in_use, len(running))
+                    if i is None:
+                        break
+                    idx = pending.pop(i)
+                    mem = estimates[idx]
+                    if mem is None or (self.args.memory_budget is not None and
+                                       mem > self.args.memory_budget):
+                        # runs alone - see _next_test
+                        mem = self.args.memory_budget or 0
+                    future = executor.submit(run_test_worker, *test_args[idx])
+                    running[future] = (idx, mem)
+                    in_use += mem
+                
+                # Collect results as they complete
+                done, _ = wait(list(running) + list(merging),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in merging:
+                        job = merging.pop(future)
+                        try:
+                            ok = future.result()
+                        except Exception:
+                            ok = False
+                        self.merger.job_done(job, ok)
+                        continue
+                    idx, mem = running.pop(future)
+                    in_use -= mem
+                    try:
+                        result = future.result()
+                        with self.results_lock:
+                            self.results.append(result)
+                        self._print_result(result)
+                        if self.merger:
+                            self.merger.add_test(result.name)
+                    except Exception as e:
+                        test_name, test_path = tests[idx]
+                        error_result = TestResult(
+                            name=test_name,
+                            result='fail',
+                            exit_code=1,
+                            duration_ms=0,
+                            memory_kb=0,
+                            error_msg=str(e)
+                        )
+                        with self.results_lock:
+                            self.results.append(error_result)
+                        self._print_result(error_result)
     
     def _print_result(self, result: TestResult):
         """Print test result (thread-safe)."""
@@ -367,42 +661,44 @@ class TestRunner:
                 pass
     
     def merge_coverage(self):
-        """Merge all per-test coverage databases."""
+        """Combine the per-test coverage databases - most of the merging
+        was done while the tests ran (see CoverageMerger)."""
         if not self.args.coverage:
             return
         
-        # For Perl coverage: we need to merge cover_db.d/* into cover_db
-        # Devel::Cover doesn't have a simple merge command, so we use
-        # the approach of pointing to the directory and letting 'cover' find all
-        
         # Write a note about per-test coverage
         log_file = self.topdir / 'test.log'
         with open(log_file, 'a') as f:
             f.write(marker() + '\n')
             f.write(detail('COVERAGE', 'Per-test databases in cover_db.d/') + '\n')
         
-        # For Python coverage: combine using coverage command
-        pycov_files = list(self.coverage_dir.glob('*_py'))
-        if pycov_files:
-            try:
-                # Create .coverage file by combining
-                result = subprocess.run(
-                    ['coverage', 'combine'] + [str(f) for f in pycov_files],
-                    cwd=str(self.topdir),
-                    stdin=subprocess.DEVNULL,
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                    check=False
-                )
-                if result.returncode != 0 and self.args.verbose:
-                    print(f"Warning: coverage combine failed (exit {result.returncode})")
-                # Move to expected location
-                coverage_file = self.topdir / '.coverage'
-                pycov_file = self.topdir / 'pycov.dat'
-                if coverage_file.exists() and not pycov_file.exists():
-                    coverage_file.rename(pycov_file)
-            except Exception as e:
-                if self.args.verbose:
-                    print(f"Warning: coverage combine failed: {e}")
+        try:
+            self.merger.finish()
+        except Exception as e:
+            if self.args.verbose:
+                print(f"Warning: coverage merge failed: {e}")
+    
+    def write_results(self):
+        """Write machine-readable results - e.g., to track memory use."""
+        results_file = Path(self.args.results) if self.args.results else self.topdir / 'test.results.json'
+        data = {
+            'start_time': self.start_time,
+            'end_time': time.time(),
+            'parallel': self.parallel,
+            'tests': [
+                {
+                    'name': r.name,
+                    'result': r.result,
+                    'exit_code': r.exit_code,
+                    'duration_ms': r.duration_ms,
+                    'memory_kb': r.memory_kb,
+                    'memory_source': r.memory_source,
+                }
+                for r in sorted(self.results, key=lambda r: r.name)
+            ],
+        }
+        with open(results_file, 'w') as f:
+            json.dump(data, f, indent=1)
     
     def print_summary(self):
         """Print test summary and return exit code."""
@@ -427,6 +723,8 @@ class TestRunner:
                     f.write(f"resident {r.name} {r.memory_kb}\n")
             f.write(f"end_time {time.time()}\n")
         
+        self.write_results()
+        
         # Print summary
         if not self.args.silent:
             total_sec = total_time_ms / 1000
@@ -483,6 +781,8 @@ class TestRunner:
             # Run tests
             self.run_all_tests(tests)
             
+            self.save_history()
+            
             # Merge results
             self.merge_logs()
             self.merge_coverage()
@@ -5,6 +5,8 @@ Must be in a separate module for pickling with ProcessPoolExecutor.
 import os
 import sys
 import time
+import tempfile
+import threading
 import subprocess
 from pathlib import Path
 from dataclasses import dataclass
@@ -21,15 +23,88 @@ class TestResult:
     log_file: Path = None
     coverage_dir: Path = None
     error_msg: str = None
+    memory_source: str = None
+
+
+def _cgroup_create(cgroup_root, test_name):
+    """Create a cgroup v2 child group for this test under 'cgroup_root'
+    (which must be a delegated, writable cgroup directory).
+    Return its path, or None if not possible.
+    """
+    if not cgroup_root:
+        return None
+    path = Path(cgroup_root) / ('lcov_' + test_name.replace('/', '_'))
+    try:
+        path.mkdir(exist_ok=True)
+        if (path / 'memory.peak').exists():
+            return path
+        path.rmdir()
+    except OSError:
+        pass
+    return None
+
+
+def _cgroup_peak_kb(path):
+    """Return peak memory usage of cgroup 'path' in kB and remove it."""
+    peak = 0
+    try:
+        peak = int((path / 'memory.peak').read_text()) // 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        path.rmdir()
+    except OSError:
+        # some background process is still alive
+        pass
+    return peak
+
+
+def run_and_wait(cmd, cwd, env, timeout, cgroup=None):
+    """
+    Run 'cmd' and reap it with os.wait4() - so we get the resource usage
+    of this test (the process and its descendants) rather than the
+    RUSAGE_CHILDREN maximum over every child that any thread in this
+    process has reaped.
+    If 'cgroup' is set, the test is started in that cgroup.
+    Return (exit code, stdout, stderr, rusage, timed out).
+    """
+    if cgroup:
+        # move ourselves into the cgroup, then become the test.  Avoids
+        #  preexec_fn - which is not safe when there are other threads.
+        cmd = ['/bin/sh', '-c', 'echo 0 > "$1/cgroup.procs" && shift && exec "$@"',
+               'sh', str(cgroup)] + list(cmd)
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                                stdout=out, stderr=err, cwd=cwd, env=env)
+        timedOut = threading.Event()
+
+        def kill():
+            timedOut.set()
+            proc.kill()
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            _, status, rusage = os.wait4(proc.pid, 0)
+        finally:
+            timer.cancel()
+        # tell Popen that the process is gone
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        err.seek(0)
+        stdout = out.read().decode(errors='replace')
+        stderr = err.read().decode(errors='replace')
+    return proc.returncode, stdout, stderr, rusage, timedOut.is_set()
 
 
 def run_test_worker(test_name, test_path, log_dir, topdir, coverage_dir,
-                     script_args, timeout, coverage_mode, debug=False):
+                     script_args, timeout, coverage_mode, debug=False,
+                     cgroup_root=None):
     """
     Execute a single test and return result.
     Standalone function for ThreadPoolExecutor compatibility.
+    If 'cgroup_root' is set, peak memory is taken from a per-test cgroup v2
+    group created there (if possible) - otherwise, from the test's rusage.
     """
-    import resource
     import sys
     
     # Debug output
@@ -156,28 +231,35 @@ def run_test_worker(test_name, test_path, log_dir, topdir, coverage_dir,
         pass
     
     # Run test
+    memory_kb = 0
+    memory_source = None
+    cgroup = _cgroup_create(cgroup_root, test_name)
     try:
-        proc = subprocess.run(
-            cmd,
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            universal_newlines=True,
-            cwd=str(Path(test_path).parent),
-            env=env,
-            timeout=timeout
-        )
+        exit_code, stdout, stderr, rusage, timedOut = run_and_wait(
+            cmd, str(Path(test_path).parent), env, timeout, cgroup)
+        
+        # maximum resident set size of the test and its descendants
+        memory_kb = rusage.ru_maxrss
+        memory_source = 'rusage'
+        if memory_kb > 0:
+            # Convert to KB (on Linux it's already in KB, on macOS it's in bytes)
+            import platform
+            if platform.system() == 'Darwin':
+                memory_kb = memory_kb // 1024
+        
+        if timedOut:
+            raise subprocess.TimeoutExpired(cmd, timeout)
         
-        exit_code = proc.returncode
         result = 'pass' if exit_code == 0 else 'fail'
         
         # Write output to log
         try:
             with open(log_file, 'a') as f:
-                for line in proc.stdout.splitlines():
+                for line in stdout.splitlines():
                     f.write(f"  {line}\n")
-                if proc.stderr:
+                if stderr:
                     f.write(f"\n  STDERR:\n")
-                    for line in proc.stderr.splitlines():
+                    for line in stderr.splitlines():
                         f.write(f"    {line}\n")
         except Exception:
             pass
@@ -201,18 +283,13 @@ def run_test_worker(test_name, test_path, log_dir, topdir, coverage_dir,
         except Exception:
             pass
     
-    # Get memory usage
-    memory_kb = 0
-    try:
-        # Get maximum resident set size
-        memory_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
-        if memory_kb > 0:
-            # Convert to KB (on Linux it's already in KB, on macOS it's in bytes)
-            import platform
-            if platform.system() == 'Darwin':
-                memory_kb = memory_kb // 1024
-    except Exception:
-        pass
+    if cgroup:
+        peak = _cgroup_peak_kb(cgroup)
+        if peak > 0:
+            # includes page cache - but also catches processes which
+            #  were not waited for
+            memory_kb = peak
+            memory_source = 'cgroup'
     
     duration_ms = int((time.time() - start_time) * 1000)
     
@@ -241,5 +318,6 @@ def run_test_worker(test_name, test_path, log_dir, topdir, coverage_dir,
         memory_kb=memory_kb,
         log_file=log_file,
         coverage_dir=coverage_subdir,
-        error_msg=error_msg
+        error_msg=error_msg,
+        memory_source=memory_source
     )
@@ -0,0 +1,157 @@
+#!/usr/bin/env bash
+set +x
+: ${USER:="$(id -u -n)"}
+
+source ../../common.tst
+
+rm -rf incremental_state
+rm -f inc_*.info inc_*.log inc_*.json
+
+if [[ 1 == $CLEAN_ONLY ]] ; then
+    exit 0
+fi
+
+# the generated data is inconsistent - see prune.sh
+LCOV_OPTS="--ignore inconsistent $PARALLEL $PROFILE"
+
+cp $PART1INFO inc_p1.info
+cp $PART2INFO inc_p2.info
+cp $FULLINFO inc_full.info
+
+# compare incremental result '$1' with the result of merging the remaining
+#  args from scratch
+check() {
+    local result=$1
+    shift
+    local args=''
+    for f in $* ; do
+        args="$args -a $f"
+    done
+    $COVER $LCOV_TOOL $LCOV_OPTS -o inc_ref.info $args
+    if [[ $? != 0 && $KEEP_GOING != 1 ]] ; then
+        echo "lcov -a $* failed"
+        exit 1
+    fi
+    diff inc_ref.info $result
+    if [ 0 != $? ] ; then
+        echo "Error:  incremental result $result differs from merge of $*"
+        exit 1
+    fi
+}
+
+# initial state
+$COVER $LCOV_TOOL $LCOV_OPTS -o inc_1.info -a inc_p1.info -a inc_p2.info --incremental-state incremental_state
+if [[ $? != 0 && $KEEP_GOING != 1 ]] ; then
+    echo "lcov --incremental-state failed"
+    exit 1
+fi
+if [ ! -f incremental_state/manifest ] ; then
+    echo "Error:  incremental state not saved"
+    exit 1
+fi
+check inc_1.info inc_p1.info inc_p2.info
+
+# nothing new:  nothing read
+$COVER $LCOV_TOOL $LCOV_OPTS -o inc_2.info -a inc_p1.info -a inc_p2.info --incremental-state incremental_state 2>&1 | tee inc_2.log
+grep -q '0 of 2 tracefiles new or changed' inc_2.log
+if [ 0 != $? ] ; then
+    echo "Error:  expected no new tracefiles"
+    exit 1
+fi
+check inc_2.info inc_p1.info inc_p2.info
+
+# a new tracefile - others are retained even if not specified
+$COVER $LCOV_TOOL $LCOV_OPTS -o inc_3.info -a inc_full.info --incremental-state incremental_state
+if [[ $? != 0 && $KEEP_GOING != 1 ]] ; then
+    echo "lcov --incremental-state (new file) failed"
+    exit 1
+fi
+check inc_3.info inc_p1.info inc_p2.info inc_full.info
+
+# a changed tracefile:  its old data is replaced
+cp $PART1INFO inc_p2.info
+$COVER $LCOV_TOOL $LCOV_OPTS -o inc_4.info -a inc_p2.info --incremental-state incremental_state 2>&1 | tee inc_4.log
+grep -q 're-read to rebuild' inc_4.log
+if [ 0 != $? ] ; then
+    echo "Error:  expected changed source files to be rebuilt"
+    exit 1
+fi
+check inc_4.info inc_p1.info inc_p2.info inc_full.info
+
+# a deleted tracefile:  its data is dropped - and a later change to a
+#  tracefile which shares its source files does not try to re-read it
+cp $PART2INFO inc_p3.info
+$COVER $LCOV_TOOL $LCOV_OPTS -o inc_6.info -a inc_p3.info --incremental-state incremental_state
+if [[ $? != 0 && $KEEP_GOING != 1 ]] ; then
+    echo "lcov --incremental-state (another file) failed"
+    exit 1
+fi
+check inc_6.info inc_p1.info inc_p2.info inc_p3.info inc_full.info
+rm inc_p2.info
+cp $PART1INFO inc_p3.info
+$COVER $LCOV_TOOL $LCOV_OPTS -o inc_7.info -a inc_p3.info --incremental-state incremental_state 2>&1 | tee inc_7.log
+if [ 0 != ${PIPESTATUS[0]} ] ; then
+    echo "Error:  lcov --incremental-state (deleted file) failed"
+    exit 1
+fi
+grep -q '1 removed' inc_7.log
+if [ 0 != $? ] ; then
+    echo "Error:  expected deleted tracefile to be removed"
+    exit 1
+fi
+check inc_7.info inc_p1.info inc_p3.info inc_full.info
+# and again:  state is consistent
+touch inc_p3.info
+$COVER $LCOV_TOOL $LCOV_OPTS -o inc_8.info -a inc_p3.info --incremental-state incremental_state
+if [ 0 != $? ] ; then
+    echo "Error:  lcov --incremental-state (after delete) failed"
+    exit 1
+fi
+check inc_8.info inc_p1.info inc_p3.info inc_full.info
+
+# different options:  state is rebuilt - from the specified tracefiles
+#  and the ones merged before
+$COVER $LCOV_TOOL $LCOV_OPTS --branch -o inc_5.info -a inc_p1.info --incremental-state incremental_state 2>&1 | tee inc_5.log
+grep -q 'Rebuilding incremental state' inc_5.log
+if [ 0 != $? ] ; then
+    echo "Error:  expected state to be rebuilt"
+    exit 1
+fi
+LCOV_OPTS="$LCOV_OPTS --branch" check inc_5.info inc_p1.info inc_p3.info inc_full.info
+
+# merged data changed - e.g., by an interrupted update - but its size did
+#  not:  state is rebuilt
+dd if=/dev/zero of=incremental_state/merged.bin bs=1 seek=20 count=16 conv=notrunc
+$COVER $LCOV_TOOL $LCOV_OPTS --branch -o inc_9.info -a inc_p1.info --incremental-state incremental_state 2>&1 | tee inc_9.log
+grep -q 'merged data is missing or out of date' inc_9.log
+if [ 0 != $? ] ; then
+    echo "Error:  expected modified data to be detected"
+    exit 1
+fi
+LCOV_OPTS="$LCOV_OPTS --branch" check inc_9.info inc_p1.info inc_p3.info inc_full.info
+
+# unreadable manifest:  we don't know what was merged before - so error,
+#  unless the user wants to start over
+echo garbage > incremental_state/manifest
+$COVER $LCOV_TOOL $LCOV_OPTS --branch -o inc_10.info -a inc_p1.info --incremental-state incremental_state 2>&1 | tee inc_10.log
+if [ 0 == ${PIPESTATUS[0]} ] ; then
+    echo "Error:  expected error from corrupt manifest"
+    exit 1
+fi
+grep -q 'unreadable incremental state manifest' inc_10.log
+if [ 0 != $? ] ; then
+    echo "Error:  expected corrupt manifest message"
+    exit 1
+fi
+$COVER $LCOV_TOOL $LCOV_OPTS --branch -o inc_10.info -a inc_p1.info --incremental-state incremental_state --ignore corrupt
+if [ 0 != $? ] ; then
+    echo "Error:  lcov --incremental-state --ignore corrupt failed"
+    exit 1
+fi
+LCOV_OPTS="$LCOV_OPTS --branch" check inc_10.info inc_p1.info
+
+echo "Tests passed"
+
+if [ "x$COVER" != "x" ] && [ 0 != $LOCAL_COVERAGE ] ; then
+    cover
+fi
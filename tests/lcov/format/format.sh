@@ -14,7 +14,7 @@ if [ "${VER[0]}" -lt 5 ] ; then
     FILTER='--filter branch'
 fi
 
-rm -rf *.gcda *.gcno a.out out.info out2.info *.txt* *.json dumper* testRC *.gcov *.gcov.* *.log
+rm -rf *.gcda *.gcno a.out out.info out2.info out.bin out3.info incons.* *.txt* *.json dumper* testRC *.gcov *.gcov.* *.log
 
 clean_cover
 
@@ -159,6 +159,81 @@ if [ $COUNT -lt 3 ] ; then
     fi
 fi
 
+# binary tracefile format:  round trip and summary must match the text data
+$COVER $LCOV_TOOL $LCOV_OPTS -o out.bin -a out.info --tracefile-format binary
+if [ 0 != $? ] ; then
+    echo "Error:  unexpected error from lcov --tracefile-format binary"
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+$COVER $LCOV_TOOL $LCOV_OPTS -o out3.info -a out.bin
+if [ 0 != $? ] ; then
+    echo "Error:  unexpected error reading binary tracefile"
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+diff out.info out3.info
+if [ 0 != $? ] ; then
+    echo "Error: binary round trip mismatch"
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+$COVER $LCOV_TOOL $LCOV_OPTS --summary out.info > summary_info.txt
+$COVER $LCOV_TOOL $LCOV_OPTS --summary out.bin > summary_bin.txt
+diff <(grep -v Reading summary_info.txt) <(grep -v Reading summary_bin.txt)
+if [ 0 != $? ] ; then
+    echo "Error: binary summary mismatch"
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+
+# inconsistent data in binary format is checked and fixed as it is for
+#  the text format - also when the summary could be taken from the index
+cat > incons.info <<EOF
+TN:
+SF:/tmp/incons.c
+FN:1,3,foo
+FNDA:0,foo
+FNF:1
+FNH:0
+BRDA:1,0,0,1
+BRDA:1,0,1,0
+BRF:2
+BRH:1
+DA:1,1
+DA:2,1
+LF:2
+LH:2
+end_of_record
+EOF
+$COVER $LCOV_TOOL $LCOV_OPTS -o incons.bin -a incons.info --tracefile-format binary --rc check_data_consistency=0
+if [ 0 != $? ] ; then
+    echo "Error:  unexpected error writing inconsistent binary tracefile"
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+$COVER $LCOV_TOOL $LCOV_OPTS --summary incons.info --ignore inconsistent > incons.info.txt 2>&1
+$COVER $LCOV_TOOL $LCOV_OPTS --summary incons.bin --ignore inconsistent > incons.bin.txt 2>&1
+grep -q 'inconsistent: 1' incons.bin.txt
+if [ 0 != $? ] ; then
+    echo "Error: no consistency check of binary data"
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+diff <(grep -v -e Reading -e WARNING -e 'use "lcov' incons.info.txt) \
+     <(grep -v -e Reading -e WARNING -e 'use "lcov' incons.bin.txt)
+if [ 0 != $? ] ; then
+    echo "Error: inconsistent binary summary mismatch"
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
 
 echo "Tests passed"
 
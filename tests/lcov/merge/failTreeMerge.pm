@@ -0,0 +1,21 @@
+#!/usr/bin/env perl
+
+# Loaded via PERL5OPT ('-MfailTreeMerge'):  every child which merges
+#  the results of two aggregate segments fails to send its state update to
+#  the parent - after it saved its merged data.  Used to test that the
+#  parent recovers the data of both inputs when such a merge fails.
+
+package failTreeMerge;
+
+use strict;
+
+INIT {
+    no warnings 'redefine';
+    my $send = \&lcovutil::send_result;
+    *lcovutil::send_result = sub {
+        return 0 if $lcovutil::jobLabel =~ /^tree_merge_/;
+        return $send->(@_);
+    };
+}
+
+1;
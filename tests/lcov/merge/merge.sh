@@ -5,7 +5,7 @@ set +x
 
 source ../../common.tst
 
-rm -f *.txt* *.json dumper* intersect*.info gen.info func.info inconsistent.info diff* *.log
+rm -f *.txt* *.json dumper* intersect*.info gen.info func.info inconsistent.info diff* *.log concat*.info external*.info packed*.info treefail*
 rm -rf cover_db
 
 clean_cover
@@ -182,6 +182,143 @@ if [ 0 != $? ] ; then
     fi
 fi
 
+# a single tracefile read in parallel segments must give the same result
+#  as reading it serially - including source files which appear in more
+#  than one segment, with or without MC/DC data
+cat a.info b.info a.info > concat.info
+cat b.info a.info b.info > concat_dup.info
+for opts in '--branch' '--branch --mcdc' ; do
+    for input in concat concat_dup ; do
+        $COVER $LCOV_TOOL $opts $PROFILE -o ${input}_serial.info -a $input.info --ignore inconsistent --parallel 1
+        if [ 0 != $? ] ; then
+            echo "Error:  unexpected error code from serial read of $input ($opts)"
+            status=1
+            if [ $KEEP_GOING == 0 ] ; then
+                exit 1
+            fi
+        fi
+        $COVER $LCOV_TOOL $opts $PROFILE -o ${input}_split.info -a $input.info --ignore inconsistent --parallel 3 --rc info_split_size=1
+        if [ 0 != $? ] ; then
+            echo "Error:  unexpected error code from parallel read of $input ($opts)"
+            status=1
+            if [ $KEEP_GOING == 0 ] ; then
+                exit 1
+            fi
+        fi
+        diff ${input}_serial.info ${input}_split.info
+        if [ 0 != $? ] ; then
+            echo "Error:  parallel read of $input differs from serial read ($opts)"
+            status=1
+            if [ $KEEP_GOING == 0 ] ; then
+                exit 1
+            fi
+        fi
+    done
+done
+
+# a child which merges two aggregate segments fails - and the error is
+#  ignored:  the parent merges both inputs itself, so no data is lost
+$COVER $LCOV_TOOL $LCOV_OPTS -o treefail_serial.info -a a.info -a b.info -a a.info -a b.info --ignore inconsistent --parallel 1
+if [ 0 != $? ] ; then
+    echo "Error:  unexpected error code from serial merge"
+    status=1
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+PERL5OPT="-I. -MfailTreeMerge" LCOV_FORCE_PARALLEL=1 $COVER $LCOV_TOOL $LCOV_OPTS -o treefail.info -a a.info -a b.info -a a.info -a b.info --ignore inconsistent,parallel,child --parallel 2 2>&1 | tee treefail.log
+if [ 0 != ${PIPESTATUS[0]} ] ; then
+    echo "Error:  unexpected error code from merge with failed children"
+    status=1
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+grep -q "WARNING: (child) aggregate: 'while processing segment" treefail.log
+if [ 0 != $? ] ; then
+    echo "Error:  expected tree merge child to fail"
+    status=1
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+diff treefail_serial.info treefail.info
+if [ 0 != $? ] ; then
+    echo "Error:  data lost when tree merge child failed"
+    status=1
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+
+# out-of-core merge:  same result and same effective tracefiles as the
+#  in-memory merge - with a budget small enough to need several groups
+#  of buckets
+$COVER $LCOV_TOOL $LCOV_OPTS -o external_mem.info -a a.info -a b.info -a concat.info --ignore inconsistent
+if [ 0 != $? ] ; then
+    echo "Error:  unexpected error code from in-memory merge"
+    status=1
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+$COVER $LCOV_TOOL $LCOV_OPTS -o external_disk.info -a a.info -a b.info -a concat.info --ignore inconsistent --rc merge_memory_budget=1 --rc merge_buckets=16
+if [ 0 != $? ] ; then
+    echo "Error:  unexpected error code from external merge"
+    status=1
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+diff external_mem.info external_disk.info
+if [ 0 != $? ] ; then
+    echo "Error:  external merge differs from in-memory merge"
+    status=1
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+$COVER $LCOV_TOOL $LCOV_OPTS -o prune_mem.txt -a a.info -a b.info -a a.info --prune --ignore inconsistent
+$COVER $LCOV_TOOL $LCOV_OPTS -o prune_disk.txt -a a.info -a b.info -a a.info --prune --ignore inconsistent --rc merge_memory_budget=1
+diff prune_mem.txt prune_disk.txt
+if [ 0 != $? ] ; then
+    echo "Error:  external merge found different effective tracefiles"
+    status=1
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+
+# packed line count storage:  same results as the default
+for op in intersect subtract ; do
+    $COVER $LCOV_TOOL $LCOV_OPTS -o packed_$op.info a.info --$op b.info --ignore inconsistent --rc count_data_format=packed
+    if [ 0 != $? ] ; then
+        echo "Error:  unexpected error code from packed $op"
+        status=1
+        if [ $KEEP_GOING == 0 ] ; then
+            exit 1
+        fi
+    fi
+done
+$COVER $LCOV_TOOL $LCOV_OPTS -o packed_merge.info -a a.info -a b.info -a concat.info --ignore inconsistent --rc count_data_format=packed
+if [ 0 != $? ] ; then
+    echo "Error:  unexpected error code from packed merge"
+    status=1
+    if [ $KEEP_GOING == 0 ] ; then
+        exit 1
+    fi
+fi
+for d in 'intersect.gold packed_intersect.info' 'a_subtract_b.gold packed_subtract.info' 'external_mem.info packed_merge.info' ; do
+    diff $d
+    if [ 0 != $? ] ; then
+        echo "Error:  packed count data differs: $d"
+        status=1
+        if [ $KEEP_GOING == 0 ] ; then
+            exit 1
+        fi
+    fi
+done
+
 if [ 0 == $status ] ; then
     echo "Tests passed"
 else
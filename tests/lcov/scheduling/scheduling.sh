@@ -23,6 +23,7 @@ source ../../common.tst
 
 rm -rf *.gcda *.gcno a.out *.info* *.txt* *.json *.log rpt* prof* ghist* \
     agg* geninfo_prof.json *.xlsx nomem* untooled* bad* cover_db.dat \
+    csv_tables tsv_tables csv_stats csv_empty \
     html_report __pycache__
 
 clean_cover
@@ -320,6 +321,9 @@ fi
 check_memory agg_prof.json filter filt_child .filt_child
 check_memory agg_prof.json aggregate 'group total' \
     '(with_entries(select(.key | test("^[0-9]+$"))))'
+# the children which merge the results of aggregate groups:
+#  memory{tree_merge_N} vs tree_merge{N}
+check_memory agg_prof.json tree_merge tree_merge .tree_merge
 
 # Both phases must be present simultaneously in that one profile:  under the
 # earlier pid keying they were indistinguishable, and under a flat numeric
@@ -372,6 +376,37 @@ else
 fi
 check_memory nested_prof.json filter filt_child .filt_child
 
+#-----------------------------------------------------------------------
+# 9b. children return their results through the dump file rather than a
+#     pipe ('result_transport = file' - also the fallback if no pipe can be
+#     created):  same result as the pipe transport, for the lcov tree merge
+#     and filter workers and for genhtml segments.
+#-----------------------------------------------------------------------
+LCOV_FORCE_PARALLEL=1 $COVER $LCOV_TOOL -a cov.info -a cov.info \
+    -o agg_file.info --parallel 4 --filter branch,line \
+    --rc result_transport=file --ignore empty,inconsistent 2>&1 \
+    | tee agg_file.log
+if [ 0 != ${PIPESTATUS[0]} ] ; then
+    echo "aggregate with file transport failed"
+    exit 1
+fi
+if ! diff agg.info agg_file.info ; then
+    echo "aggregate with file transport differs"
+    STATUS=1
+fi
+$COVER $GENHTML_TOOL cov.info -o rpt_file --parallel 4 \
+    --rc result_transport=file --ignore empty,inconsistent 2>&1 \
+    | tee genhtml_file.log
+if [ 0 != ${PIPESTATUS[0]} ] || [ ! -f rpt_file/index.html ] ; then
+    echo "genhtml with file transport failed"
+    exit 1
+fi
+if ! diff <(grep -E '^ +[a-z]+\.+:' genhtml_size.log) \
+          <(grep -E '^ +[a-z]+\.+:' genhtml_file.log) ; then
+    echo "genhtml with file transport differs"
+    STATUS=1
+fi
+
 #-----------------------------------------------------------------------
 # 10. the same per-job memory data in the generated spreadsheet:  the
 #     per-job sections must carry peakVM then peakRSS in the columns just
@@ -523,6 +558,122 @@ EOF
     done
 fi
 
+# text export and profile comparison do not need xlsxwriter
+if [ ! -f geninfo_prof.json ] || [ ! -f prof.json ] ; then
+    echo "skipping spreadsheet text export:  no profile data"
+else
+    echo $SPREADSHEET_TOOL --format csv -o csv_tables geninfo_prof.json prof.json
+    eval ${PYCOVER} $SPREADSHEET_TOOL --format csv -o csv_tables \
+        geninfo_prof.json prof.json
+    if [ 0 != $? ] || [ ! -f csv_tables/geninfo_prof.summary.csv ] ||
+       [ ! -f csv_tables/prof.summary.csv ] ; then
+        fail_memory spreadsheet "csv export failed"
+    elif ! grep -E '^tool,geninfo' csv_tables/geninfo_prof.summary.csv ; then
+        fail_memory spreadsheet "csv summary does not identify the tool"
+    fi
+    eval ${PYCOVER} $SPREADSHEET_TOOL --format tsv -o tsv_tables prof.json
+    if [ 0 != $? ] || ! grep -P '^key\tvalue' tsv_tables/prof.summary.tsv ; then
+        fail_memory spreadsheet "tsv export failed"
+    fi
+
+    echo $SPREADSHEET_TOOL --compare prof.json prof.json
+    eval ${PYCOVER} $SPREADSHEET_TOOL --compare prof.json prof.json \
+        2>&1 | tee compare.log
+    if [ 0 != ${PIPESTATUS[0]} ] || ! grep -E '^total ' compare.log ; then
+        fail_memory spreadsheet "profile comparison failed"
+    fi
+    # nothing changed - so nothing can have regressed
+    if grep 'top regressions' compare.log ; then
+        fail_memory spreadsheet "regressions reported comparing profile to itself"
+    fi
+
+    # streaming statistics must agree with the table export
+    echo $SPREADSHEET_TOOL --stats --format csv -o csv_stats geninfo_prof.json
+    eval ${PYCOVER} $SPREADSHEET_TOOL --stats --top 3 --format csv \
+        -o csv_stats geninfo_prof.json
+    if [ 0 != $? ] || [ ! -f csv_stats/geninfo_prof.stats.csv ] ||
+       [ ! -f csv_stats/geninfo_prof.top.csv ] ; then
+        fail_memory spreadsheet "streaming statistics failed"
+    elif ! diff csv_tables/geninfo_prof.summary.csv \
+            csv_stats/geninfo_prof.summary.csv ; then
+        fail_memory spreadsheet "streaming summary differs from table export"
+    fi
+
+    # empty objects and arrays - inside arrays and objects - in the profile
+    cat > empty_prof.json <<EOF
+{"config": {"tool": "lcov", "cmdLine": "lcov -a x", "extra": {}},
+ "total": 3.5, "none": [],
+ "emit": [{}, 5, 6, []],
+ "parse": {"x": {}, "a.c": 2, "e": [], "b.c": 3}}
+EOF
+    eval ${PYCOVER} $SPREADSHEET_TOOL --stats --format csv \
+        -o csv_empty empty_prof.json
+    if [ 0 != $? ] ; then
+        fail_memory spreadsheet "streaming statistics of empty containers failed"
+    elif ! diff --strip-trailing-cr - csv_empty/empty_prof.stats.csv <<EOF
+key,count,total,max,avg,stddev
+emit,2,11.000000,6,5.500000,0.707107
+parse,2,5.000000,3,2.500000,0.707107
+EOF
+    then
+        fail_memory spreadsheet "wrong statistics after empty containers"
+    fi
+
+    echo $SPREADSHEET_TOOL --critical-path geninfo_prof.json prof.json
+    eval ${PYCOVER} $SPREADSHEET_TOOL --critical-path --predict 1,8 \
+        geninfo_prof.json prof.json 2>&1 | tee critical.log
+    if [ 0 != ${PIPESTATUS[0]} ] ; then
+        fail_memory spreadsheet "critical path analysis failed"
+    fi
+    # both profiles were collected with --parallel 4
+    for phase in capture html ; do
+        if ! grep -E "phase $phase: [0-9]+ jobs" critical.log ; then
+            fail_memory spreadsheet "no critical path data for $phase phase"
+        fi
+    done
+    # a tree merge job starts only once both its inputs are done:  with
+    #   unlimited workers, four 1s segments need 3s - segment, merge, merge
+    cat > tree_prof.json <<EOF
+{"config": {"tool": "lcov", "maxParallel": 4}, "total": 5,
+ "0": {"total": 1, "undump": 0}, "1": {"total": 1, "undump": 0},
+ "2": {"total": 1, "undump": 0}, "3": {"total": 1, "undump": 0},
+ "tree_merge": {"0": 1, "1": 1, "2": 1},
+ "tree_merge_inputs": {"0": ["aggregate_0", "aggregate_1"],
+                       "1": ["aggregate_2", "aggregate_3"],
+                       "2": ["tree_merge_0", "tree_merge_1"]}}
+EOF
+    eval ${PYCOVER} $SPREADSHEET_TOOL --critical-path --predict 2 \
+        tree_prof.json 2>&1 | tee tree_critical.log
+    if [ 0 != ${PIPESTATUS[0]} ] ; then
+        fail_memory spreadsheet "tree merge critical path analysis failed"
+    fi
+    if ! grep -E 'critical path \(unlimited workers\) +3.00s$' tree_critical.log ||
+       ! grep -E '^ +2 +5.50s +7.00s$' tree_critical.log ; then
+        fail_memory spreadsheet "tree merge dependencies not modeled"
+    fi
+    # lcov records the inputs of each of its tree merge jobs
+    if [ `jq -r '.tree_merge | length' agg_prof.json` != \
+         `jq -r '.tree_merge_inputs | length' agg_prof.json` ] ; then
+        fail_memory spreadsheet "tree merge inputs not recorded"
+    fi
+    eval ${PYCOVER} $SPREADSHEET_TOOL --critical-path agg_prof.json 2>&1 \
+        | tee agg_critical.log
+    if [ 0 != ${PIPESTATUS[0]} ] ||
+       ! grep -E "phase aggregate: [0-9]+ jobs" agg_critical.log ||
+       grep -q 'not recorded' agg_critical.log ; then
+        fail_memory spreadsheet "no critical path data for aggregate phase"
+    fi
+    # there is no schedule with fewer than one worker:  usage error
+    for predict in 0 2,x ; do
+        eval ${PYCOVER} $SPREADSHEET_TOOL --critical-path --predict $predict \
+            geninfo_prof.json 2>&1 | tee predict.log
+        if [ 2 != ${PIPESTATUS[0]} ] ||
+           ! grep -q "argument --predict: values must be integers >= 1: '$predict'" predict.log ; then
+            fail_memory spreadsheet "expected --predict $predict to be rejected"
+        fi
+    done
+fi
+
 if [ 0 == $STATUS ] ; then
     echo "Tests passed"
 else
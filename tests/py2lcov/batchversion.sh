@@ -0,0 +1,14 @@
+#!/bin/bash
+# '--version-script' callback in batch mode:  read one pathname per line from
+#  stdin and write its version on one line.
+# Log our start and exit, so the test can check how many co-processes were
+#  started - and that each one was shut down.
+LOG=batchversion.log
+echo "start $$" >> $LOG
+while read path ; do
+    echo "v_`basename $path`"
+done
+# take a moment to shut down:  a caller which does not wait for us to exit
+#  will be done before we log it
+sleep 1
+echo "exit $$" >> $LOG
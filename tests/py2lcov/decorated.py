@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import functools
+
+
+def trace(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+    return wrapper
+
+
+class A:
+
+    @trace
+    def used(self, x):
+        return x + 1
+
+    @staticmethod
+    @trace
+    def unused(x):
+        return x - 1
+
+    def multiline(self,
+                  x,
+                  y):
+        return x + y
+
+
+def unusedMultiline(a,
+                    b):
+    return a * b
+
+
+if __name__ == '__main__':
+    print(A().used(1))
@@ -9,7 +9,7 @@ fi
 
 source ../common.tst
 
-rm -rf *.xml* *.dat *.info *.json __pycache__ help.txt *.pyc my_cache rpt1 rpt2
+rm -rf *.xml* *.dat *.info *.json __pycache__ help.txt *.pyc my_cache my_fragments bad_fragments *.log rpt1 rpt2
 
 clean_cover
 
@@ -113,6 +113,27 @@ for d in \
     fi
 done
 
+if [ 1 != "$IS_P4" ] && [ 1 == "$IS_GIT" ] ; then
+    # use a single version-script process for all the files - and save
+    #  the result for the next run.  Result should be identical.
+    for run in 1 2 ; do
+        eval COVERAGE_COMMAND=$CMD ${PYCOVER} ${PY2LCOV_TOOL} -o batch$run.info --cmd $CMD functions.dat ${VERSION},--batch --version-cache versions.json
+        if [ 0 != $? ] ; then
+            echo "py2lcov failed batch version example"
+            if [ 0 == $KEEP_GOING ] ; then
+                exit 1
+            fi
+        fi
+        diff functions.info batch$run.info
+        if [ 0 != $? ] ; then
+            echo "batch version $run failed"
+            if [ 0 == $KEEP_GOING ] ; then
+                exit 1
+            fi
+        fi
+    done
+fi
+
 # should be valid data to generate HTML
 $GENHTML_TOOL -o rpt1 $VERSION $ANNOTATE functions.info --validate
 if [ 0 != $? ] ; then
@@ -138,14 +159,237 @@ if [ 0 != $? ] ; then
     fi
 fi
 
+# translate data file via XML
+eval COVERAGE_COMMAND=$CMD ${PYCOVER} ${PY2LCOV_TOOL} -o functions3.info --cmd $CMD functions.dat $VERSION --use-xml
+if [ 0 != $? ] ; then
+    echo "py2lcov --use-xml failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+
 # result should be identical:
-diff functions.info functions2.info
+diff functions3.info functions2.info
+if [ 0 != $? ] ; then
+    echo "XML vs --use-xml failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+
+# direct read knows which branches were taken - but otherwise,
+#  result should be identical:
+diff <(grep -v BRDA: functions.info) <(grep -v BRDA: functions2.info)
 if [ 0 != $? ] ; then
     echo "XML vs direct failed"
     if [ 0 == $KEEP_GOING ] ; then
         exit 1
     fi
 fi
+# same branches - only the taken counts may differ
+diff <(grep BRDA: functions.info | cut -d, -f1-3) \
+     <(grep BRDA: functions2.info | cut -d, -f1-3)
+if [ 0 != $? ] ; then
+    echo "XML vs direct branches failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+# the 'if' in each file is entered but never skipped
+diff <(grep -E '^(SF|BRDA):' functions.info | sed -e 's#^SF:.*/#SF:#') - <<EOF
+SF:localmodule.py
+BRDA:6,0,0,0
+BRDA:6,0,1,1
+SF:test.py
+BRDA:21,0,0,0
+BRDA:21,0,1,1
+EOF
+if [ 0 != $? ] ; then
+    echo "direct read branch counts failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+
+# legacy indentation-based function derivation agrees with AST-based
+#  derivation for our (undecorated) testcase
+eval ${PYCOVER} ${PY2LCOV_TOOL} -i functions.xml -o indent.info $VERSION --function-parser indent
+if [ 0 != $? ] ; then
+    echo "py2lcov --function-parser indent failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+diff indent.info functions2.info
+if [ 0 != $? ] ; then
+    echo "AST vs indent function derivation failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+
+# decorated functions and multi-line signatures:  the parsers differ in
+#  where the function starts (decorator vs. 'def' line) - but the
+#  declaration lines of an unused function must be 'not hit' in both, so
+#  that the data is consistent
+COVERAGE_FILE=./decorated.dat $CMD run --branch ./decorated.py
+if [ 0 != $? ] ; then
+    echo "coverage decorated failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+COVERAGE_FILE=./decorated.dat $CMD xml -o decorated.xml
+for parser in ast indent ; do
+    eval ${PYCOVER} ${PY2LCOV_TOOL} -o decorated_$parser.info decorated.xml $VERSION --function-parser $parser
+    if [ 0 != $? ] ; then
+        echo "py2lcov decorated --function-parser $parser failed"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+    $COVER $LCOV_TOOL $LCOV_OPTS -o decorated_${parser}_merged.info -a decorated_$parser.info
+    if [ 0 != $? ] ; then
+        echo "lcov -a decorated $parser failed"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+done
+# 'A::unused': decorators, 'def' and body not hit; 'unusedMultiline'
+#  starts at its (multi-line) 'def'
+for expect in FNL:3,19,22 FNA:3,0,A::unused DA:19,0 DA:20,0 DA:21,0 \
+              FNL:5,30,32 FNA:5,0,unusedMultiline DA:30,0 ; do
+    grep -q "^$expect\$" decorated_ast.info
+    if [ 0 != $? ] ; then
+        echo "expected '$expect' in decorated_ast.info"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+done
+
+# one merged record per source file - should be the same as lcov merge
+eval ${PYCOVER} ${PY2LCOV_TOOL} -o aggregate_x2.info $VERSION --aggregate functions.xml functions.xml
+if [ 0 != $? ] ; then
+    echo "py2lcov --aggregate failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+eval ${PYCOVER} ${PY2LCOV_TOOL} -o separate_x2.info $VERSION functions.xml functions.xml
+if [ 0 != $? ] ; then
+    echo "py2lcov separate failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+COUNT=`grep -c SF: aggregate_x2.info`
+COUNT2=`grep -c SF: functions2.info`
+if [ "$COUNT" != "$COUNT2" ] ; then
+    echo "expected $COUNT2 records in aggregate - found $COUNT"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+$COVER $LCOV_TOOL $LCOV_OPTS -o merged_aggregate.info -a aggregate_x2.info $VERSION
+$COVER $LCOV_TOOL $LCOV_OPTS -o merged_separate.info -a separate_x2.info $VERSION
+diff merged_aggregate.info merged_separate.info
+if [ 0 != $? ] ; then
+    echo "--aggregate vs lcov merge failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+
+# incremental translation:  second run reuses cached result.  Both should
+#  be identical to translation without the cache
+for run in 1 2 ; do
+    eval COVERAGE_COMMAND=$CMD ${PYCOVER} ${PY2LCOV_TOOL} -o cached$run.info --cmd $CMD --cache-dir my_fragments functions.dat $VERSION --verbose 2>&1 | tee cached$run.log
+    if [ 0 != ${PIPESTATUS[0]} ] ; then
+        echo "py2lcov --cache-dir run $run failed"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+    grep -q 'reusing cached translation of functions.dat' cached$run.log
+    if [ 0 == $? ] ; then
+        REUSED=2
+    else
+        REUSED=1
+    fi
+    if [ $run != $REUSED ] ; then
+        echo "cached run $run: unexpected cache use"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+    diff functions.info cached$run.info
+    if [ 0 != $? ] ; then
+        echo "cached run $run differs"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+done
+if [ ! -f my_fragments/manifest.json ] ; then
+    echo "did not create cache manifest"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+
+# a translation which reported (ignored) errors is not cached:  the error
+#  is seen again in the next run
+head -c 200 functions.xml > truncated.xml
+for run in 1 2 ; do
+    eval ${PYCOVER} ${PY2LCOV_TOOL} -o truncated$run.info --cache-dir bad_fragments truncated.xml --keep-going --verbose $VERSION 2>&1 | tee truncated$run.log
+    if [ 0 != ${PIPESTATUS[0]} ] ; then
+        echo "py2lcov --keep-going run $run failed"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+    if ! grep -q 'Error: parse xml fail' truncated$run.log ||
+       grep -q 'reusing cached translation' truncated$run.log ; then
+        echo "translation with errors was cached"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+done
+
+# the batch version callback protocol:  one co-process answers all of the
+#  queries of a serial run - and every co-process, including those of the
+#  parallel workers, has been shut down by the time py2lcov exits
+for parallel in 1 2 ; do
+    rm -f batchversion.log
+    eval ${PYCOVER} ${PY2LCOV_TOOL} -o batchproto$parallel.info --parallel $parallel --version-script ./batchversion.sh,--batch functions.xml functions.xml
+    if [ 0 != $? ] ; then
+        echo "py2lcov batch callback --parallel $parallel failed"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+    STARTED=`grep -c '^start' batchversion.log`
+    EXITED=`grep -c '^exit' batchversion.log`
+    if [ "$STARTED" != "$EXITED" ] ||
+       ( [ 1 == $parallel ] && [ "$STARTED" != 1 ] ) ; then
+        echo "--parallel $parallel: started $STARTED callbacks, $EXITED exited"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+    # each record carries the version the callback returned for its file
+    COUNT=`grep -c '^SF:' batchproto$parallel.info`
+    VERS=`grep -c '^VER:v_[^/]*$' batchproto$parallel.info`
+    if [ 0 == "$COUNT" ] || [ "$COUNT" != "$VERS" ] ; then
+        echo "--parallel $parallel: $VERS versions for $COUNT records"
+        if [ 0 == $KEEP_GOING ] ; then
+            exit 1
+        fi
+    fi
+done
 
 # run again, generating checksum data...
 eval ${PYCOVER} ${PY2LCOV_TOOL} --cmd $CMD -o checksum.info functions.dat $VERSION --checksum
@@ -8,7 +8,7 @@ if [[ "x" == ${LCOV_HOME}x ]] ; then
 fi
 source ../common.tst
 
-rm -rf *.info *.json __pycache__ help.txt *.pyc *.dat
+rm -rf *.info *.info.gz *.json __pycache__ help.txt *.pyc *.dat truncated.xml
 
 clean_cover
 
@@ -64,6 +64,46 @@ if [ 0 != $? ] ; then
     fi
 fi
 
+# translate several inputs - serially and in parallel.  Result should be
+#  identical
+eval ${PYCOVER} ${XML2LCOV_TOOL} -o serial.info coverage.xml coverage.xml coverage.xml
+if [ 0 != $? ] ; then
+    echo "xml2lcov serial failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+eval ${PYCOVER} ${XML2LCOV_TOOL} -o parallel.info --parallel 3 coverage.xml coverage.xml coverage.xml
+if [ 0 != $? ] ; then
+    echo "xml2lcov parallel failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+diff serial.info parallel.info
+if [ 0 != $? ] ; then
+    echo "serial vs parallel failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+
+# compressed output
+eval ${PYCOVER} ${XML2LCOV_TOOL} -o compressed.info.gz --parallel 3 coverage.xml coverage.xml coverage.xml
+if [ 0 != $? ] ; then
+    echo "xml2lcov compressed failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+diff serial.info <(gunzip -c compressed.info.gz)
+if [ 0 != $? ] ; then
+    echo "plain vs compressed failed"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+
 # version check should fail - because we have no source
 eval ${PYCOVER} ${XML2LCOV_TOOL} -o noSource.info coverage.xml $VERSION
 if [ 0 == $? ] ; then
@@ -137,6 +177,32 @@ if [ 0 == $? ] ; then
     fi
 fi
 
+# malformed input:  XML is parsed incrementally, so error is seen part way
+#  through the file
+head -c 20000 coverage.xml > truncated.xml
+eval ${PYCOVER} ${XML2LCOV_TOOL} -o truncated.info truncated.xml
+if [ 0 == $? ] ; then
+    echo "did not see error with truncated input file"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+# ... but can continue with what we read so far
+eval ${PYCOVER} ${XML2LCOV_TOOL} -o truncated.info truncated.xml --keep-going
+if [ 0 != $? ] ; then
+    echo "did not ignore error with truncated input file"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+grep -E '^SF:' truncated.info
+if [ 0 != $? ] ; then
+    echo "no data from truncated input file"
+    if [ 0 == $KEEP_GOING ] ; then
+        exit 1
+    fi
+fi
+
 # usage error:
 eval ${PYCOVER} ${XML2LCOV_TOOL} -o badArg.info --noSuchParam coverage.xml
 if [ 0 == $? ] ; then